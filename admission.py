@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Admission control — so an overloaded server slows down predictably rather than falling over.
+
+  TokenBucket  per-connection message rate: clicks are cheap, free text (which may
+               reach the LLM) costs several tokens; refused messages get one notice
+  WorkLimit    bound on free-text messages holding LLM work at once, one per chat;
+               past it a message is shed (answered as if Ollama were down) instead
+               of queued, and chats that keep dropping their own questions don't
+               get the last few places
+
+Cancelling superseded or abandoned replies and bounding send buffers happen
+in run.py's chat handler.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """`rate` tokens a second, holding at most `burst`; `take(cost)` spends them or refuses."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "clock")
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.stamp = clock()
+
+    def take(self, cost=1.0):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+class WorkLimit:
+    """At most `limit` jobs at once and one per key; `try_enter` refuses the rest rather than queue them.
+
+    The last `reserve` places are kept from keys that abandoned a job (`leave(key, abandoned=True)`)
+    in the past `window` seconds. A flooding chat supersedes its own questions, so it can't hold
+    every place and shed the operator who asks now and then and waits for the answer.
+    """
+
+    def __init__(self, limit, reserve=None, window=30.0, clock=time.monotonic):
+        self.limit = limit
+        self.reserve = max(1, limit // 4) if reserve is None else reserve
+        self.window = window
+        self.clock = clock
+        self.active = 0
+        self._held = set()        # keys holding a job
+        self._abandoned = {}      # key -> when it last abandoned a job, oldest first
+        self._lock = threading.Lock()
+
+    def try_enter(self, key=None):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            if key is not None:
+                if key in self._held:
+                    return False
+                if self.active >= self.limit - self.reserve and key in self._abandoned:
+                    if self.clock() - self._abandoned[key] < self.window:
+                        return False
+                self._held.add(key)
+            self.active += 1
+            return True
+
+    def leave(self, key=None, abandoned=False):
+        with self._lock:
+            self.active -= 1
+            if key is None:
+                return
+            self._held.discard(key)
+            now = self.clock()
+            if abandoned:
+                self._abandoned.pop(key, None)
+                self._abandoned[key] = now
+            for old, when in list(self._abandoned.items()):
+                if now - when < self.window:
+                    break
+                del self._abandoned[old]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Alert engine — raises fleet alerts from device telemetry instead of a static list.
+
+Rules run when a device reports in (FleetStore telemetry notifications), and
+a periodic sweep flags devices that have stopped reporting. An alert is keyed
+by (device, type):
+
+  dedup        while one is unacknowledged, the rule firing again adds nothing
+  suppression  after an acknowledgement the same key stays quiet for
+               `suppress_for` seconds, so a flapping battery can't re-page
+
+Operator actions (deactivating a device) are not telemetry and raise nothing.
+With several workers, only the worker that received a report evaluates it
+(replayed reports are skipped) and only one worker runs the sweep; alerts
+reach the others through the store's operation log like any other change,
+and every worker's listeners hear about them.
+"""
+
+import asyncio
+import time
+
+# (type, severity, condition on the device record) — checked in order, all that match are raised
+RULES = (
+    ("Device Offline", "critical", lambda d: d["status"] == "Offline"),
+    ("Battery Critical", "critical", lambda d: d["status"] == "Online" and d["battery"] <= 5),
+    ("Low Battery", "warning", lambda d: d["status"] == "Online" and 5 < d["battery"] <= 20),
+    ("Maintenance Due", "info", lambda d: d["status"] == "Maintenance"),
+)
+MISSED_HEARTBEAT = ("Missed Heartbeat", "warning")
+
+
+class AlertEngine:
+    def __init__(self, store, stale_after=1800.0, suppress_for=1800.0, clock=time.monotonic):
+        self.store = store
+        self.stale_after = stale_after
+        self.suppress_for = suppress_for
+        self.clock = clock
+        self.raised = 0
+        self.suppressed = 0
+        self.listeners = []                   # listener(alert) for each new alert, raised here or by another worker
+        self.started = clock()
+        self.seen = {}                        # did -> clock() of the last report or transaction
+        self.active = {}                      # (device, type) -> alert id, unacknowledged
+        self.quiet_until = {}                 # (device, type) -> clock() before which it isn't raised again
+        self._keys = {}                       # alert id -> (device, type)
+        for aid, alert in list(store.alerts.items()):
+            self._keys[aid] = key = (alert["device"], alert["type"])
+            self.active[key] = aid
+        store.subscribe(self.on_change)
+
+    def on_change(self, kind, key, record):
+        if kind == "telemetry":
+            now = self.clock()
+            replaying = self.store.replica is not None and self.store.replica.replaying
+            for did in record:
+                self.seen[did] = now
+                if not replaying:
+                    self.evaluate(did)
+        elif kind == "last_txn":
+            now = self.clock()
+            for did in record:
+                self.seen[did] = now
+        elif kind == "alert":
+            if record is None:
+                alert_key = self._keys.pop(key, None)
+                if alert_key is not None and self.active.get(alert_key) == key:
+                    del self.active[alert_key]
+                    self.quiet_until[alert_key] = self.clock() + self.suppress_for
+            elif key not in self._keys:
+                self._keys[key] = alert_key = (record["device"], record["type"])
+                self.active[alert_key] = key
+                for listener in self.listeners:
+                    listener(record)
+
+    # ── Rules ──
+
+    def evaluate(self, did):
+        d = self.store.devices.get(did)
+        if d is None:
+            return
+        for alert_type, severity, condition in RULES:
+            if condition(d):
+                self.raise_alert(did, d, alert_type, severity)
+
+    def sweep(self):
+        """Raise Missed Heartbeat for online devices silent for `stale_after` seconds; returns how many."""
+        now = self.clock()
+        deadline = now - self.stale_after
+        alert_type, severity = MISSED_HEARTBEAT
+        seen, active, started = self.seen, self.active, self.started
+        raised = 0
+        for did in list(self.store.by_status.get("Online", ())):
+            if seen.get(did, started) < deadline and (did, alert_type) not in active:
+                raised += self.raise_alert(did, self.store.devices[did], alert_type, severity) is not None
+        return raised
+
+    def raise_alert(self, did, d, alert_type, severity):
+        """Add the alert unless an identical one is open or suppressed; returns its id or None."""
+        key = (did, alert_type)
+        with self.store.lock:  # the sweep and the feed may both be here for one device
+            if key in self.active:
+                return None
+            if self.quiet_until.get(key, 0.0) > self.clock():
+                self.suppressed += 1
+                return None
+            aid = self.store.add_alert({"type": alert_type, "device": did, "merchant": d["merchant"],
+                                        "time": time.strftime("%H:%M"), "severity": severity})
+            self.raised += 1
+        return aid
+
+    async def run_sweeps(self, interval=60.0):
+        """Sweep for missed heartbeats every `interval` seconds, off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.sweep)
+
+    def stats(self):
+        return {"raised": self.raised, "suppressed": self.suppressed, "open": len(self.store.alerts)}
@@ -0,0 +1,1139 @@
+#!/usr/bin/env python3
+"""Benchmarks for the POS bot.
+
+    python3 bench.py latency    # p99 button latency while free-text sessions hammer the LLM
+    python3 bench.py intents    # local intent classifier vs the LLM: accuracy + latency
+    python3 bench.py fleet      # menu/report handler time on a 100k-device fleet
+    python3 bench.py persist    # SQLite startup time + group-committed onboarding burst
+    python3 bench.py sessions   # soak: a million connects, session memory must stay flat
+    python3 bench.py render     # CPU per button click: cached frames vs render + json.dumps
+    python3 bench.py pages      # paginated listings at 50k devices: frame size + handler time
+    python3 bench.py static     # static file serving: bytes per page load, per-request time
+    python3 bench.py scale      # messages/sec with 1, 2, 4… worker processes (POS_WORKERS)
+    python3 bench.py dispatch   # shift-start burst against a serialized model: coalescing + batching
+    python3 bench.py prompt     # prompt tokens the model re-evaluates: old vs cache-friendly layout
+    python3 bench.py ingest     # transaction feed: NDJSON events/sec folded into the live aggregates
+    python3 bench.py history    # grouped/bucketed reports over months of columnar transaction history
+    python3 bench.py alerts     # alert engine: telemetry storm, dedup/suppression, ack and sweep cost
+    python3 bench.py wire       # bytes and CPU per interaction: JSON vs compact protocol, deflate
+    python3 bench.py stress     # thousands of concurrent form submits; store invariants must hold
+    python3 bench.py overload   # free-text flood: rate limits, LLM load shedding, cancelled answers
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import websockets
+
+from metrics import percentile
+
+
+def fmt_ms(values):
+    return " ".join(f"p{p}={percentile(values, p) * 1000:.2f}ms" for p in (50, 95, 99))
+
+
+# ── latency: button clicks vs concurrent free-text sessions ──
+
+async def _click_latencies(url, clicks):
+    samples = []
+    async with websockets.connect(url) as ws:
+        await ws.recv()  # welcome
+        for _ in range(clicks):
+            t0 = time.perf_counter()
+            await ws.send(json.dumps({"text": "📱 Devices", "button_data": "device_status"}))
+            await ws.recv()
+            samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def _chatter(url, question):
+    async with websockets.connect(url) as ws:
+        await ws.recv()
+        while True:
+            await ws.send(json.dumps({"text": question}))
+            while json.loads(await ws.recv())["type"] != "text":
+                pass
+
+
+async def bench_latency(args):
+    import run
+    from fake_ollama import FakeOllama
+    from ollama_async import AsyncOllama
+    from server import BotEngine
+
+    fake = await FakeOllama(latency=args.llm_latency, token_delay=0.01).start(port=args.ollama_port)
+    from ollama_client import health
+
+    run.bot = BotEngine(llm=AsyncOllama(f"http://127.0.0.1:{args.ollama_port}/api/generate"), llm_queue=run.LLM_QUEUE)
+    health.probe, health.up = (lambda: True), True  # the fake server is up by construction
+    run.RATE_BURST = float("inf")  # clicks back to back and chatters re-asking at once: no rate limit (see overload)
+    url = f"ws://127.0.0.1:{args.port}"
+    with contextlib.redirect_stdout(io.StringIO()):
+        ws_server = await websockets.serve(run.chat_handler, "127.0.0.1", args.port, process_request=run.serve_static)
+        idle = await _click_latencies(url, args.clicks)
+        chatters = [asyncio.create_task(_chatter(url, "compare all the cities please"))
+                    for _ in range(args.sessions)]
+        await asyncio.sleep(1)  # let every session get a request in flight
+        loaded = await _click_latencies(url, args.clicks)
+        # Don't wait for queued LLM work to drain — asyncio.run() cancels it on exit
+        for task in chatters:
+            task.cancel()
+        ws_server.close()
+        fake.close()
+    print(f"buttons idle:                      {fmt_ms(idle)}")
+    print(f"buttons + {args.sessions} free-text sessions: {fmt_ms(loaded)}")
+
+
+# ── intents: local fast-path classifier vs LLM ──
+
+# Held out from intent_classifier.SEED_EXAMPLES
+INTENT_CORPUS = [
+    ("show merchants", "MERCHANT_LIST"), ("list my merchants please", "MERCHANT_LIST"), ("which stores do we have", "MERCHANT_LIST"),
+    ("any alerts?", "ALERTS"), ("are there any alerts", "ALERTS"), ("show me warnings", "ALERTS"), ("critical alerts", "ALERTS"),
+    ("show devices", "DEVICE_LIST"), ("what is the status of my terminals", "DEVICE_LIST"), ("which terminals have low battery", "DEVICE_LIST"),
+    ("list devices", "DEVICE_LIST"), ("are any devices offline", "DEVICE_LIST"),
+    ("add a device", "DEVICE_ADD"), ("register new pos", "DEVICE_ADD"), ("i want to register a terminal", "DEVICE_ADD"),
+    ("onboard new merchant", "MERCHANT_ADD"), ("add merchant", "MERCHANT_ADD"), ("create a new store", "MERCHANT_ADD"),
+    ("show me the reports", "REPORTS"), ("today's revenue", "REPORTS"), ("transaction summary", "REPORTS"), ("sales analytics", "REPORTS"),
+    ("how is mumbai", "MUMBAI"), ("mumbai devices", "MUMBAI"), ("what about delhi", "DELHI"), ("delhi stats", "DELHI"),
+    ("bangalore status", "BANGALORE"), ("chennai numbers", "CHENNAI"),
+    ("how to reset my device", "FAQ_RESET"), ("factory reset", "FAQ_RESET"),
+    ("settlement", "FAQ_SETTLEMENT"), ("when is settlement", "FAQ_SETTLEMENT"),
+    ("paper roll", "FAQ_PAPER"), ("which paper do i need", "FAQ_PAPER"),
+    ("wifi not working", "FAQ_CONNECTIVITY"), ("network connectivity", "FAQ_CONNECTIVITY"),
+    ("help me", "HELP"), ("i have a problem", "HELP"),
+    ("menu", "MENU"), ("back to menu", "MENU"), ("home", "MENU"),
+    ("hello there", "GENERAL"), ("compare mumbai with chennai", "GENERAL"), ("which region performs best", "GENERAL"),
+    ("why is delhi worse than mumbai", "GENERAL"), ("good evening", "GENERAL"), ("what is the weather", "GENERAL"),
+    ("give me an analysis of battery trends", "GENERAL"),
+]
+
+
+def _score(classify, corpus):
+    correct, latencies, answered = 0, [], 0
+    for text, label in corpus:
+        t0 = time.perf_counter()
+        intent = classify(text)
+        latencies.append(time.perf_counter() - t0)
+        if intent is not None:
+            answered += 1
+            correct += intent == label
+    return correct, answered, latencies
+
+
+async def bench_intents(args):
+    from ollama_client import LOCAL_CONFIDENCE, is_ollama_running, llm_classify_intent
+    from intent_classifier import LocalIntentClassifier
+
+    local = LocalIntentClassifier()  # fresh instance: no labels learned from earlier LLM calls
+    n = len(INTENT_CORPUS)
+
+    def fast_path(text):
+        intent, confidence = local.classify(text)
+        return intent if confidence >= LOCAL_CONFIDENCE else None
+
+    correct, answered, lat = _score(fast_path, INTENT_CORPUS)
+    print(f"local fast path: handled {answered}/{n} ({answered / n:.0%}), "
+          f"accuracy on handled {correct / max(answered, 1):.0%}, {fmt_ms(lat)}")
+    correct, _, lat = _score(lambda text: local.classify(text)[0], INTENT_CORPUS)
+    print(f"local (forced):  accuracy {correct / n:.0%}, {fmt_ms(lat)}")
+
+    if not is_ollama_running():
+        print("LLM path:        skipped (Ollama not reachable)")
+        return
+    correct, _, lat = _score(llm_classify_intent, INTENT_CORPUS)
+    print(f"LLM only:        accuracy {correct / n:.0%}, {fmt_ms(lat)}")
+    correct, _, lat = _score(lambda text: fast_path(text) or llm_classify_intent(text), INTENT_CORPUS)
+    print(f"tiered:          accuracy {correct / n:.0%}, {fmt_ms(lat)}")
+
+
+# ── fleet: handler cost at production fleet sizes ──
+
+REGIONS = ["Mumbai", "Delhi", "Bangalore", "Chennai", "Hyderabad"]
+STATUSES = ["Online"] * 8 + ["Offline", "Maintenance"]
+MODELS = ["Verifone V240m", "PAX A920", "Ingenico Move5000", "Sunmi P2"]
+
+
+def synthetic_fleet(n_devices, n_merchants, seed=7):
+    """(devices, merchants, transactions, alerts) shaped like server.py's dummy data."""
+    rng = random.Random(seed)
+    merchants = {}
+    for i in range(1, n_merchants + 1):
+        merchants[f"MER-{i:03d}"] = {
+            "name": f"Merchant {i}", "category": rng.choice(["Restaurant", "Grocery", "Retail", "Pharmacy"]),
+            "region": rng.choice(REGIONS), "contact": f"Contact {i}", "phone": f"+91-90000-{i:05d}",
+            "devices": 0, "status": "Active", "onboarded": "2025-08-15"}
+    devices = {}
+    for i in range(n_devices):
+        mid = f"MER-{rng.randint(1, n_merchants):03d}"
+        m = merchants[mid]
+        m["devices"] += 1
+        devices[f"POS-{100000 + i}"] = {
+            "name": f"Counter {i % 50}", "merchant": m["name"], "merchant_id": mid, "region": m["region"],
+            "status": rng.choice(STATUSES), "battery": rng.randint(0, 100), "last_txn": "2026-02-24 15:32",
+            "model": rng.choice(MODELS), "fw": "v3.2.1"}
+    transactions = {r: {"count": 1000, "volume": 1400000, "avg": 1400} for r in REGIONS}
+    alerts = [{"id": f"ALT-{i:03d}", "type": "Low Battery", "device": did, "merchant": d["merchant"],
+               "time": "14:30", "severity": "warning"}
+              for i, (did, d) in enumerate(list(devices.items())[:200], 1)]
+    return devices, merchants, transactions, alerts
+
+
+def _time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def bench_fleet(args):
+    from server import BotEngine
+    from store import FleetStore
+
+    t0 = time.perf_counter()
+    store = FleetStore(*synthetic_fleet(args.devices, args.merchants))
+    bot = BotEngine(store=store)
+    print(f"{args.devices:,} devices / {args.merchants:,} merchants loaded in {time.perf_counter() - t0:.2f}s")
+    for name in ("device_status", "merchants", "reports", "region_report_Delhi", "device_detail_POS-100000"):
+        lat = _time_call(lambda: bot.process("bench", "", name), args.repeat)
+        print(f"  {name:<26} {fmt_ms(lat)}")
+
+
+# ── persist: durable store startup + write burst ──
+
+async def bench_persist(args):
+    from persistence import FleetJournal, open_store
+
+    path = os.path.join(tempfile.mkdtemp(), "fleet.db")
+    FleetJournal(path).seed(*synthetic_fleet(args.devices, args.merchants))
+    t0 = time.perf_counter()
+    store = open_store(path, seed=None)
+    print(f"startup: {len(store.devices):,} devices loaded + indexed in {time.perf_counter() - t0:.2f}s")
+
+    mids = list(store.merchants)
+    t0 = time.perf_counter()
+    for i in range(args.burst):
+        mid = mids[i % len(mids)]
+        store.add_device(f"POS-9{i:06d}", {
+            "name": "New", "merchant": store.merchants[mid]["name"], "merchant_id": mid, "region": "Delhi",
+            "status": "Online", "battery": 100, "last_txn": "—", "model": "PAX A920", "fw": "v1.0.0"})
+    handler_time = time.perf_counter() - t0
+    store.journal.flush(timeout=60)
+    total = time.perf_counter() - t0
+    print(f"burst: {args.burst:,} onboardings in {handler_time * 1000:.0f}ms (handlers), durable after "
+          f"{total * 1000:.0f}ms — {store.journal.commits} commits for {store.journal.rows_written:,} rows")
+    store.journal.close()
+
+
+# ── sessions: connect/disconnect soak ──
+
+async def bench_sessions(args):
+    from server import BotEngine
+    from sessions import SessionStore
+
+    now = [0.0]
+    sessions = SessionStore(ttl=args.ttl, max_sessions=args.max_sessions, clock=lambda: now[0])
+    bot = BotEngine(sessions=sessions)
+    rng = random.Random(7)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    for i in range(1, args.connects + 1):
+        now[0] += args.interval
+        sid = f"{i:010x}"
+        bot.process(sid, "start")
+        bot.process(sid, "", "search_device")
+        # Most clients disconnect cleanly; the rest vanish and are left to TTL / LRU
+        if rng.random() < args.clean:
+            bot.end_session(sid)
+        if i % (args.connects // 10) == 0:
+            st = sessions.stats()
+            print(f"  {i:>9,} connects  live={st['live']:>6,}  traced={(tracemalloc.get_traced_memory()[0] - base) / 1e6:6.2f}MB  "
+                  f"est={st['bytes'] / 1e6:5.2f}MB  ended={st['ended']:,} expired={st['expired']:,} evicted={st['evicted']:,}")
+    tracemalloc.stop()
+    print(f"{args.connects:,} connects in {time.perf_counter() - t0:.1f}s")
+
+
+# ── render: per-click CPU, cached frames vs rebuild + serialize ──
+
+# (button data, BotEngine handler)
+CLICKS = [
+    ("menu", "_main_menu"), ("help", "_help_menu"), ("add_merchant", "_show_merchant_form"),
+    ("add_device", "_show_device_form"), ("device_status", "_device_menu"), ("reports", "_reports_menu"),
+    ("view_all_devices", "_all_devices"), ("view_all_merchants", "_all_merchants"), ("alerts", "_show_alerts"),
+]
+
+async def bench_render(args):
+    from frames import encode
+    from server import BotEngine
+    from store import FleetStore
+
+    bot = BotEngine(store=FleetStore(*synthetic_fleet(args.devices, args.merchants)))
+    print(f"{args.devices:,} devices / {args.merchants:,} merchants — µs per click (handler + wire encoding)")
+    for name, method in CLICKS:
+        handler = getattr(type(bot), method).__wrapped__
+        uncached = _time_call(lambda: [json.dumps(m).encode() for m in handler(bot)], args.repeat)
+        cached = _time_call(lambda: [encode(m) for m in bot.process("bench", "", name)], args.repeat)
+        print(f"  {name:<20} uncached p50={percentile(uncached, 50) * 1e6:9.1f}  cached p50={percentile(cached, 50) * 1e6:7.1f}")
+
+
+# ── pages: cursor-paginated listings on a large fleet ──
+
+async def bench_pages(args):
+    from frames import encode
+    from server import BotEngine
+    from store import FleetStore
+
+    bot = BotEngine(store=FleetStore(*synthetic_fleet(args.devices, args.merchants)))
+    everything = [bot._device_card(did) for did in bot.store.devices]
+    print(f"{args.devices:,} devices — one frame with every card would be {len(encode(everything)) / 1e6:.1f}MB")
+
+    mid = bot.process("bench", "", "view_all_devices")[0]
+    for _ in range(args.devices // 2 // 20):
+        mid = bot.process("bench", "", mid["more"])[0]
+    for label, action in (("first page", "view_all_devices"), ("offline filter", "devices_page_status=Offline"),
+                          ("battery sort", "devices_page_sort=battery"),
+                          ("region + status", "devices_page_status=Offline&region=Delhi"),
+                          ("middle page (cursor)", mid["more"]), ("merchants by devices", "merchants_page_sort=devices"),
+                          ("alerts by severity", "alerts_page_sort=severity")):
+        t0 = time.perf_counter()
+        frame = encode(bot.process("bench", "", action)[0])   # first call builds the listing index
+        first = time.perf_counter() - t0
+        lat = _time_call(lambda: encode(bot.process("bench", "", action)[0]), args.repeat)
+        print(f"  {label:<22} {len(frame) / 1e3:5.1f}KB  first={first * 1000:6.1f}ms  then {fmt_ms(lat)}")
+
+
+# ── static: in-memory asset cache ──
+
+async def bench_static(args):
+    from pathlib import Path
+
+    from websockets.datastructures import Headers
+    from websockets.http11 import Request
+
+    import run
+
+    def get(path, **headers):
+        return run.serve_static(None, Request(path, Headers(headers)))
+
+    raw = (Path(run.STATIC_DIR) / "index.html").read_bytes()
+    full = get("/", **{"Accept-Encoding": "gzip, deflate, br"})
+    etag = full.headers["ETag"]
+    revalidate = get("/", **{"Accept-Encoding": "gzip, deflate, br", "If-None-Match": etag})
+    print(f"index.html: {len(raw):,}B raw → {len(full.body):,}B ({full.headers.get('Content-Encoding', 'identity')}), "
+          f"repeat visit {revalidate.status_code} with {len(revalidate.body)}B body")
+    for label, headers in (("first load", {"Accept-Encoding": "gzip, br"}),
+                           ("revalidate (304)", {"Accept-Encoding": "gzip, br", "If-None-Match": etag}),
+                           ("re-read from disk", None)):
+        if headers is None:
+            fn = lambda: (Path(run.STATIC_DIR) / "index.html").resolve().read_bytes()   # what every request used to do
+        else:
+            fn = lambda: get("/", **headers)
+        print(f"  {label:<18} {fmt_ms(_time_call(fn, args.repeat))}")
+
+
+# ── scale: multi-worker throughput ──
+
+SCALE_CLICKS = ["device_status", "merchants", "reports", "alerts", "menu", "view_all_devices", "help"]
+
+
+def _scale_client(port, conns, duration):
+    """One load-generator process: `conns` sockets clicking back-to-back; returns replies received."""
+    async def clicker(url, deadline, counts):
+        async with websockets.connect(url) as ws:
+            await ws.recv()
+            i = 0
+            while time.monotonic() < deadline:
+                await ws.send(json.dumps({"text": "", "button_data": SCALE_CLICKS[i % len(SCALE_CLICKS)]}))
+                await ws.recv()
+                counts[0] += 1
+                i += 1
+
+    async def run():
+        counts = [0]
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(clicker(f"ws://127.0.0.1:{port}", deadline, counts) for _ in range(conns)))
+        return counts[0]
+
+    return asyncio.run(run())
+
+
+async def bench_scale(args):
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    print(f"{cores} CPU core(s); {args.clients} client processes × {args.conns} sockets, {args.duration}s per run")
+    base = None
+    for workers in counts:
+        db = os.path.join(tempfile.mkdtemp(), "fleet.db")
+        # Clicks go back to back: measuring throughput, not the per-connection rate limit
+        env = dict(os.environ, POS_DB=db, POS_WORKERS=str(workers), POS_PORT=str(args.port), POS_RATE_BURST="inf")
+        proc = subprocess.Popen([sys.executable, "run.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await asyncio.sleep(args.startup)
+            with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+                replies = sum(pool.starmap(_scale_client, [(args.port, args.conns, args.duration)] * args.clients))
+        finally:
+            proc.terminate()
+            proc.wait()
+        rate = replies / args.duration
+        base = base or rate
+        print(f"  {workers:>2} worker(s): {rate:9,.0f} msgs/s  ×{rate / base:.2f}")
+    if cores < args.max_workers:
+        print(f"note: only {cores} core(s) here — scaling flattens once workers + clients exceed the cores")
+
+
+# ── dispatch: LLM request coalescing, batching and priorities ──
+
+async def _dispatch_burst(llm, fake, run, args):
+    """Everyone asks at once: distinct classifications plus answers to a few popular questions."""
+    from ollama_client import answer_cache, intent_cache
+
+    intent_cache.clear()
+    answer_cache.clear()
+    requests_before = fake.requests
+    classify_lat, answer_lat = [], []
+
+    async def classify(i):
+        t0 = time.perf_counter()
+        await llm.classify_intent(f"zq{run}x{i} vb{i}")  # gibberish: never confident locally
+        classify_lat.append(time.perf_counter() - t0)
+
+    async def answer(i):
+        t0 = time.perf_counter()
+        await llm.generate_answer(f"how are we doing {run}-{i % args.questions}", "snapshot")
+        answer_lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(answer(i) for i in range(args.answers)),
+                         *(classify(i) for i in range(args.operators)))
+    return time.perf_counter() - t0, fake.requests - requests_before, classify_lat, answer_lat
+
+
+async def bench_dispatch(args):
+    from fake_ollama import FakeOllama
+    from ollama_async import AsyncOllama
+
+    class Undispatched(AsyncOllama):
+        """The client without the dispatcher: one request per caller, one FIFO queue."""
+        async def _single_flight(self, key, start):
+            return await start()
+
+        async def _request(self, method, path, payload, timeout, priority=0):
+            return await super()._request(method, path, payload, timeout)
+
+    fake = FakeOllama(latency=args.llm_latency, parallel=args.parallel)
+    server = await fake.start(port=args.ollama_port)
+    url = f"http://127.0.0.1:{args.ollama_port}/api/generate"
+    print(f"model: {args.llm_latency * 1000:.0f}ms per request, {args.parallel} at a time; "
+          f"{args.operators} classifications + {args.answers} answers ({args.questions} distinct) at once")
+    # One slot per model lane plus the one kept for classifications: queueing happens here, where
+    # priorities apply, not inside the model server
+    slots = args.parallel + 1
+    plain = Undispatched(url, max_concurrency=slots, batch_window=0)
+    plain._gate.reserved = 0
+    dispatched = AsyncOllama(url, max_concurrency=slots)
+    for run, (label, llm) in enumerate([("without dispatcher", plain), ("with dispatcher", dispatched)]):
+        wall, sent, classify_lat, answer_lat = await _dispatch_burst(llm, fake, run, args)
+        print(f"  {label:<19} {wall:6.2f}s  {sent:3} model requests  "
+              f"classify p50={percentile(classify_lat, 50) * 1000:.0f}ms p95={percentile(classify_lat, 95) * 1000:.0f}ms  "
+              f"answer p50={percentile(answer_lat, 50) * 1000:.0f}ms")
+        await llm.close()
+    server.close()
+
+
+# ── prompt: KV-cache-friendly prompt layout ──
+
+LEGACY_ANSWER_PROMPT = """You are NexPOS AI — POS management assistant. Be concise (<100 words). Use markdown **bold** and bullet points.
+
+DATA:
+{data_snapshot}
+
+Answer from the data above. Be helpful and brief."""
+
+PROMPT_TURNS = ["how is {region} doing today", "which of those devices are offline",
+                "and which need a battery swap", "summarize that in one line"]
+
+
+def _legacy_answer_payload(message, data_snapshot, stream, context=None):
+    """The answer request as it was: data inside the system prompt, no keep_alive, no context."""
+    from ollama_client import MODEL
+
+    return {"model": MODEL, "prompt": message, "system": LEGACY_ANSWER_PROMPT.format(data_snapshot=data_snapshot),
+            "stream": stream, "options": {"temperature": 0.7, "top_p": 0.9, "num_predict": 200}}
+
+
+def _stateless_answer_payload(message, data_snapshot, stream, context=None):
+    from ollama_client import answer_payload
+
+    return answer_payload(message, data_snapshot, stream)
+
+
+PROMPT_LAYOUTS = [("old layout", _legacy_answer_payload), ("new, no context", _stateless_answer_payload),
+                  ("new + context", None)]  # None: the current payload, continuing context
+
+
+async def _prompt_run(url, snapshot, payload, args):
+    """Sessions take turns asking follow-ups; returns (prompt tokens evaluated, eval seconds, wall seconds).
+
+    Every layout is given the same data: rows are picked by the conversation so far (Conversation.focus).
+    """
+    import ollama_async
+    from ollama_client import Conversation, answer_cache
+
+    answer_cache.clear()
+    llm = ollama_async.AsyncOllama(url, batch_window=0)
+    layout, continued = ollama_async.answer_payload, Conversation.continue_context
+    ollama_async.answer_payload = payload or layout
+    Conversation.continue_context = payload is None
+    try:
+        conversations = [Conversation() for _ in range(args.sessions)]
+        t0 = time.perf_counter()
+        for turn in PROMPT_TURNS:
+            for i, conversation in enumerate(conversations):
+                question = turn.format(region=REGIONS[i % len(REGIONS)])
+                if args.classify:  # an LLM classification between answers, as for an unsure local classifier
+                    await llm.llm_classify_intent(question)
+                await llm.generate_answer(question, snapshot.render(conversation.focus(question)), conversation)
+        wall = time.perf_counter() - t0
+    finally:
+        ollama_async.answer_payload = layout
+        Conversation.continue_context = continued
+        await llm.close()
+    return llm.prompt_tokens, llm.prompt_seconds, wall
+
+
+async def bench_prompt(args):
+    from fake_ollama import FakeOllama
+    from ollama_client import KEEP_ALIVE, NUM_CTX, OLLAMA_URL, is_ollama_running
+    from snapshot import SnapshotManager
+
+    snapshot = SnapshotManager(*synthetic_fleet(args.devices, args.merchants))
+    print(f"{args.sessions} sessions × {len(PROMPT_TURNS)} follow-up turns, {args.devices:,}-device fleet"
+          f"{', LLM classification before each answer' if args.classify else ''}")
+    print(f"(new layout also sends keep_alive={KEEP_ALIVE} and num_ctx={NUM_CTX} on every request)")
+    if not args.fake and is_ollama_running():
+        for label, payload in PROMPT_LAYOUTS:
+            tokens, seconds, wall = await _prompt_run(OLLAMA_URL, snapshot, payload, args)
+            print(f"  ollama  {label:<16} {tokens:7,} prompt tokens evaluated  "
+                  f"{seconds:6.2f}s prompt eval  {wall:6.2f}s total")
+        return
+    print(f"fake model: {args.eval_delay * 1000:.1f}ms per uncached prompt token (no Ollama running, or --fake)")
+    for lanes in args.lanes:
+        for label, payload in PROMPT_LAYOUTS:
+            fake = FakeOllama(eval_delay=args.eval_delay, parallel=lanes)
+            server = await fake.start(port=args.ollama_port)
+            tokens, seconds, wall = await _prompt_run(f"http://127.0.0.1:{args.ollama_port}/api/generate",
+                                                      snapshot, payload, args)
+            server.close()
+            await server.wait_closed()
+            print(f"  {lanes} lane(s)  {label:<16} {tokens:7,} of {fake.prompt_tokens:7,} prompt tokens evaluated  "
+                  f"{seconds:6.2f}s prompt eval")
+
+
+# ── ingest: transaction feed throughput ──
+
+def _txn_feed(devices, n, seed=7):
+    """`n` NDJSON transaction lines over one business day, across random devices."""
+    rng = random.Random(seed)
+    dids = list(devices)
+    lines = []
+    for i in range(n):
+        second = 8 * 3600 + i * 14 * 3600 // n
+        lines.append(json.dumps({"device": rng.choice(dids), "amount": round(rng.uniform(20, 5000), 2),
+                                 "ts": f"2026-02-25T{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}"}))
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def bench_ingest(args):
+    from history import TxnHistory
+    from ingest import TxnIngestor
+    from persistence import FleetJournal, open_store
+    from server import BotEngine
+    from store import FleetStore
+
+    fleet = synthetic_fleet(args.devices, args.merchants)
+    feed = _txn_feed(fleet[0], args.events)
+    chunks = [feed[i:i + args.chunk] for i in range(0, len(feed), args.chunk)]
+    print(f"{args.events:,} events ({len(feed) / 1e6:.1f} MB), {args.devices:,} devices, {args.chunk // 1024}KB reads")
+
+    path = os.path.join(tempfile.mkdtemp(), "fleet.db")
+    FleetJournal(path).seed(*fleet)
+    for label, durable in (("in-memory store", False), ("SQLite journal", True)):
+        store = open_store(path, seed=None) if durable else FleetStore(*synthetic_fleet(args.devices, args.merchants))
+        TxnHistory().attach(store)
+        bot = BotEngine(store=store)
+        ingestor = TxnIngestor(bot.store)
+        t0 = time.perf_counter()
+        pending = b""
+        for chunk in chunks:
+            pending = ingestor.feed(pending + chunk)
+        elapsed = time.perf_counter() - t0
+        print(f"  {label:<16} {ingestor.accepted / elapsed:10,.0f} events/s   ({ingestor.rejected} rejected)")
+        if bot.store.journal:
+            bot.store.journal.flush(timeout=60)
+            bot.store.journal.close()
+
+    # Over the socket: one client streams the feed, the server folds it in on its executor
+    ingestor = TxnIngestor(bot.store)
+    server = await ingestor.serve("127.0.0.1", args.port)
+    t0 = time.perf_counter()
+    _, writer = await asyncio.open_connection("127.0.0.1", args.port)
+    for chunk in chunks:
+        writer.write(chunk)
+        await writer.drain()
+    writer.close()
+    while ingestor.accepted < args.events:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    server.close()
+    print(f"  {'TCP socket':<16} {ingestor.accepted / elapsed:10,.0f} events/s")
+
+    did = next(iter(fleet[0]))
+    for name in ("reports", "daily_summary", "region_report_Delhi", f"device_detail_{did}"):
+        lat = _time_call(lambda: bot.process("bench", "", name), args.repeat)
+        print(f"  {name:<26} {fmt_ms(lat)}")
+
+
+# ── history: columnar reports over months of transactions ──
+
+async def bench_history(args):
+    import history
+    from server import BotEngine
+    from store import FleetStore
+
+    if args.no_numpy:
+        history.np = None
+    store = FleetStore(*synthetic_fleet(args.devices, args.merchants))
+    log = history.TxnHistory(args.path).attach(store)
+    t0 = time.perf_counter()
+    if not log.days():
+        history.backfill(log, store.devices, "2026-02-23", args.days, args.per_day)
+    rows = sum(len(segment["paise"]) for segment in log.segments.values())
+    print(f"{rows:,} transactions over {len(log.days())} days, {args.devices:,} devices "
+          f"({'NumPy' if history.np is not None else 'pure Python'}), ready in {time.perf_counter() - t0:.1f}s")
+    bot = BotEngine(store=store)
+    queries = {
+        "region totals, 30 days": lambda: log.totals("region", log.last(30)),
+        "category totals, 90 days": lambda: log.totals("category", log.last(90)),
+        "model totals, 90 days": lambda: log.totals("model", log.last(90)),
+        "top merchants, 30 days": lambda: log.totals("merchant", log.last(30))[:10],
+        "Delhi daily series, 90 days": lambda: log.series(log.last(90), {"region": "Delhi"}),
+        "Delhi hour profile, 28 days": lambda: log.hourly(log.last(28), {"region": "Delhi"}),
+        "history (report action)": lambda: bot._history_report.__wrapped__(bot),
+        "history_region_Delhi": lambda: bot.process("bench", "", "history_region_Delhi"),
+        "history_by_category": lambda: bot.process("bench", "", "history_by_category"),
+        "compare question facts": lambda: bot._history_facts("compare Mumbai and Delhi week over week"),
+    }
+    print("  (first call scans the columns; closed days' partial results are then cached)")
+    for name, query in queries.items():
+        first = _time_call(query, 1)[0]
+        print(f"  {name:<30} first={first * 1000:7.2f}ms  {fmt_ms(_time_call(query, args.repeat))}")
+
+
+# ── alerts: telemetry-driven alert engine ──
+
+async def bench_alerts(args):
+    from alerts import AlertEngine
+    from ingest import TxnIngestor
+    from server import BotEngine
+    from store import FleetStore
+
+    store = FleetStore(*synthetic_fleet(args.devices, args.merchants))
+    now = [0.0]
+    engine = AlertEngine(store, clock=lambda: now[0])
+    bot = BotEngine(store=store)
+    ingestor = TxnIngestor(store)
+    rng = random.Random(7)
+    flappers = rng.sample(list(store.devices), args.flapping)
+    lines = [json.dumps({"device": rng.choice(flappers), "battery": rng.choice((3, 12, 25, 60)),
+                         "status": rng.choice(("Online",) * 9 + ("Offline",))}) for _ in range(args.events)]
+    feed = ("\n".join(lines) + "\n").encode()
+    print(f"{args.events:,} telemetry reports flapping across {args.flapping:,} of {args.devices:,} devices, "
+          f"{len(store.alerts):,} alerts open")
+
+    t0 = time.perf_counter()
+    pending = b""
+    for i in range(0, len(feed), 1 << 16):
+        pending = ingestor.feed(pending + feed[i:i + (1 << 16)])
+    elapsed = time.perf_counter() - t0
+    print(f"  storm        {ingestor.accepted / elapsed:10,.0f} reports/s  raised={engine.raised:,} "
+          f"open={len(store.alerts):,} (each device/type raised once while open)")
+
+    open_ids = [aid for aid, alert in store.alerts.items() if alert["device"] in flappers]
+    lat = _time_call(lambda: bot.process("bench", "", f"alert_ack_{open_ids.pop()}"), min(args.repeat, len(open_ids)))
+    print(f"  ack          {fmt_ms(lat)}  ({len(store.alerts):,} still open)")
+    before = engine.raised
+    ingestor.feed(feed)
+    print(f"  re-storm     raised={engine.raised - before:,} suppressed={engine.suppressed:,} "
+          f"(acknowledged keys stay quiet for {engine.suppress_for:.0f}s)")
+
+    now[0] += engine.stale_after + 1
+    engine.seen.update((did, now[0]) for did in flappers)
+    t0 = time.perf_counter()
+    raised = engine.sweep()
+    print(f"  sweep        {(time.perf_counter() - t0) * 1000:8.1f}ms over {len(store.by_status['Online']):,} online devices, "
+          f"{raised:,} missed heartbeats raised")
+    lat = _time_call(engine.sweep, 5)
+    print(f"  re-sweep     {fmt_ms(lat)}  (all already open)")
+
+
+# ── wire: bytes and CPU per interaction for each protocol mode ──
+
+# (label, window bits, memLevel, level) — None: no compression
+DEFLATE_SETTINGS = [("off", None, None, None), ("zlib default 15/8/6", 15, 8, 6), ("12/5/6", 12, 5, 6),
+                    ("12/5/1", 12, 5, 1), ("10/4/6", 10, 4, 6)]
+
+
+def _wire_session(mode, args):
+    """(messages [(bytes, text)], seconds producing them) for one scripted session in `mode`."""
+    from frames import encode, envelope, patch
+    from server import LIVE_VIEWS, BotEngine
+    from store import FleetStore
+
+    store = FleetStore(*synthetic_fleet(args.devices, args.merchants))
+    bot = BotEngine(store=store)
+    rng = random.Random(7)
+    dids = list(store.devices)
+    codec = "msgpack" if mode == "v2 MessagePack" else "json"
+    messages, busy = [], 0.0
+
+    def send(items):
+        nonlocal busy
+        t0 = time.perf_counter()
+        messages.extend((data, codec == "json") for data in items())
+        busy += time.perf_counter() - t0
+
+    for view in LIVE_VIEWS:
+        did = rng.choice(dids)
+        for action in ("menu", f"device_detail_{did}", view):
+            frames = bot.process("bench", "", action)
+            if mode != "v1 JSON" and action == view:
+                send(lambda: [envelope(view, frames, codec)])
+            else:
+                send(lambda: [encode(m, codec) for m in frames])
+        for _ in range(args.updates):
+            # A second of fleet activity: a few devices report, an alert is raised or acknowledged
+            store.record_telemetry([(did, {"battery": rng.randint(0, 100), "status": rng.choice(("Online", "Online", "Offline"))})
+                                    for did in rng.sample(dids, 3)])
+            if rng.random() < 0.5 or not store.alerts:
+                store.add_alert({"type": "Low Battery", "device": did, "merchant": "Bench", "time": "12:00", "severity": "warning"})
+            else:
+                store.ack_alert(next(iter(store.alerts)))
+            shown, frames = frames, bot.process("bench", "", view)
+            if mode == "v1 JSON":  # the whole dashboard again, to see what changed
+                send(lambda: [encode(m) for m in frames])
+            else:
+                send(lambda: [encode({"type": "patch", "view": view, "ops": ops}, codec)] if (ops := patch(shown, frames)) else [])
+    return messages, busy
+
+
+async def bench_wire(args):
+    from websockets.extensions.permessage_deflate import PerMessageDeflate
+    from websockets.frames import Frame as WireFrame, Opcode
+
+    import frames
+
+    modes = ["v1 JSON", "v2 JSON"] + (["v2 MessagePack"] if frames.msgpack is not None else [])
+    print(f"{len(modes)} modes: each of 5 dashboards opened, then watched through {args.updates} store changes "
+          f"({args.devices:,} devices); KB sent, serialization + compression ms")
+    print(f"  {'':<16}" + "".join(f"{label:>22}" for label, *_ in DEFLATE_SETTINGS))
+    for mode in modes:
+        messages, busy = _wire_session(mode, args)
+        row = f"  {mode:<16}"
+        for label, bits, mem_level, level in DEFLATE_SETTINGS:
+            if bits is None:
+                size, spent = sum(len(data) for data, _ in messages), 0.0
+            else:
+                deflate = PerMessageDeflate(False, False, bits, bits, {"memLevel": mem_level, "level": level})
+                t0 = time.perf_counter()
+                size = sum(len(deflate.encode(WireFrame(Opcode.TEXT if text else Opcode.BINARY, data)).data)
+                           for data, text in messages)
+                spent = time.perf_counter() - t0
+            row += f"{size / 1e3:>11.1f}KB {(busy + spent) * 1000:>6.1f}ms"
+        print(row + f"   ({len(messages)} messages)")
+    print("  deflate state per connection: " + ", ".join(
+        f"{label} {((1 << (bits + 2)) + (1 << (mem_level + 9))) // 1024}KB" for label, bits, mem_level, _ in DEFLATE_SETTINGS if bits))
+
+
+# ── stress: concurrent mutations keep the store consistent ──
+
+def _store_problems(store, merchants_before, merchants_added, devices_added):
+    """Invariant violations in `store` after a stress run (empty when consistent)."""
+    from collections import Counter
+    problems = []
+    if len(store.merchants) != merchants_before + merchants_added:
+        problems.append(f"{merchants_added} merchants created, {len(store.merchants) - merchants_before} stored "
+                        "(duplicate ids overwrote each other)")
+    owned = Counter(d["merchant_id"] for d in store.devices.values())
+    wrong = [mid for mid, m in store.merchants.items() if m["devices"] != owned[mid]]
+    if wrong:
+        problems.append(f"{len(wrong)} merchants' device counts drifted (lost updates), e.g. {wrong[0]}")
+    if store.merchant_devices_total != sum(m["devices"] for m in store.merchants.values()):
+        problems.append("merchant_devices_total drifted")
+    if devices_added != len(store.devices) - sum(1 for did in store.devices if not did.startswith("POS-8")):
+        problems.append(f"{devices_added} devices reported added, {sum(did.startswith('POS-8') for did in store.devices)} stored")
+    statuses = Counter(d["status"] for d in store.devices.values())
+    if +store.status_counts != +statuses or any(len(store.by_status[s]) != n for s, n in statuses.items()):
+        problems.append("status counts/index drifted")
+    for kind, records in (("device", store.devices), ("merchant", store.merchants), ("alert", store.alerts)):
+        ids, cursor, total = store.page(kind, limit=1)
+        if total != len(records):
+            problems.append(f"{kind} listing holds {total} of {len(records)}")
+    keys = Counter((a["device"], a["type"]) for a in store.alerts.values() if a["id"] > "ALT-200")
+    if keys and max(keys.values()) > 1:
+        problems.append("alert raised twice for one device/type")
+    return problems
+
+
+async def bench_stress(args):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from alerts import AlertEngine
+    from ingest import TxnIngestor
+    from server import BotEngine
+    from store import FleetStore
+
+    sys.setswitchinterval(args.switch)  # switch threads far more often than the default 5ms to surface races
+    store = FleetStore(*synthetic_fleet(args.devices, args.merchants))
+    engine = AlertEngine(store)
+    bot = BotEngine(store=store)
+    ingestor = TxnIngestor(store)
+    merchants_before, mids = len(store.merchants), list(store.merchants)
+    rng = random.Random(7)
+    dids = rng.sample(list(store.devices), 200)
+    done = threading.Event()
+    errors = []
+
+    def submit(i):
+        if i % 2:
+            reply = bot.process(f"s{i}", json.dumps({"name": f"Stress {i}", "category": "Retail", "region": "Delhi"}),
+                                "form_submit_merchant")
+            return "merchant", "Merchant Created" in reply[0]["content"]
+        did = f"POS-8{i // 4:05d}"  # each id submitted twice: exactly one must win
+        reply = bot.process(f"s{i}", json.dumps({"device_id": did, "name": "Stress", "merchant": rng.choice(mids),
+                                                 "region": "Delhi", "model": "PAX A920"}), "form_submit_device")
+        return "device", "Device Registered" in reply[0]["content"]
+
+    def telemetry():
+        while not done.is_set():
+            ingestor.ingest_lines([json.dumps({"device": did, "battery": rng.choice((3, 15, 80)),
+                                               "status": rng.choice(("Online", "Offline"))}).encode() for did in dids[:50]])
+            for aid in list(store.alerts)[-5:]:
+                store.ack_alert(aid)
+
+    def reader():
+        while not done.is_set():
+            try:
+                for name in ("merchants", "view_all_devices", "reports", "alerts", "add_device"):
+                    bot.process("reader", "", name)
+                bot.snapshot.render("devices in Delhi")
+            except Exception as e:  # a reader must never see a collection mid-change
+                errors.append(repr(e))
+
+    background = [threading.Thread(target=telemetry), threading.Thread(target=reader)]
+    for thread in background:
+        thread.start()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(submit, range(args.submits)))
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for thread in background:
+        thread.join()
+    added = {kind: sum(ok for k, ok in results if k == kind) for kind in ("merchant", "device")}
+    print(f"{args.submits:,} form submits on {args.threads} threads in {elapsed:.2f}s "
+          f"({added['merchant']:,} merchants, {added['device']:,} devices added) alongside telemetry, acks and readers")
+    problems = _store_problems(store, merchants_before, added["merchant"], added["device"]) + errors[:3]
+    if added["device"] != (args.submits + 3) // 4:
+        problems.append(f"{added['device']} device submits succeeded for {(args.submits + 3) // 4} distinct ids")
+    print("  invariants hold" if not problems else "  INVARIANTS BROKEN:\n    " + "\n    ".join(problems))
+    if problems:
+        sys.exit(1)
+
+
+# ── overload: admission control under a free-text flood ──
+
+def _reply_kind(message):
+    content = message.get("content") if message.get("type") == "text" else None
+    if not isinstance(content, str):
+        return None
+    if content.startswith("⏳ Too many"):
+        return "throttled"
+    if content.startswith("⏳ The AI assistant is busy"):
+        return "shed"
+    if content.startswith("🤖"):
+        return "answered"
+    return "other"
+
+
+async def _flooder(url, i, gap, stop, outcomes):
+    """Send a new question every `gap` seconds, never waiting for answers, until `stop` is set."""
+    async with websockets.connect(url) as ws:
+        await ws.recv()
+
+        async def read():
+            async for raw in ws:
+                kind = _reply_kind(json.loads(raw))
+                if kind:
+                    outcomes[kind] += 1
+
+        reader = asyncio.create_task(read())
+        n = 0
+        while not stop.is_set():
+            await ws.send(json.dumps({"text": f"compare the regions for me, take {i}-{n}"}))
+            outcomes["sent"] += 1
+            n += 1
+            await asyncio.sleep(gap)
+        reader.cancel()
+
+
+async def _asker(url, stop, samples, outcomes, interval):
+    """A patient operator: one question at a time, each waited for, then a pause."""
+    async with websockets.connect(url) as ws:
+        await ws.recv()
+        n = 0
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await ws.send(json.dumps({"text": f"why is the fleet quieter today, asking {n}"}))
+            while True:
+                message = json.loads(await ws.recv())
+                if message["type"] == "text":
+                    break
+            samples.append(time.perf_counter() - t0)
+            outcomes[_reply_kind(message)] += 1
+            n += 1
+            await asyncio.sleep(interval)
+
+
+async def _clicker(url, stop, samples, interval):
+    """An operator clicking through menus, at a pace the rate limit allows."""
+    async with websockets.connect(url) as ws:
+        await ws.recv()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await ws.send(json.dumps({"text": "📱 Devices", "button_data": "device_status"}))
+            await ws.recv()
+            samples.append(time.perf_counter() - t0)
+            await asyncio.sleep(interval)
+
+
+async def _overload_run(run, url, limits, args):
+    from metrics import ADMISSION
+
+    if not limits:  # rate limit and LLM work bound off (newer free text still cancels the older answer)
+        run.RATE_BURST, run.bot.llm_work.limit = float("inf"), 1 << 30
+    before = dict(ADMISSION._values)
+    stop = asyncio.Event()
+    flood = {"sent": 0, "throttled": 0, "shed": 0, "answered": 0, "other": 0}
+    asked, asker_samples = {"answered": 0, "shed": 0, "throttled": 0, "other": 0}, []
+    peaks = {"work": 0, "queued": 0}
+
+    async def sample():
+        while not stop.is_set():
+            peaks["work"] = max(peaks["work"], run.bot.llm_work.active)
+            peaks["queued"] = max(peaks["queued"], run.bot.llm.dispatch_stats()["queued"])
+            await asyncio.sleep(0.02)
+
+    tasks = [asyncio.create_task(_flooder(url, i, args.gap, stop, flood)) for i in range(args.flooders)]
+    tasks.append(asyncio.create_task(_asker(url, stop, asker_samples, asked, run.FREE_TEXT_COST / run.RATE)))
+    clicks = []
+    tasks.append(asyncio.create_task(_clicker(url, stop, clicks, 1 / run.RATE)))
+    tasks.append(asyncio.create_task(sample()))
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.wait(tasks, timeout=5)
+    for task in tasks:
+        task.cancel()
+    counted = {key[0]: n - before.get(key, 0) for key, n in ADMISSION._values.items()}
+    run.RATE_BURST, run.bot.llm_work.limit = float(os.environ.get("POS_RATE_BURST", "20")), run.LLM_QUEUE
+    return flood, asked, asker_samples, clicks, peaks, counted
+
+
+async def bench_overload(args):
+    import run
+    from fake_ollama import FakeOllama
+    from ollama_async import AsyncOllama
+    from ollama_client import health
+    from server import BotEngine
+
+    print(f"{args.flooders} clients each sending a question every {args.gap * 1000:.0f}ms for {args.duration:g}s, "
+          f"a model answering {args.parallel} at a time in {args.llm_latency:g}s; one patient asker, one clicker")
+    for limits in (False, True):
+        fake = await FakeOllama(latency=args.llm_latency, parallel=args.parallel).start(port=args.ollama_port)
+        run.bot = BotEngine(llm=AsyncOllama(f"http://127.0.0.1:{args.ollama_port}/api/generate"),
+                            llm_queue=run.LLM_QUEUE)
+        health.probe, health.up = (lambda: True), True  # the fake server is up by construction
+        url = f"ws://127.0.0.1:{args.port}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            ws_server = await websockets.serve(run.chat_handler, "127.0.0.1", args.port, process_request=run.serve_static)
+            flood, asked, asker_samples, clicks, peaks, counted = await _overload_run(run, url, limits, args)
+            ws_server.close()
+            await ws_server.wait_closed()
+            fake.close()
+        await run.bot.llm.close()
+        print(f"\n  {'admission control' if limits else 'no rate limit or LLM bound'}:")
+        print(f"    flood: {flood['sent']:,} sent, {flood['answered']:,} answered by the LLM, {flood['other']:,} from "
+              f"history figures (shed), {flood['shed']:,} busy notices (shed), "
+              f"{flood['throttled']:,} throttle notices ({counted.get('throttled', 0):,} refused), "
+              f"{counted.get('cancelled', 0):,} superseded answers cancelled")
+        print(f"    peak free-text messages holding LLM work {peaks['work']}, peak requests queued for the model "
+              f"{peaks['queued']}")
+        print(f"    patient asker: {asked['answered']} answered, {asked['shed']} shed, {asked['throttled']} throttled, "
+              f"{fmt_ms(asker_samples)}")
+        print(f"    buttons: {fmt_ms(clicks)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POS bot benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("latency", help="button latency under concurrent LLM load")
+    p.add_argument("--sessions", type=int, default=200)
+    p.add_argument("--clicks", type=int, default=500)
+    p.add_argument("--llm-latency", type=float, default=2.0)
+    p.add_argument("--port", type=int, default=18888)
+    p.add_argument("--ollama-port", type=int, default=21434)
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser("intents", help="local intent classifier vs LLM accuracy/latency")
+    p.set_defaults(func=bench_intents)
+
+    p = sub.add_parser("fleet", help="handler latency on a large synthetic fleet")
+    p.add_argument("--devices", type=int, default=100_000)
+    p.add_argument("--merchants", type=int, default=5_000)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_fleet)
+
+    p = sub.add_parser("persist", help="durable store startup time and write batching")
+    p.add_argument("--devices", type=int, default=100_000)
+    p.add_argument("--merchants", type=int, default=5_000)
+    p.add_argument("--burst", type=int, default=10_000)
+    p.set_defaults(func=bench_persist)
+
+    p = sub.add_parser("sessions", help="session store soak test (memory stays flat)")
+    p.add_argument("--connects", type=int, default=1_000_000)
+    p.add_argument("--clean", type=float, default=0.7, help="fraction of clients that disconnect cleanly")
+    p.add_argument("--interval", type=float, default=0.1, help="simulated seconds between connects")
+    p.add_argument("--ttl", type=float, default=600.0)
+    p.add_argument("--max-sessions", type=int, default=10_000)
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser("render", help="per-click CPU with cached response frames")
+    p.add_argument("--devices", type=int, default=200)
+    p.add_argument("--merchants", type=int, default=50)
+    p.add_argument("--repeat", type=int, default=500)
+    p.set_defaults(func=bench_render)
+
+    p = sub.add_parser("pages", help="paginated listing frame size and handler time")
+    p.add_argument("--devices", type=int, default=50_000)
+    p.add_argument("--merchants", type=int, default=2_000)
+    p.add_argument("--repeat", type=int, default=200)
+    p.set_defaults(func=bench_pages)
+
+    p = sub.add_parser("static", help="static asset cache: bytes and time per request")
+    p.add_argument("--repeat", type=int, default=2000)
+    p.set_defaults(func=bench_static)
+
+    p = sub.add_parser("scale", help="throughput vs number of worker processes")
+    p.add_argument("--max-workers", type=int, default=max(2, os.cpu_count() or 1))
+    p.add_argument("--clients", type=int, default=max(2, os.cpu_count() or 1), help="load-generator processes")
+    p.add_argument("--conns", type=int, default=20, help="sockets per client process")
+    p.add_argument("--duration", type=float, default=5.0)
+    p.add_argument("--startup", type=float, default=3.0, help="seconds to wait for the workers to listen")
+    p.add_argument("--port", type=int, default=18890)
+    p.set_defaults(func=bench_scale)
+
+    p = sub.add_parser("dispatch", help="LLM request coalescing, batching and priorities")
+    p.add_argument("--operators", type=int, default=32, help="concurrent distinct classifications")
+    p.add_argument("--answers", type=int, default=12, help="concurrent answer requests")
+    p.add_argument("--questions", type=int, default=3, help="distinct questions among the answers")
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--parallel", type=int, default=1, help="requests the model serves at once")
+    p.add_argument("--ollama-port", type=int, default=21435)
+    p.set_defaults(func=bench_dispatch)
+
+    p = sub.add_parser("prompt", help="prompt-eval work saved by the cache-friendly prompt layout")
+    p.add_argument("--sessions", type=int, default=4)
+    p.add_argument("--devices", type=int, default=2_000)
+    p.add_argument("--merchants", type=int, default=200)
+    p.add_argument("--classify", action=argparse.BooleanOptionalAction, default=True,
+                   help="interleave an LLM intent classification before each answer")
+    p.add_argument("--eval-delay", type=float, default=0.002, help="fake model: seconds per uncached prompt token")
+    p.add_argument("--lanes", type=int, nargs="+", default=[1, 2, 4], help="fake model: OLLAMA_NUM_PARALLEL values")
+    p.add_argument("--fake", action="store_true", help="use the fake model even if Ollama is running")
+    p.add_argument("--ollama-port", type=int, default=21436)
+    p.set_defaults(func=bench_prompt)
+
+    p = sub.add_parser("ingest", help="transaction feed throughput and report reads")
+    p.add_argument("--events", type=int, default=500_000)
+    p.add_argument("--devices", type=int, default=10_000)
+    p.add_argument("--merchants", type=int, default=500)
+    p.add_argument("--chunk", type=int, default=1 << 16, help="bytes per read")
+    p.add_argument("--repeat", type=int, default=200)
+    p.add_argument("--port", type=int, default=19100)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("history", help="columnar history: group-by and time-bucket report latency")
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--per-day", type=int, default=50_000)
+    p.add_argument("--devices", type=int, default=10_000)
+    p.add_argument("--merchants", type=int, default=500)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--path", default=None, help="history directory (kept between runs; memory-mapped)")
+    p.add_argument("--no-numpy", action="store_true", help="pure-Python group-bys")
+    p.set_defaults(func=bench_history)
+
+    p = sub.add_parser("alerts", help="alert engine: telemetry storm, dedup/suppression, ack and sweep cost")
+    p.add_argument("--events", type=int, default=200_000)
+    p.add_argument("--devices", type=int, default=100_000)
+    p.add_argument("--merchants", type=int, default=2_000)
+    p.add_argument("--flapping", type=int, default=2_000, help="devices sending telemetry")
+    p.add_argument("--repeat", type=int, default=500)
+    p.set_defaults(func=bench_alerts)
+
+    p = sub.add_parser("wire", help="bytes and CPU per interaction: JSON vs compact protocol, deflate settings")
+    p.add_argument("--updates", type=int, default=20, help="store changes watched per dashboard")
+    p.add_argument("--devices", type=int, default=2_000)
+    p.add_argument("--merchants", type=int, default=200)
+    p.set_defaults(func=bench_wire)
+
+    p = sub.add_parser("stress", help="thousands of concurrent form submits; checks store invariants")
+    p.add_argument("--submits", type=int, default=5_000)
+    p.add_argument("--threads", type=int, default=32)
+    p.add_argument("--devices", type=int, default=5_000)
+    p.add_argument("--merchants", type=int, default=300)
+    p.add_argument("--switch", type=float, default=1e-6, help="sys.setswitchinterval during the run")
+    p.set_defaults(func=bench_stress)
+
+    p = sub.add_parser("overload", help="free-text flood: rate limits, LLM load shedding, cancellation")
+    p.add_argument("--flooders", type=int, default=40)
+    p.add_argument("--gap", type=float, default=0.1, help="seconds between a flooder's questions")
+    p.add_argument("--duration", type=float, default=10.0)
+    p.add_argument("--llm-latency", type=float, default=2.0)
+    p.add_argument("--parallel", type=int, default=2, help="answers the model generates at once")
+    p.add_argument("--port", type=int, default=18891)
+    p.add_argument("--ollama-port", type=int, default=21437)
+    p.set_defaults(func=bench_overload)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
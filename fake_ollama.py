@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Fake Ollama server for local testing and benchmarks — no model, configurable latency.
+
+Speaks just enough of the API for the bot: GET /api/tags and POST /api/generate
+(streaming NDJSON or a single JSON body, `context` in and out), over keep-alive
+HTTP/1.1. Prompt evaluation is modelled like llama.cpp's prefix cache: each lane
+remembers the text it last evaluated, and only the part of a new prompt past the
+shared prefix is charged (`--eval-delay` seconds per ~4-character token) and
+reported in `prompt_eval_count` / `prompt_eval_duration`.
+
+    python3 fake_ollama.py --port 11434 --latency 0.5 --token-delay 0.02 --parallel 1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+
+ANSWER = "**All regions are healthy.** Mumbai leads on volume; Delhi has one offline terminal (POS-2001) that needs attention."
+
+# Crude keyword → intent guesses so classification replies look plausible
+INTENT_KEYWORDS = [
+    ("add device", "DEVICE_ADD"), ("add merchant", "MERCHANT_ADD"), ("merchant", "MERCHANT_LIST"),
+    ("device", "DEVICE_LIST"), ("alert", "ALERTS"), ("report", "REPORTS"), ("mumbai", "MUMBAI"),
+    ("delhi", "DELHI"), ("bangalore", "BANGALORE"), ("chennai", "CHENNAI"), ("help", "HELP"),
+]
+
+
+class FakeOllama:
+    def __init__(self, latency=0.0, token_delay=0.0, answer=ANSWER, parallel=0, eval_delay=0.0):
+        self.latency = latency          # seconds before the first byte of a /api/generate reply
+        self.token_delay = token_delay  # seconds between streamed tokens
+        self.answer = answer
+        self.parallel = parallel        # generations at once, like OLLAMA_NUM_PARALLEL (0 = unlimited)
+        self.eval_delay = eval_delay    # seconds per prompt token that isn't in a lane's cache
+        self._slots = None
+        self._lanes = [""] * max(1, parallel)  # text each lane's KV cache holds
+        self._lane_used = [0] * max(1, parallel)
+        self._contexts = {}                    # context id -> conversation text so far
+        self._context_ids = itertools.count(1)
+        self.requests = 0
+        self.connections = 0
+        self.prompt_tokens = 0          # prompt tokens received / actually evaluated
+        self.evaluated_tokens = 0
+
+    def _evaluate(self, payload, reply):
+        """Charge prompt evaluation against the best-matching lane; returns (stats, context tokens)."""
+        text = self._contexts.get((payload.get("context") or [0])[0], "")
+        if payload.get("system"):
+            text += "<|system|>" + payload["system"]
+        text += "<|user|>" + payload.get("prompt", "") + "<|assistant|>"
+        # As Ollama's runner does: continue a lane whose whole cache prefixes the prompt; otherwise
+        # take the least recently used lane, seeded with the longest prefix any lane shares
+        shared = [len(os.path.commonprefix([cached, text])) for cached in self._lanes]
+        best = max(range(len(self._lanes)), key=shared.__getitem__)
+        if shared[best] == len(self._lanes[best]):
+            lane = best
+        else:
+            lane = min(range(len(self._lanes)), key=self._lane_used.__getitem__)
+        fresh = len(text) - shared[best]
+        conversation = self._lanes[lane] = text + reply
+        self._lane_used[lane] = self.requests
+        total, evaluated = -(-len(text) // 4), max(1, -(-fresh // 4))
+        self.prompt_tokens += total
+        self.evaluated_tokens += evaluated
+        context_id = next(self._context_ids)
+        self._contexts[context_id] = conversation
+        if len(self._contexts) > 1024:
+            del self._contexts[next(iter(self._contexts))]
+        stats = {"prompt_eval_count": evaluated, "prompt_eval_duration": int(evaluated * self.eval_delay * 1e9)}
+        return stats, [context_id] * -(-len(conversation) // 4)
+
+    def _classify(self, prompt):
+        numbered = re.findall(r'^(\d+)\. "(.*)"$', prompt, re.M)
+        if numbered:  # batch prompt: one numbered reply line per message
+            return "\n".join(f"{n}. {self._intent(message)}" for n, message in numbered)
+        return self._intent(prompt.rsplit("\n", 1)[-1])
+
+    def _intent(self, message):
+        message = message.lower()
+        for keyword, intent in INTENT_KEYWORDS:
+            if keyword in message:
+                return intent
+        return "GENERAL"
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                if method == "GET" and path == "/api/tags":
+                    self._reply(writer, 200, {"models": [{"name": "qwen2.5:1.5b"}]})
+                elif method == "POST" and path == "/api/generate":
+                    await self._generate(writer, json.loads(body or b"{}"))
+                else:
+                    self._reply(writer, 404, {"error": "not found"})
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _reply(self, writer, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+
+    async def _generate(self, writer, payload):
+        if not self.parallel:
+            return await self._generate_one(writer, payload)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.parallel)
+        async with self._slots:
+            await self._generate_one(writer, payload)
+
+    async def respond(self, payload, intent):
+        """Reply text for a generate request: an intent classification, or an answer."""
+        return self._classify(payload.get("prompt", "")) if intent else self.answer
+
+    async def _generate_one(self, writer, payload):
+        intent = "system" not in payload  # classification prompts carry no system text
+        reply = await self.respond(payload, intent)
+        stats, context = self._evaluate(payload, reply)
+        await asyncio.sleep(self.latency + stats["prompt_eval_count"] * self.eval_delay)
+        if intent:
+            self._reply(writer, 200, {"response": reply, "done": True, **stats})
+            return
+        if not payload.get("stream", True):
+            self._reply(writer, 200, {"response": reply, "done": True, "context": context, **stats})
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        tokens = [w + " " for w in reply.split(" ")]
+        for token in tokens + [None]:
+            obj = {"response": token or "", "done": token is None}
+            if token is None:
+                obj.update(stats, context=context)
+            line = (json.dumps(obj) + "\n").encode("utf-8")
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+            if token and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        writer.write(b"0\r\n\r\n")
+
+    async def start(self, host="127.0.0.1", port=11434):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--parallel", type=int, default=0, help="generations at once (0 = unlimited)")
+    parser.add_argument("--eval-delay", type=float, default=0.0, help="seconds per uncached prompt token")
+    args = parser.parse_args()
+    server = await FakeOllama(args.latency, args.token_delay, parallel=args.parallel,
+                              eval_delay=args.eval_delay).start(args.host, args.port)
+    print(f"🦙 Fake Ollama on http://{args.host}:{args.port} (latency {args.latency}s)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Pre-serialized response frames and cached handler views.
+
+A Frame is a response message (a plain dict to everything in server.py)
+that remembers its wire encoding, so a menu clicked a thousand times is
+json-encoded once. Handlers opt in with a decorator:
+
+  @static_view     output never changes — rendered once per process
+  @versioned_view  output depends on the fleet — re-rendered only when
+                   `self.store.version` has moved since the last render
+
+Cached frames are shared between sessions: treat them as read-only.
+
+Clients that negotiate the compact protocol (see run.py) may take MessagePack
+instead of JSON (`codec="msgpack"`, when the msgpack package is installed)
+and get dashboards as a `view` envelope that is later kept current with
+`patch()` edit lists rather than re-sent whole, and a free-text answer as a
+`reply` envelope naming the reply its streamed deltas belong to.
+"""
+
+import difflib
+import functools
+import itertools
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON only
+    msgpack = None
+
+
+class Frame(dict):
+    """Response message with its JSON (UTF-8 bytes) computed on first send."""
+
+    __slots__ = ("_wire", "_packed")
+
+    def wire(self) -> bytes:
+        try:
+            return self._wire
+        except AttributeError:
+            self._wire = json.dumps(self, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            return self._wire
+
+    def packed(self) -> bytes:
+        try:
+            return self._packed
+        except AttributeError:
+            self._packed = msgpack.packb(self)
+            return self._packed
+
+
+def encode(msg, codec="json") -> bytes:
+    """Wire bytes for any response message; Frames reuse their cached encoding."""
+    if codec == "msgpack":
+        return msg.packed() if isinstance(msg, Frame) else msgpack.packb(msg)
+    if isinstance(msg, Frame):
+        return msg.wire()
+    return json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def envelope(view, frames, codec="json", kind="view") -> bytes:
+    """{"type": kind, kind: view, "frames": frames}, spliced from the frames' cached encodings."""
+    body = [encode(frame, codec) for frame in frames]
+    if codec == "msgpack":
+        n = len(body)
+        header = bytes([0x90 | n]) if n < 16 else b"\xdc" + n.to_bytes(2, "big")  # fixarray / array 16
+        return b"\x83" + msgpack.packb("type") + msgpack.packb(kind) + msgpack.packb(kind) + msgpack.packb(view) \
+            + msgpack.packb("frames") + header + b"".join(body)
+    return (b'{"type":"' + kind.encode() + b'","' + kind.encode() + b'":' + json.dumps(view).encode()
+            + b',"frames":[' + b",".join(body) + b"]}")
+
+
+# ── Patches ──
+
+def patch(old, new):
+    """Edits turning the JSON-like value `old` into `new` (both left untouched).
+
+    Each op is one of ["s", path, value] (set), ["d", path] (delete a key),
+    ["l", path, length] (resize a list) or ["t", path, at, cut, text] (splice a
+    string; offsets in UTF-16 code units, as JavaScript counts them).
+    """
+    ops = []
+    _diff(old, new, [], ops)
+    return ops
+
+
+def _diff(old, new, path, ops):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, path + [key], ops)
+            else:
+                ops.append(["s", path + [key], value])
+        ops.extend(["d", path + [key]] for key in old if key not in new)
+    elif isinstance(old, list) and isinstance(new, list):
+        if len(old) != len(new):
+            ops.append(["l", path, len(new)])
+        for i, value in enumerate(new):
+            if i < len(old):
+                _diff(old[i], value, path + [i], ops)
+            else:
+                ops.append(["s", path + [i], value])
+    elif isinstance(old, str) and isinstance(new, str) and len(new) > 32:
+        for start, end, text in reversed(_splices(old, new)):  # last first, so earlier offsets stay valid
+            ops.append(["t", path, _utf16(old[:start]), _utf16(old[start:end]), text])
+    else:
+        ops.append(["s", path, new])
+
+
+def _splices(old, new):
+    """(start, end, replacement) spans rewriting `old` into `new`: lines are diffed, then each
+    changed run is trimmed to where it actually differs (usually just a number)."""
+    a, b = old.splitlines(True), new.splitlines(True)
+    starts = list(itertools.accumulate(map(len, a), initial=0))
+    spans = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        x, y = "".join(a[i1:i2]), "".join(b[j1:j2])
+        head = len(os.path.commonprefix([x, y]))
+        tail = len(os.path.commonprefix([x[head:][::-1], y[head:][::-1]]))
+        spans.append((starts[i1] + head, starts[i2] - tail, y[head:len(y) - tail]))
+    return spans
+
+
+def _utf16(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def freeze(messages):
+    frames = [Frame(m) for m in messages]
+    for frame in frames:
+        frame.wire()
+    return frames
+
+
+def static_view(method):
+    """Cache a no-argument handler's frames for the life of the process."""
+    cache = []
+
+    @functools.wraps(method)
+    def view(self):
+        if not cache:
+            cache.append(freeze(method(self)))
+        return cache[0]
+    return view
+
+
+def versioned_view(method):
+    """Cache a no-argument handler's frames per engine until the store changes."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def view(self):
+        version = self.store.version
+        hit = self._views.get(name)
+        if hit is None or hit[0] != version:
+            hit = self._views[name] = (version, freeze(method(self)))
+        return hit[1]
+    return view
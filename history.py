@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""Columnar transaction history — months of transactions, grouped and bucketed in milliseconds.
+
+Transactions are kept as one segment per day: parallel integer columns
+(hour, region, merchant, device, paise), with region/merchant/device strings
+interned to dense ids. Queries run per segment — a bincount over the group's
+id column, weighted by paise — and add the partial sums, so a month-long
+report touches only the columns it needs.
+
+Storage is stdlib `array`s. With NumPy installed, the group-bys are vectorized
+and closed days saved under `path` are memory-mapped instead of read in;
+without it the same queries run as plain loops.
+
+    history.totals("category", history.last(30))        # [(category, count, paise)], biggest first
+    history.series(history.last(14), {"region": "Delhi"})  # [(day, count, paise)]
+"""
+
+import datetime
+import json
+import os
+import random
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional — pure-Python group-bys
+    np = None
+
+# name -> array typecode; "paise" is appended last, so its length is the segment's row count
+COLUMNS = (("hour", "b"), ("region", "i"), ("merchant", "i"), ("device", "i"), ("paise", "q"))
+DTYPES = {"b": "i1", "i": "i4", "q": "i8"}
+KEYED = ("region", "merchant", "device")
+# Derived groups: group -> (column it is looked up from, record field)
+ATTRIBUTES = {"category": ("merchant", "category"), "model": ("device", "model")}
+CACHE_ENTRIES = 50_000  # per-day query results kept for closed days
+# Paise sums are split at this bit so a segment's float64 bincounts stay exact (under 2**27 rows)
+LOW_BITS = 26
+LOW_MASK = (1 << LOW_BITS) - 1
+
+
+class TxnHistory:
+    """Per-day columnar transaction log. `lookup(kind, key)` supplies merchant/device records for derived groups.
+
+    Saved ids only mean something with the key table saved alongside them, so one process writes
+    under `path`; others (workers sharing it) pass `save=False` and only read the days saved there.
+
+    Queries run on executor threads while the feed appends: `_lock` guards the query cache and
+    lookup-table builds, and a lookup table is replaced whole, never extended in place.
+    """
+
+    def __init__(self, path=None, lookup=None, save=True):
+        self.path = path
+        self.save = save
+        self.lookup = lookup
+        self.keys = {kind: [] for kind in KEYED}      # kind -> id -> key
+        self.ids = {kind: {} for kind in KEYED}       # kind -> key -> id
+        self.segments = {}                            # day -> {column: array or ndarray}, closed days
+        self.live_day = None
+        self.live = None                              # today's columns, still growing
+        self._luts = {}                               # derived group -> (ids covered, labels, lut)
+        self._cache = {}                              # (day, query, where) -> partial result, closed days only
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def attach(self, store):
+        """Record the store's ingested transactions; derived groups read its merchant/device records."""
+        self.lookup = lambda kind, key: (store.merchants if kind == "merchant" else store.devices).get(key)
+        store.history = self
+        return self
+
+    # ── Writing ──
+
+    def append(self, events):
+        """Add ingested events [(did, mid, region, "YYYY-MM-DD HH:MM:SS", paise)], as FleetStore passes them."""
+        rid, mid_ids, did_ids = self.ids["region"], self.ids["merchant"], self.ids["device"]
+        day = self.live_day
+        add = self._appenders()
+        for did, mid, region, ts, paise in events:
+            if not ts.startswith(day or "-"):
+                if day is not None and ts[:10] < day:
+                    continue                                # late: the day is closed
+                self._open(ts[:10])
+                day, add = self.live_day, self._appenders()
+            r = rid.get(region)
+            if r is None:
+                r = self._intern("region", region)
+            m = mid_ids.get(mid)
+            if m is None:
+                m = self._intern("merchant", mid)
+            d = did_ids.get(did)
+            if d is None:
+                d = self._intern("device", did)
+            add[0](int(ts[11:13]))
+            add[1](r)
+            add[2](m)
+            add[3](d)
+            add[4](paise)
+
+    def _appenders(self):
+        return [self.live[name].append for name, _ in COLUMNS] if self.live is not None else None
+
+    def _intern(self, kind, key):
+        i = self.ids[kind][key] = len(self.keys[kind])
+        self.keys[kind].append(key)
+        return i
+
+    def _open(self, day):
+        """Close the live day and start `day` (resuming it if it was saved earlier)."""
+        self.seal()
+        saved = self.segments.pop(day, None)
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == day]:
+                del self._cache[key]
+        self.live = {name: array(code, saved[name].tobytes() if saved is not None else b"") for name, code in COLUMNS}
+        self.live_day = day
+
+    def seal(self):
+        """Close the live day: it becomes a segment (and is saved, when there is a path)."""
+        if self.live is None:
+            return
+        n = len(self.live["paise"])
+        segment = {name: self.live[name][:n] for name, _ in COLUMNS}
+        if self.path and self.save:
+            self._save(self.live_day, segment)
+            segment = self._read(self.live_day) or segment
+        self.segments[self.live_day] = segment
+        self.live = self.live_day = None
+
+    def close(self):
+        self.seal()
+
+    # ── Files: <path>/keys.json and <path>/<day>/<column>.bin ──
+
+    def _save(self, day, segment):
+        directory = os.path.join(self.path, day)
+        os.makedirs(directory, exist_ok=True)
+        self._write(os.path.join(self.path, "keys.json"), json.dumps(self.keys).encode())
+        for name, _ in COLUMNS:
+            self._write(os.path.join(directory, name + ".bin"), segment[name].tobytes())
+
+    @staticmethod
+    def _write(file, data):
+        # Atomic replace: workers may be loading the saved days meanwhile
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, file)
+
+    def _read(self, day):
+        segment = {}
+        for name, code in COLUMNS:
+            file = os.path.join(self.path, day, name + ".bin")
+            size = os.path.getsize(file)
+            if np is not None and size:
+                segment[name] = np.memmap(file, dtype=DTYPES[code], mode="r")
+            else:
+                column = array(code)
+                with open(file, "rb") as f:
+                    column.frombytes(f.read())
+                segment[name] = column
+        n = len(segment["paise"])
+        return {name: column[:n] for name, column in segment.items()} if n else None
+
+    def load(self):
+        keys_file = os.path.join(self.path, "keys.json")
+        if not os.path.exists(keys_file):
+            return
+        with open(keys_file) as f:
+            self.keys = {kind: list(keys) for kind, keys in json.load(f).items()}
+        self.ids = {kind: {key: i for i, key in enumerate(keys)} for kind, keys in self.keys.items()}
+        for day in sorted(os.listdir(self.path)):
+            if os.path.isdir(os.path.join(self.path, day)):
+                segment = self._read(day)
+                if segment is not None:
+                    self.segments[day] = segment
+
+    # ── Days ──
+
+    def days(self):
+        days = sorted(self.segments)
+        if self.live_day is not None:
+            days.append(self.live_day)
+        return days
+
+    def last(self, n, end=None):
+        """The `n` calendar days ending at `end` (default: the latest day with data)."""
+        if end is None:
+            days = self.days()
+            if not days:
+                return []
+            end = days[-1]
+        last = datetime.date.fromisoformat(end)
+        return [(last - datetime.timedelta(days=i)).isoformat() for i in range(n - 1, -1, -1)]
+
+    def _columns(self, days):
+        """(day, columns) for each of `days` with data. The live day is copied, so appends can continue."""
+        for day in days:
+            if day == self.live_day and self.live is not None:
+                n = len(self.live["paise"])
+                columns = {name: self.live[name][:n] for name, _ in COLUMNS}
+            else:
+                columns = self.segments.get(day)
+            if columns:
+                yield day, columns
+
+    # ── Queries ──
+
+    def totals(self, group, days, where=None):
+        """[(label, count, paise)] per group value over `days`, largest volume first."""
+        counts = volumes = None
+        for _, (c, v) in self._per_day(days, ("totals", group), where,
+                                       lambda columns, keep: self._bincount_group(columns, group, keep)):
+            counts, volumes = (c, v) if counts is None else (_add(counts, c), _add(volumes, v))
+        if counts is None:
+            return []
+        labels = self.keys[group] if group in KEYED else self._lut(group)[0]
+        rows = [(labels[i], int(counts[i]), int(volumes[i])) for i in range(len(counts)) if counts[i]]
+        return sorted(rows, key=lambda row: (-row[2], row[0]))
+
+    def series(self, days, where=None):
+        """[(day, count, paise)] for each of `days` (zeros where there is no data)."""
+        found = dict(self._per_day(days, ("series",), where, _count_sum))
+        return [(day, *found.get(day, (0, 0))) for day in days]
+
+    def hourly(self, days, where=None):
+        """[(count, paise)] for hours 0-23, summed over `days`."""
+        counts, volumes = [0] * 24, [0] * 24
+        for _, (c, v) in self._per_day(days, ("hourly",), where,
+                                       lambda columns, keep: _bincount(columns["hour"], columns["paise"], 24, keep)):
+            counts, volumes = _add(counts, c), _add(volumes, v)
+        return [(int(c), int(v)) for c, v in zip(counts, volumes)]
+
+    def _per_day(self, days, query, where, compute):
+        """(day, compute(columns, rows kept by `where`)) per day with data. Closed days never change,
+        so their results are cached: a report over months only scans the live day again."""
+        where_key = tuple(sorted(where.items())) if where else ()
+        for day, columns in self._columns(days):
+            closed = day != self.live_day
+            key = (day, query, where_key)
+            result = None
+            if closed:
+                with self._lock:
+                    result = self._cache.get(key)
+            if result is None:
+                result = compute(columns, self._where(columns, where))
+                if closed:
+                    with self._lock:
+                        if len(self._cache) >= CACHE_ENTRIES:
+                            self._cache.clear()
+                        self._cache[key] = result
+            yield day, result
+
+    # ── Group and filter columns ──
+
+    def _bincount_group(self, columns, group, keep):
+        ids, labels = self._group(columns, group)
+        return _bincount(ids, columns["paise"], len(labels), keep)
+
+    def _group(self, columns, group):
+        """(id column, labels) for a keyed or derived group."""
+        if group in KEYED:
+            return columns[group], self.keys[group]
+        source, _ = ATTRIBUTES[group]
+        labels, lut = self._lut(group)
+        if np is not None:
+            return np.array(lut)[np.asarray(columns[source])], labels
+        return [lut[i] for i in columns[source]], labels
+
+    def _lut(self, group):
+        """Derived-group lookup table: source id -> label id, rebuilt (as copies) when new keys are interned."""
+        source, field = ATTRIBUTES[group]
+        keys = self.keys[source]
+        covered, labels, lut = self._luts.get(group, (0, [], array("i")))
+        if covered < len(keys):
+            with self._lock:
+                covered, labels, lut = self._luts.get(group, (0, [], array("i")))
+                n = len(keys)
+                if covered < n:
+                    labels, lut = list(labels), array("i", lut)   # callers may still hold the old pair
+                    index = {label: i for i, label in enumerate(labels)}
+                    for key in keys[covered:n]:
+                        record = self.lookup(source, key) if self.lookup else None
+                        label = record.get(field, "Unknown") if record else "Unknown"
+                        if label not in index:
+                            index[label] = len(labels)
+                            labels.append(label)
+                        lut.append(index[label])
+                    self._luts[group] = (n, labels, lut)
+        return labels, lut
+
+    def _where(self, columns, where):
+        """Rows matching every {group: label} in `where`: a boolean mask (NumPy), index list, or None for all."""
+        if not where:
+            return None
+        keep = None
+        for group, label in where.items():
+            ids, labels = self._group(columns, group)
+            try:
+                wanted = labels.index(label)
+            except ValueError:
+                wanted = -1
+            if np is not None:
+                match = np.asarray(ids) == wanted
+                keep = match if keep is None else keep & match
+            else:
+                match = [i for i, value in enumerate(ids) if value == wanted]
+                keep = match if keep is None else sorted(set(keep) & set(match))
+        return keep
+
+
+def _bincount(ids, paise, n, keep=None):
+    """(counts, paise sums) per id in 0..n-1, optionally only over the rows in `keep`."""
+    if np is not None:
+        ids, paise = np.asarray(ids), np.asarray(paise)
+        if keep is not None:
+            ids, paise = ids[keep], paise[keep]
+        # Weighted bincount sums in float64, inexact past 2**53 paise: sum the low 26 bits and the
+        # rest separately (each stays exact) and join them as int64. np.add.at is exact but ~5x slower.
+        low = np.bincount(ids, weights=paise & LOW_MASK, minlength=n).astype(np.int64)
+        high = np.bincount(ids, weights=paise >> LOW_BITS, minlength=n).astype(np.int64)
+        return np.bincount(ids, minlength=n), (high << LOW_BITS) + low
+    counts, volumes = [0] * n, [0] * n
+    rows = range(len(paise)) if keep is None else keep
+    for row in rows:
+        i = ids[row]
+        counts[i] += 1
+        volumes[i] += paise[row]
+    return counts, volumes
+
+
+def _count_sum(columns, keep):
+    paise = columns["paise"]
+    if np is not None:
+        paise = np.asarray(paise) if keep is None else np.asarray(paise)[keep]
+        return int(paise.size), int(paise.sum())
+    rows = paise if keep is None else [paise[i] for i in keep]
+    return len(rows), sum(rows)
+
+
+def _add(a, b):
+    if np is not None:
+        if len(a) < len(b):                 # a group gained labels between days
+            a = np.pad(a, (0, len(b) - len(a)))
+        elif len(b) < len(a):
+            b = np.pad(b, (0, len(a) - len(b)))
+        return a + b
+    if len(a) < len(b):
+        a = list(a) + [0] * (len(b) - len(a))
+    return [x + (b[i] if i < len(b) else 0) for i, x in enumerate(a)]
+
+
+def pct_change(now, before):
+    """"+4.2%" style change, or "new" when there is nothing to compare with."""
+    if not before:
+        return "new" if now else "—"
+    return f"{(now - before) * 100 / before:+.1f}%"
+
+
+# ── Demo data ──
+
+# Share of a day's transactions per hour (retail: lunch and evening peaks)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 14, 20, 26, 30, 36, 34, 28, 26, 28, 34, 40, 38, 30, 20, 10, 4]
+
+
+def backfill(history, devices, end, days, per_day, seed=7):
+    """Synthetic history for `days` days up to `end` (inclusive) — the dummy-data counterpart of the fleet seed."""
+    rng = random.Random(seed)
+    dids = list(devices)
+    weights = [1 + rng.random() * 3 for _ in dids]      # busier and quieter terminals
+    last = datetime.date.fromisoformat(end)
+    for back in range(days - 1, -1, -1):
+        day = last - datetime.timedelta(days=back)
+        n = int(per_day * (1.15 if day.weekday() >= 5 else 1.0) * rng.uniform(0.9, 1.1))
+        chosen = rng.choices(dids, weights, k=n)
+        hours = rng.choices(range(24), HOUR_WEIGHTS, k=n)
+        stamp = day.isoformat()
+        history.append([(did, devices[did]["merchant_id"], devices[did]["region"], f"{stamp} {hour:02d}:00:00",
+                         int(rng.lognormvariate(6.9, 0.7) * 100))
+                        for did, hour in zip(chosen, hours)])
+    history.seal()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Transaction ingestion — NDJSON events from terminals folded into live daily totals.
+
+Terminals (or a forwarder) write one JSON object per line to a local TCP
+socket, or append them to a file this process tails:
+
+    {"device": "POS-1001", "amount": 249.5, "ts": "2026-02-24T15:32:10"}
+
+`merchant_id` and `region` default to the device's own; `ts` may also be epoch
+seconds. A line without an amount is device telemetry — a heartbeat, with
+optional new state:
+
+    {"device": "POS-1001", "battery": 14, "status": "Online"}
+
+Lines are parsed a chunk at a time and each chunk is applied with one
+`FleetStore.record_transactions` (and `record_telemetry`) call, so listeners
+(journal, snapshot, cached views, alert engine) hear about a batch rather than
+every event.
+
+TxnAggregates keeps today's count and volume per region, merchant and device,
+plus per-region hourly buckets, in flat integer arrays indexed by interned key
+ids: an event costs a few array increments and every read is O(1).
+"""
+
+import asyncio
+import datetime
+import json
+import math
+import os
+import threading
+import time
+from array import array
+
+HOURS = 24
+DEVICE_STATUSES = ("Online", "Offline", "Maintenance")
+MAX_FUTURE_DAYS = 1           # events dated later than tomorrow are rejected (one would start a new day)
+MAX_PAISE = 10 ** 11          # ₹1,00,00,00,000: larger amounts are rejected, so daily sums fit the int64 arrays
+
+
+class KeyedCounters:
+    """Count and volume (paise) per key, in two arrays indexed by the key's interned id."""
+
+    __slots__ = ("ids", "count", "volume")
+
+    def __init__(self):
+        self.ids = {}
+        self.count = array("q")
+        self.volume = array("q")
+
+    def slot(self, key):
+        i = self.ids.get(key)
+        if i is None:
+            i = self.ids[key] = len(self.count)
+            self.count.append(0)
+            self.volume.append(0)
+        return i
+
+    def get(self, key):
+        """(count, volume in paise); zeros for a key with no transactions."""
+        i = self.ids.get(key)
+        return (0, 0) if i is None else (self.count[i], self.volume[i])
+
+    def clear(self):
+        # In place: the hot loop in TxnAggregates.add_many holds on to these arrays
+        zeros = array("q", bytes(8 * len(self.count)))
+        self.count[:] = zeros
+        self.volume[:] = zeros
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class TxnAggregates:
+    """Today's transaction totals. Events are (device, merchant, region, "YYYY-MM-DD HH:MM:SS", paise)."""
+
+    def __init__(self):
+        self.day = None             # "YYYY-MM-DD" of the events being counted; a later day starts afresh
+        self.count = 0
+        self.volume = 0             # paise
+        self.late = 0               # events from an earlier day (ignored)
+        self.regions = KeyedCounters()
+        self.merchants = KeyedCounters()
+        self.devices = KeyedCounters()
+        self.hourly_count = array("q")   # region id * HOURS + hour
+        self.hourly_volume = array("q")
+
+    def seed(self, region, count, volume):
+        """Starting totals for a region (e.g. loaded from disk) — not attributed to any hour."""
+        r = self._region(region)
+        self.regions.count[r] += count
+        self.regions.volume[r] += volume
+        self.count += count
+        self.volume += volume
+
+    def _region(self, region):
+        r = self.regions.slot(region)
+        while len(self.hourly_count) < (r + 1) * HOURS:
+            self.hourly_count.extend([0] * HOURS)
+            self.hourly_volume.extend([0] * HOURS)
+        return r
+
+    def roll(self, day):
+        self.day = day
+        self.count = self.volume = 0
+        for counters in (self.regions, self.merchants, self.devices):
+            counters.clear()
+        zeros = array("q", bytes(8 * len(self.hourly_count)))
+        self.hourly_count[:] = zeros
+        self.hourly_volume[:] = zeros
+
+    def add_many(self, events):
+        """Fold events in; returns (regions touched, True if a new day reset the totals)."""
+        rolled = False
+        touched = set()
+        regions, merchants, devices = self.regions, self.merchants, self.devices
+        region_ids, merchant_ids, device_ids = regions.ids, merchants.ids, devices.ids
+        rc, rv, mc, mv, dc, dv = regions.count, regions.volume, merchants.count, merchants.volume, devices.count, devices.volume
+        hc, hv = self.hourly_count, self.hourly_volume
+        day, count, volume = self.day, 0, 0
+        for did, mid, region, ts, paise in events:
+            if not ts.startswith(day or "-"):
+                if day is None:             # first event: seeded totals are taken to be from its day
+                    day = self.day = ts[:10]
+                elif ts[:10] < day:
+                    self.late += 1
+                    continue
+                else:
+                    self.roll(ts[:10])
+                    day, count, volume, rolled = self.day, 0, 0, True
+                    touched.clear()
+            r = region_ids.get(region)
+            if r is None:
+                r = self._region(region)
+            m = merchant_ids.get(mid)
+            if m is None:
+                m = merchants.slot(mid)
+            d = device_ids.get(did)
+            if d is None:
+                d = devices.slot(did)
+            h = r * HOURS + int(ts[11:13])
+            rc[r] += 1
+            rv[r] += paise
+            mc[m] += 1
+            mv[m] += paise
+            dc[d] += 1
+            dv[d] += paise
+            hc[h] += 1
+            hv[h] += paise
+            count += 1
+            volume += paise
+            touched.add(region)
+        self.count += count
+        self.volume += volume
+        return touched, rolled
+
+    # ── O(1) reads ──
+
+    def region(self, region):
+        return self.regions.get(region)
+
+    def merchant(self, mid):
+        return self.merchants.get(mid)
+
+    def device(self, did):
+        return self.devices.get(did)
+
+    def hourly(self, region):
+        """[(count, volume in paise)] for hours 0-23 of today."""
+        r = self.regions.ids.get(region)
+        if r is None:
+            return [(0, 0)] * HOURS
+        base = r * HOURS
+        return list(zip(self.hourly_count[base:base + HOURS], self.hourly_volume[base:base + HOURS]))
+
+
+# ── Parsing ──
+
+def normalize_ts(ts):
+    """"YYYY-MM-DD HH:MM:SS" from an ISO-8601 string or epoch seconds; None if unusable."""
+    if isinstance(ts, (int, float)):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+    if isinstance(ts, str) and len(ts) >= 16 and ts[4] == "-" and ts[13] == ":" and ts[11:13].isdigit():
+        return ts[:10] + " " + ts[11:19] if int(ts[11:13]) < HOURS else None
+    return None
+
+
+def _date(day):
+    """The date "YYYY-MM-DD" names; None for anything else (other ISO forms compare wrongly as strings)."""
+    try:
+        date = datetime.date.fromisoformat(day)
+    except ValueError:
+        return None
+    return date if date.isoformat() == day else None
+
+
+class TxnIngestor:
+    """Parses NDJSON transaction lines and applies them to a FleetStore in batches."""
+
+    def __init__(self, store):
+        self.store = store
+        self.accepted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()    # chunks from several sources are applied one at a time
+        self._days = {}                  # "YYYY-MM-DD" -> date, or None if it isn't one
+
+    def feed(self, data: bytes) -> bytes:
+        """Ingest every complete line in `data`; returns the unterminated tail for the next call."""
+        lines = data.split(b"\n")
+        tail = lines.pop()
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            self.ingest_lines(lines)
+        return tail
+
+    def ingest_lines(self, lines):
+        try:
+            objects = json.loads(b"[" + b",".join(lines) + b"]")  # one parse per chunk
+        except ValueError:
+            objects = []
+            for line in lines:
+                try:
+                    objects.append(json.loads(line))
+                except ValueError:
+                    self.rejected += 1
+        devices, days = self.store.devices, self._days
+        latest = datetime.date.today() + datetime.timedelta(days=MAX_FUTURE_DAYS)
+        events, telemetry = [], []
+        for obj in objects:
+            try:
+                if "amount" not in obj:
+                    telemetry.append(self._telemetry(obj))
+                    continue
+                did = obj["device"]
+                amount = float(obj["amount"])
+                if not math.isfinite(amount):
+                    raise ValueError(amount)
+                paise = round(amount * 100)
+                ts = obj["ts"]
+                if type(ts) is str and len(ts) >= 19 and ts[13] == ":" and ts[11:13].isdigit() and ts[11:13] < "24":
+                    ts = ts[:10] + " " + ts[11:19]
+                else:
+                    ts = normalize_ts(ts)
+                d = devices.get(did)
+                mid = obj.get("merchant_id") or d["merchant_id"]
+                region = obj.get("region") or d["region"]
+            except (KeyError, TypeError, ValueError, OverflowError):
+                self.rejected += 1
+                continue
+            if ts is None or not 0 <= paise <= MAX_PAISE:
+                self.rejected += 1
+                continue
+            day = ts[:10]
+            date = days.get(day, False)
+            if date is False:
+                if len(days) >= 1024:   # a feed of junk dates mustn't grow it without bound
+                    days.clear()
+                date = days[day] = _date(day)
+            if date is None or date > latest:
+                self.rejected += 1
+                continue
+            events.append((did, mid, region, ts, paise))
+        if events or telemetry:
+            with self._lock:
+                if events:
+                    self.store.record_transactions(events)
+                if telemetry:
+                    self.store.record_telemetry(telemetry)
+            self.accepted += len(events) + len(telemetry)
+
+    def _telemetry(self, obj):
+        """(did, changes) from a telemetry line; raises ValueError/KeyError/TypeError when unusable."""
+        did = obj["device"]
+        if did not in self.store.devices:
+            raise KeyError(did)
+        changes = {}
+        if "battery" in obj:
+            battery = int(obj["battery"])
+            if not 0 <= battery <= 100:
+                raise ValueError(battery)
+            changes["battery"] = battery
+        if "status" in obj:
+            if obj["status"] not in DEVICE_STATUSES:
+                raise ValueError(obj["status"])
+            changes["status"] = obj["status"]
+        return did, changes
+
+    def stats(self):
+        return {"accepted": self.accepted, "rejected": self.rejected, "late": self.store.txn_stats.late}
+
+    # ── Sources ──
+
+    async def _apply(self, data):
+        # Parsing and folding run off the event loop; awaiting keeps each source's chunks in order
+        return await asyncio.get_running_loop().run_in_executor(None, self.feed, data)
+
+    async def serve(self, host, port, reuse_port=False):
+        """Accept NDJSON over TCP (one or many connections, each a stream of lines)."""
+        async def handle(reader, writer):
+            pending = b""
+            try:
+                while True:
+                    chunk = await reader.read(1 << 16)
+                    if not chunk:
+                        break
+                    pending = await self._apply(pending + chunk)
+                if pending.strip():
+                    await self._apply(pending + b"\n")
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+        return await asyncio.start_server(handle, host, port, reuse_port=reuse_port or None)
+
+    async def tail(self, path, poll_interval=0.2, from_start=False):
+        """Follow a file as lines are appended (reopened from the start if it is truncated or replaced)."""
+        position = None if from_start else (os.path.getsize(path) if os.path.exists(path) else 0)
+        pending = b""
+        inode = None
+        while True:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                await asyncio.sleep(poll_interval)
+                continue
+            if inode != stat.st_ino or position is None or stat.st_size < position:
+                if inode is not None or position is None:
+                    position, pending = 0, b""
+                inode = stat.st_ino
+            if stat.st_size > position:
+                with open(path, "rb") as f:
+                    f.seek(position)
+                    chunk = f.read(1 << 20)
+                position += len(chunk)
+                pending = await self._apply(pending + chunk)
+                continue  # more may be waiting
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Local intent classifier — answers obvious messages in-process, before the LLM.
+
+Two tiers:
+  1. exact phrases / keyword rules (unambiguous wording like "any alerts?")
+  2. TF-IDF nearest-neighbour over labelled examples (the INTENT_PROMPT examples,
+     a hand-written seed set, and labels learned from the LLM at runtime)
+
+`classify()` returns (intent, confidence); callers fall back to Ollama when the
+confidence is below their threshold.
+"""
+
+import math
+import re
+import threading
+from collections import defaultdict, deque
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Whole-message matches (after normalize())
+EXACT = {
+    "devices": "DEVICE_LIST", "device": "DEVICE_LIST", "show devices": "DEVICE_LIST", "terminals": "DEVICE_LIST",
+    "device status": "DEVICE_LIST", "all devices": "DEVICE_LIST",
+    "add device": "DEVICE_ADD", "new device": "DEVICE_ADD",
+    "merchants": "MERCHANT_LIST", "show merchants": "MERCHANT_LIST", "all merchants": "MERCHANT_LIST", "stores": "MERCHANT_LIST",
+    "add merchant": "MERCHANT_ADD", "new merchant": "MERCHANT_ADD",
+    "reports": "REPORTS", "report": "REPORTS", "summary": "REPORTS", "transactions": "REPORTS", "revenue": "REPORTS",
+    "alerts": "ALERTS", "any alerts": "ALERTS", "show alerts": "ALERTS", "warnings": "ALERTS", "notifications": "ALERTS",
+    "mumbai": "MUMBAI", "delhi": "DELHI", "bangalore": "BANGALORE", "chennai": "CHENNAI",
+    "help": "HELP", "faq": "HELP", "menu": "MENU", "main menu": "MENU", "go back": "MENU", "start over": "MENU", "back": "MENU",
+    "hello": "GENERAL", "hi": "GENERAL", "hey": "GENERAL", "thanks": "GENERAL", "thank you": "GENERAL",
+}
+
+# (all of these stems present, intent) — only applied when exactly one rule fires
+KEYWORD_RULES = [
+    ({"add", "device"}, "DEVICE_ADD"), ({"register", "device"}, "DEVICE_ADD"), ({"add", "terminal"}, "DEVICE_ADD"),
+    ({"register", "terminal"}, "DEVICE_ADD"),
+    ({"add", "merchant"}, "MERCHANT_ADD"), ({"onboard", "merchant"}, "MERCHANT_ADD"), ({"onboard"}, "MERCHANT_ADD"),
+    ({"create", "merchant"}, "MERCHANT_ADD"), ({"create", "store"}, "MERCHANT_ADD"),
+    ({"reset"}, "FAQ_RESET"), ({"factory"}, "FAQ_RESET"),
+    ({"settlement"}, "FAQ_SETTLEMENT"), ({"settle"}, "FAQ_SETTLEMENT"),
+    ({"paper"}, "FAQ_PAPER"),
+    ({"connectivity"}, "FAQ_CONNECTIVITY"), ({"wifi"}, "FAQ_CONNECTIVITY"), ({"network"}, "FAQ_CONNECTIVITY"),
+    ({"alert"}, "ALERTS"), ({"warning"}, "ALERTS"),
+    ({"problem"}, "HELP"), ({"troubleshoot"}, "HELP"),
+    ({"mumbai"}, "MUMBAI"), ({"delhi"}, "DELHI"), ({"bangalore"}, "BANGALORE"), ({"chennai"}, "CHENNAI"),
+]
+
+# Word prefixes that make a message an open question (comparison/analysis) for the LLM
+GENERAL_MARKERS = ("compar", "versus", "vs", "why", "analys", "analyz", "trend", "better", "worse", "best", "worst", "most", "least")
+
+# Words an intent's examples must share with a message for it to count (or all of one example's words)
+MIN_SHARED_WORDS = 2
+
+# Carry no intent signal on their own ("show me the ...", "list my ...")
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "we", "our", "us", "you", "your", "is", "are", "am", "be", "do", "does",
+    "to", "of", "for", "on", "at", "with", "and", "or", "please", "can", "could", "would", "want", "need",
+    "show", "list", "view", "see", "get", "give", "tell", "what", "whats", "where", "there", "any", "all", "it", "this", "that",
+}
+
+SEED_EXAMPLES = [
+    # From INTENT_PROMPT
+    ("i want to add a device", "DEVICE_ADD"), ("show all merchants", "MERCHANT_LIST"),
+    ("add a new merchant", "MERCHANT_ADD"), ("how is mumbai doing", "MUMBAI"), ("any alerts?", "ALERTS"),
+    ("compare two cities", "GENERAL"), ("hello", "GENERAL"), ("what is settlement process", "FAQ_SETTLEMENT"),
+    # Hand-written seeds, a few per intent
+    ("show me my devices", "DEVICE_LIST"), ("check device status", "DEVICE_LIST"), ("list all terminals", "DEVICE_LIST"),
+    ("which devices are offline", "DEVICE_LIST"), ("battery level of terminals", "DEVICE_LIST"), ("view pos devices", "DEVICE_LIST"),
+    ("register a new terminal", "DEVICE_ADD"), ("add pos device", "DEVICE_ADD"), ("i need to set up a new device", "DEVICE_ADD"),
+    ("list merchants", "MERCHANT_LIST"), ("view stores", "MERCHANT_LIST"), ("show shops", "MERCHANT_LIST"),
+    ("who are our merchants", "MERCHANT_LIST"),
+    ("onboard a merchant", "MERCHANT_ADD"), ("create merchant account", "MERCHANT_ADD"), ("sign up a new store", "MERCHANT_ADD"),
+    ("show reports", "REPORTS"), ("today's transactions", "REPORTS"), ("revenue summary", "REPORTS"),
+    ("transaction analytics", "REPORTS"), ("daily sales report", "REPORTS"), ("how much volume today", "REPORTS"),
+    ("mumbai report", "MUMBAI"), ("devices in mumbai", "MUMBAI"), ("how is delhi doing", "DELHI"), ("delhi report", "DELHI"),
+    ("devices in delhi", "DELHI"), ("how is bangalore doing", "BANGALORE"), ("bangalore report", "BANGALORE"),
+    ("devices in bangalore", "BANGALORE"), ("how is chennai doing", "CHENNAI"), ("chennai report", "CHENNAI"),
+    ("devices in chennai", "CHENNAI"),
+    ("show alerts", "ALERTS"), ("any warnings", "ALERTS"), ("notifications please", "ALERTS"), ("what alerts are active", "ALERTS"),
+    ("how do i reset a device", "FAQ_RESET"), ("factory reset terminal", "FAQ_RESET"), ("reboot pos", "FAQ_RESET"),
+    ("when does settlement happen", "FAQ_SETTLEMENT"), ("settlement timing", "FAQ_SETTLEMENT"),
+    ("paper roll size", "FAQ_PAPER"), ("where to order paper rolls", "FAQ_PAPER"), ("receipt paper", "FAQ_PAPER"),
+    ("device not connecting to wifi", "FAQ_CONNECTIVITY"), ("network issues", "FAQ_CONNECTIVITY"),
+    ("4g sim connectivity", "FAQ_CONNECTIVITY"),
+    ("help", "HELP"), ("i need help", "HELP"), ("troubleshooting", "HELP"), ("something is not working", "HELP"),
+    ("main menu", "MENU"), ("go back", "MENU"), ("start over", "MENU"), ("take me home", "MENU"),
+    ("hi there", "GENERAL"), ("good morning", "GENERAL"), ("thank you", "GENERAL"), ("which city has the most revenue", "GENERAL"),
+    ("compare mumbai and delhi", "GENERAL"), ("why is volume down", "GENERAL"), ("analyse the fleet", "GENERAL"),
+    ("what can you do", "GENERAL"), ("tell me a joke", "GENERAL"), ("what about its battery", "GENERAL"),
+    ("is it online", "GENERAL"),
+]
+
+
+def normalize(message: str) -> str:
+    return " ".join(TOKEN_RE.findall(message.lower()))
+
+
+def _stem(token):
+    return token[:-1] if len(token) > 3 and token.endswith("s") else token
+
+
+def _features(message):
+    # Single letters are split-off contractions ("what's" -> "what", "s"), not words
+    stems = [_stem(t) for t in TOKEN_RE.findall(message.lower()) if len(t) > 1 and t not in STOPWORDS]
+    return stems + [f"{a}_{b}" for a, b in zip(stems, stems[1:])]
+
+
+class LocalIntentClassifier:
+    """Keyword table + TF-IDF nearest neighbour. `learn()` grows the labelled set (bounded).
+
+    The index is updated in place: learning or evicting a label touches only that
+    example's postings and document frequencies, and IDF is read from the live counts.
+    Example norms are computed when an example is added and refreshed for all of them
+    once the set has changed by a quarter, so that pass stays amortised O(1) per label.
+    """
+
+    def __init__(self, examples=SEED_EXAMPLES, max_examples=5000):
+        self.seed = list(examples)
+        self.learned = deque()          # (normalized text, intent, example id), oldest first
+        self.max_examples = max_examples
+        self._lock = threading.Lock()   # learn() runs on the event loop, classify() on executor threads too
+        self.rebuild()
+
+    def rebuild(self):
+        """Index the seed examples and learned labels from scratch."""
+        with self._lock:
+            self._postings = defaultdict(set)   # term -> example ids
+            self._df = defaultdict(int)         # term -> examples containing it
+            self._features = {}                 # example id -> feature set
+            self._words = {}                    # example id -> words in it (features that aren't bigrams)
+            self._labels = {}                   # example id -> intent
+            self._norms = {}                    # example id -> TF-IDF vector norm
+            self._keys = set()                  # normalized texts learned
+            self._next_id = 0
+            for text, label in self.seed:
+                self._add(text, label)
+            for i, (text, label, _) in enumerate(self.learned):
+                self.learned[i] = (text, label, self._add(text, label))
+                self._keys.add(text)
+            self._refresh_norms()
+
+    def _add(self, text, label):
+        doc = self._next_id
+        self._next_id += 1
+        features = set(_features(text))
+        self._features[doc] = features
+        self._words[doc] = sum("_" not in term for term in features)
+        self._labels[doc] = label
+        for term in features:
+            self._postings[term].add(doc)
+            self._df[term] += 1
+        self._norms[doc] = self._norm(features)
+        return doc
+
+    def _remove(self, doc):
+        for term in self._features.pop(doc):
+            self._postings[term].discard(doc)
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term], self._postings[term]
+        del self._labels[doc], self._norms[doc], self._words[doc]
+
+    def _idf(self, term):
+        return math.log((1 + len(self._labels)) / (1 + self._df[term])) + 1
+
+    def _norm(self, features):
+        return math.sqrt(sum(self._idf(t) ** 2 for t in features if t in self._df)) or 1.0
+
+    def _refresh_norms(self):
+        for doc, features in self._features.items():
+            self._norms[doc] = self._norm(features)
+        self._stale = 0   # examples added or removed since the norms were computed
+
+    def learn(self, message: str, intent: str):
+        key = normalize(message)
+        with self._lock:
+            if not key or key in self._keys:
+                return
+            self._keys.add(key)
+            self.learned.append((key, intent, self._add(key, intent)))
+            self._stale += 1
+            if len(self.learned) > self.max_examples:
+                text, _, doc = self.learned.popleft()
+                self._keys.discard(text)
+                self._remove(doc)
+                self._stale += 1
+            if self._stale > max(64, len(self._labels) // 4):
+                self._refresh_norms()
+
+    def forget(self):
+        """Drop every learned label, keeping the seed examples."""
+        self.learned.clear()
+        self.rebuild()
+
+    def classify(self, message: str):
+        """Return (intent, confidence in [0, 1])."""
+        key = normalize(message)
+        if key in EXACT:
+            return EXACT[key], 1.0
+
+        tokens = key.split()
+        if any(t.startswith(GENERAL_MARKERS) for t in tokens):
+            return "GENERAL", 0.8
+
+        stems = {_stem(t) for t in tokens}
+        hits = {intent for required, intent in KEYWORD_RULES if required <= stems}
+        if len(hits) == 1:
+            return hits.pop(), 0.9
+
+        return self._nearest(key)
+
+    def _nearest(self, key):
+        query = set(_features(key))
+        with self._lock:
+            weights = {t: self._idf(t) for t in query if t in self._df}
+            if not weights:
+                return "GENERAL", 0.0
+            qnorm = math.sqrt(sum(w * w for w in weights.values()))
+            norms, labels, words = self._norms, self._labels, self._words
+            scores = defaultdict(float)
+            shared = defaultdict(int)           # example id -> words it shares with the message
+            evidence = defaultdict(set)         # intent -> message words found in its examples
+            for term, w in weights.items():
+                word = "_" not in term
+                for i in self._postings[term]:
+                    scores[i] += w * w
+                    if word:
+                        shared[i] += 1
+                        evidence[labels[i]].add(term)
+            best = {}
+            for i, dot in scores.items():
+                # One shared word ("order", "pos") is no evidence, unless it is all the example says
+                if len(evidence[labels[i]]) < MIN_SHARED_WORDS and shared[i] < words[i]:
+                    continue
+                sim = dot / (qnorm * norms[i])
+                if sim > best.get(labels[i], 0.0):
+                    best[labels[i]] = sim
+        if not best:
+            return "GENERAL", 0.0
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        intent, top = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        # Penalise near-ties between intents
+        return intent, max(0.0, top - 0.5 * runner_up)
+
+
+classifier = LocalIntentClassifier()
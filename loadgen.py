@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Load generator for the chat protocol — many WebSocket clients replaying scripted journeys.
+
+By default it starts its own target: fake_ollama.py with the configured
+latency, and run.py (in-memory store) pointed at it through OLLAMA_HOST.
+Use --url to load a server that is already running instead.
+
+    python3 loadgen.py --clients 2000 --duration 60 --llm-latency 1.5 --json results.json
+    python3 loadgen.py --compare before.json after.json
+
+Each client connects, then loops: pick a journey (weighted), run its steps
+with think time between them, and time every step from send to the reply
+(the first message that isn't `typing` or a streamed `delta`).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import websockets
+
+from metrics import percentile
+from server import DEVICES, TRANSACTIONS_DAILY
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ── Journeys: generators of (action, button_data, text) ──
+
+
+def journey_browse(c):
+    yield "device_status", "device_status", ""
+    yield "view_all_devices", "view_all_devices", ""
+    yield "device_detail", f"device_detail_{c.rng.choice(list(DEVICES))}", ""
+    yield "menu", "menu", ""
+
+
+def journey_search(c):
+    yield "search_device", "search_device", ""
+    yield "search_submit", None, c.rng.choice([*DEVICES, "POS-0000"])
+
+
+def journey_reports(c):
+    yield "reports", "reports", ""
+    yield "daily_summary", "daily_summary", ""
+    yield "region_report", f"region_report_{c.rng.choice(list(TRANSACTIONS_DAILY))}", ""
+
+
+def journey_alerts(c):
+    yield "alerts", "alerts", ""
+    yield "help", "help", ""
+    yield "faq", "faq_settlement", ""
+
+
+def journey_onboard(c):
+    yield "merchants", "merchants", ""
+    yield "add_merchant", "add_merchant", ""
+    c.seq += 1
+    form = {"name": f"Load Shop {c.cid}-{c.seq}", "category": "Retail", "region": "Delhi",
+            "contact": "Load Test", "phone": "+91-00000-00000"}
+    yield "form_submit_merchant", "form_submit_merchant", json.dumps(form)
+    yield "view_all_merchants", "view_all_merchants", ""
+
+
+def journey_add_device(c):
+    yield "add_device", "add_device", ""
+    c.seq += 1
+    form = {"device_id": f"POS-L{c.cid:05d}{c.seq:04d}", "name": "Load Counter", "merchant": "MER-001",
+            "region": "Mumbai", "model": "PAX A920"}
+    yield "form_submit_device", "form_submit_device", json.dumps(form)
+
+
+def journey_free_text(c):
+    # Local classifier routes these without the LLM
+    yield "text_local", None, c.rng.choice(["show me my devices", "any alerts?", "settlement timing"])
+    # Open questions go to the (stub) LLM; the suffix defeats the answer cache
+    yield "text_llm", None, f"compare mumbai and delhi for week {c.rng.randrange(10**9)}"
+
+
+JOURNEYS = {
+    "browse": (journey_browse, 30), "search": (journey_search, 15), "reports": (journey_reports, 15),
+    "alerts": (journey_alerts, 10), "onboard": (journey_onboard, 5), "add_device": (journey_add_device, 5),
+    "free_text": (journey_free_text, 20),
+}
+
+
+class ClientContext:
+    __slots__ = ("cid", "rng", "seq")
+
+    def __init__(self, cid, seed):
+        self.cid = cid
+        self.rng = random.Random(seed * 100_003 + cid)
+        self.seq = 0
+
+
+# ── Stats ──
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}   # action -> [seconds]
+        self.errors = {}      # action -> count
+        self.bytes = 0
+
+    def record(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+    def error(self, action):
+        self.errors[action] = self.errors.get(action, 0) + 1
+
+    def summary(self, duration):
+        actions = {}
+        for action in sorted(set(self.latencies) | set(self.errors)):
+            lat = self.latencies.get(action, [])
+            actions[action] = {
+                "count": len(lat), "errors": self.errors.get(action, 0), "rps": round(len(lat) / duration, 2),
+                **{f"p{p}_ms": round(percentile(lat, p) * 1000, 3) for p in (50, 95, 99)},
+                "max_ms": round(max(lat, default=0.0) * 1000, 3),
+            }
+        total = sum(a["count"] for name, a in actions.items() if name != "connect")
+        return {"requests": total, "errors": sum(self.errors.values()), "rps": round(total / duration, 2),
+                "bytes_received": self.bytes}, actions
+
+
+# ── Clients ──
+
+async def reply(ws, stats):
+    while True:
+        raw = await ws.recv()
+        stats.bytes += len(raw)
+        msg = json.loads(raw)
+        if msg.get("type") not in ("typing", "delta"):
+            return msg
+
+
+async def request(ws, stats, button, text, timeout):
+    await ws.send(json.dumps({"text": text, "button_data": button} if button else {"text": text}))
+    return await asyncio.wait_for(reply(ws, stats), timeout)
+
+
+async def connect(args, stats):
+    t0 = time.perf_counter()
+    try:
+        ws = await websockets.connect(args.url, open_timeout=args.timeout, max_size=None)
+        await ws.recv()   # welcome menu
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+        stats.error("connect")
+        return None
+    stats.record("connect", time.perf_counter() - t0)
+    return ws
+
+
+async def client(cid, args, deadline, stats, journeys, weights):
+    ctx = ClientContext(cid, args.seed)
+    await asyncio.sleep(ctx.rng.uniform(0, args.ramp))
+    ws = await connect(args, stats)
+    try:
+        while ws is not None and time.monotonic() < deadline:
+            journey = ctx.rng.choices(journeys, weights)[0]
+            for action, button, text in JOURNEYS[journey][0](ctx):
+                if args.think:
+                    await asyncio.sleep(args.think * ctx.rng.uniform(0.5, 1.5))
+                if time.monotonic() >= deadline:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    msg = await request(ws, stats, button, text, args.timeout)
+                except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+                    # A late reply would be read as the next step's — start over on a fresh socket
+                    stats.error(action)
+                    await ws.close()
+                    ws = await connect(args, stats)
+                    break
+                if str(msg.get("content", "")).startswith(("⚠️ Error", "⏳")):  # error, or throttled / shed
+                    stats.error(action)
+                else:
+                    stats.record(action, time.perf_counter() - t0)
+    finally:
+        if ws is not None:
+            await ws.close()
+
+
+async def run_load(args):
+    mix = dict(JOURNEYS)
+    if args.mix:
+        weights = dict((name, float(w)) for name, w in (part.split("=") for part in args.mix.split(",")))
+        mix = {name: (fn, weights.get(name, 0)) for name, (fn, _) in JOURNEYS.items()}
+    journeys = [name for name, (_, w) in mix.items() if w > 0]
+    weights = [mix[name][1] for name in journeys]
+    stats = Stats()
+    deadline = time.monotonic() + args.ramp + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(cid, args, deadline, stats, journeys, weights) for cid in range(args.clients)))
+    return stats, time.perf_counter() - started
+
+
+# ── Target processes ──
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"nothing listening on port {port} after {timeout:.0f}s")
+
+
+def start_target(args):
+    """fake_ollama.py + run.py on free ports; returns (url, processes)."""
+    ollama_port, port = free_port(), free_port()
+    quiet = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "cwd": HERE}
+    ollama = subprocess.Popen([sys.executable, "fake_ollama.py", "--port", str(ollama_port),
+                               "--latency", str(args.llm_latency), "--token-delay", str(args.token_delay)], **quiet)
+    wait_for_port(ollama_port)
+    env = dict(os.environ, POS_DB="", POS_PORT=str(port), POS_WORKERS=str(args.workers),
+               OLLAMA_HOST=f"127.0.0.1:{ollama_port}")
+    if args.workers > 1:
+        env["POS_DB"] = os.path.join(tempfile.mkdtemp(), "fleet.db")   # workers share state through it
+    server = subprocess.Popen([sys.executable, "run.py"], env=env, **quiet)
+    wait_for_port(port)
+    return f"ws://127.0.0.1:{port}", [server, ollama], env["POS_DB"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ── Reporting ──
+
+def print_report(totals, actions):
+    print(f"{'action':<22}{'count':>8}{'err':>6}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, a in actions.items():
+        print(f"{name:<22}{a['count']:>8}{a['errors']:>6}{a['rps']:>9.1f}"
+              f"{a['p50_ms']:>10.2f}{a['p95_ms']:>10.2f}{a['p99_ms']:>10.2f}{a['max_ms']:>10.2f}")
+    print(f"total: {totals['requests']:,} requests, {totals['errors']:,} errors, {totals['rps']:,.1f} req/s, "
+          f"{totals['bytes_received'] / 1e6:.1f}MB received")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('commit')} → {after['meta'].get('commit')}")
+    print(f"{'action':<22}{'p50 ms':>18}{'p99 ms':>22}{'rps':>20}")
+    for name in sorted(set(before["actions"]) | set(after["actions"])):
+        a, b = before["actions"].get(name), after["actions"].get(name)
+        if not (a and b):
+            print(f"{name:<22}  only in {'after' if b else 'before'}")
+            continue
+        print(f"{name:<22}{a['p50_ms']:>8.2f} → {b['p50_ms']:<7.2f}{a['p99_ms']:>10.2f} → {b['p99_ms']:<9.2f}"
+              f"{a['rps']:>8.1f} → {b['rps']:<8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", help="WebSocket URL of a running server (default: start run.py + fake Ollama)")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of steady load after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which clients connect")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between a client's steps (0 = none)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a step counts as an error")
+    parser.add_argument("--mix", help="journey weights, e.g. browse=3,free_text=1 (" + ", ".join(JOURNEYS) + ")")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="fake Ollama seconds before first token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="fake Ollama seconds between tokens")
+    parser.add_argument("--workers", type=int, default=1, help="POS_WORKERS for the started server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results here (machine-readable, for comparing runs)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two --json result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    procs, db = [], None
+    if not args.url:
+        args.url, procs, db = start_target(args)
+    print(f"{args.clients:,} clients → {args.url} for {args.duration:.0f}s (+{args.ramp:.0f}s ramp), "
+          f"think {args.think}s, LLM latency {args.llm_latency}s", flush=True)
+    try:
+        stats, elapsed = asyncio.run(run_load(args))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        if db:
+            shutil.rmtree(os.path.dirname(db), ignore_errors=True)
+
+    totals, actions = stats.summary(args.duration)
+    print_report(totals, actions)
+    if args.json:
+        result = {"meta": {"commit": git_commit(), "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                           "elapsed_s": round(elapsed, 2), "args": vars(args)},
+                  "totals": totals, "actions": actions}
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Prometheus-format metrics and per-stage timing spans — stdlib only.
+
+    with span("classify"):
+        ...
+
+records the stage's duration in the `pos_stage_seconds` histogram and, when
+a message trace is active (see `trace()`), in that message's stage timings,
+so one slow message can be broken down in the log. `render()` produces the
+text exposition format served at /metrics.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels[n] for n in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]  # per-bucket, sum, count
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        names = self.label_names + ("le",)
+        with self._lock:
+            items = [(key, list(counts), total, n) for key, (counts, total, n) in sorted(self._values.items())]
+        for key, counts, total, n in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Callback(Metric):
+    """Read at scrape time: `fn()` returns {label values tuple: number}."""
+
+    def __init__(self, name, help, kind, fn, labels=()):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        self._values = self.fn()
+        return super().render()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+MESSAGES = REGISTRY.register(Counter("pos_messages_total", "Chat messages handled", ["action"]))
+MESSAGE_SECONDS = REGISTRY.register(Histogram("pos_message_seconds", "Receive to last reply frame sent", ["action"]))
+STAGE_SECONDS = REGISTRY.register(Histogram("pos_stage_seconds", "Time spent per processing stage", ["stage"]))
+INTENTS = REGISTRY.register(Counter("pos_intents_total", "Free-text messages by classified intent", ["intent"]))
+ERRORS = REGISTRY.register(Counter("pos_errors_total", "Errors while handling chat traffic", ["where"]))
+ADMISSION = REGISTRY.register(Counter("pos_admission_total", "Messages refused or cut short by admission control", ["outcome"]))
+CONNECTIONS = REGISTRY.register(Gauge("pos_ws_connections", "Open WebSocket connections"))
+CONNECTS = REGISTRY.register(Counter("pos_ws_connections_total", "WebSocket connections accepted"))
+
+
+# ── Spans ──
+
+_trace = contextvars.ContextVar("pos_trace", default=None)
+
+
+@contextlib.contextmanager
+def trace():
+    """Collect this message's stage timings: yields {stage: seconds}."""
+    stages = {}
+    token = _trace.set(stages)
+    try:
+        yield stages
+    finally:
+        _trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        stages = _trace.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+def percentile(values, p):
+    """The `p`th percentile of `values` (nearest rank), 0.0 when empty — for benchmark reports."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""Asyncio Ollama client — keep-alive connection pool + prioritised request dispatch.
+
+Same prompts and parsing as ollama_client, but awaited directly from the event
+loop instead of tying up executor threads with blocking urllib calls. When many
+operators ask at once the dispatcher keeps the local model's queue short:
+
+  single-flight   identical in-flight classifications/answers share one request
+  micro-batching  LLM classifications arriving within `batch_window` go out as
+                  one numbered multi-message prompt
+  priorities      intent requests jump ahead of queued answer generations, and
+                  answers never hold the last request slot
+  cancellation    a request whose callers have all gone (their chat closed or
+                  moved on) is abandoned, closing its connection so Ollama stops
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+from urllib.parse import urlsplit
+
+from intent_classifier import normalize
+from ollama_client import (OLLAMA_URL, OLLAMA_TAGS_URL, intent_payload, batch_intent_payload, reply_intent,
+                           parse_batch_intents, answer_payload, health, local_intent, learn_intent,
+                           intent_cache, answer_cache, answer_key)
+
+# Request priorities — lower goes first
+PRIORITY_INTENT, PRIORITY_ANSWER = 0, 1
+
+
+class PriorityGate:
+    """Semaphore whose waiters are served lowest priority value first (FIFO within one).
+
+    `reserved` slots are kept for priority 0: lower-priority work waits rather than
+    take them, so a burst of long generations can't block a quick classification.
+    """
+
+    def __init__(self, slots, reserved=0):
+        self.free = slots
+        self.reserved = reserved
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    def _allowed(self, priority):
+        return self.free > (self.reserved if priority else 0)
+
+    async def acquire(self, priority):
+        if self._allowed(priority) and (not self._waiters or self._waiters[0][0] > priority):
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed over just as we were cancelled
+            raise
+
+    def release(self):
+        self.free += 1
+        self._wake()
+
+    def _wake(self):
+        waiters = self._waiters
+        while waiters:
+            priority, _, future = waiters[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(waiters)
+            elif self._allowed(priority):
+                heapq.heappop(waiters)
+                self.free -= 1
+                future.set_result(None)
+            else:
+                break
+
+    def waiting(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+
+class AsyncOllama:
+    """Minimal HTTP/1.1 client for the Ollama API.
+
+    Idle connections are kept open and reused (keep-alive); at most
+    `max_concurrency` requests are in flight at once, the rest queue by priority.
+    `batch_window=0` turns classification batching off.
+    """
+
+    def __init__(self, url=OLLAMA_URL, max_concurrency=4, max_idle=4, connect_timeout=3,
+                 batch_window=0.005, max_batch=8):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.generate_path = parts.path or "/api/generate"
+        self.tags_path = urlsplit(OLLAMA_TAGS_URL).path
+        self.max_concurrency = max_concurrency
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._idle = []
+        self._gate = PriorityGate(max_concurrency, reserved=1 if max_concurrency > 1 else 0)
+        self._inflight = {}     # single-flight key -> task computing the shared result
+        self._waiting = {}      # in-flight task -> callers awaiting it
+        self._batch = []        # (message, future) waiting for the batch window to close
+        self._batch_timer = None
+        self._tasks = set()     # batch requests in progress (keeps them referenced)
+        self.coalesced = 0      # callers that shared another caller's request
+        self.batches = 0        # multi-message classification requests sent
+        self.batched = 0        # messages classified by them
+        self.prompt_tokens = 0  # prompt tokens Ollama evaluated (not served from its cache) …
+        self.prompt_seconds = 0.0  # … and the time it spent on them
+
+    # ── Connection pool ──
+
+    async def _acquire(self):
+        """Return (reader, writer, reused)."""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        return reader, writer, False
+
+    def _release(self, reader, writer, reusable):
+        if reusable and len(self._idle) < self.max_idle:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    # ── HTTP/1.1 ──
+
+    async def _send(self, writer, method, path, payload):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: keep-alive\r\n"
+        if payload is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    async def _read_head(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return status, headers
+
+    async def _iter_body(self, reader, headers, timeout):
+        """Yield raw body pieces as they arrive (chunked or Content-Length framing)."""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size_line.split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass  # trailers
+                    return
+                data = await asyncio.wait_for(reader.readexactly(size), timeout)
+                await reader.readexactly(2)
+                yield data
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length:
+                yield await asyncio.wait_for(reader.readexactly(length), timeout)
+        else:
+            while True:
+                data = await asyncio.wait_for(reader.read(65536), timeout)
+                if not data:
+                    return
+                yield data
+
+    @staticmethod
+    def _keep_alive(headers):
+        framed = "content-length" in headers or headers.get("transfer-encoding", "").lower() == "chunked"
+        return framed and headers.get("connection", "").lower() != "close"
+
+    async def _request(self, method, path, payload, timeout, priority=PRIORITY_INTENT):
+        """Send one request and return (status, body). Retries once if a pooled connection went stale."""
+        await self._gate.acquire(priority)
+        try:
+            for attempt in (0, 1):
+                reader, writer, reused = await self._acquire()
+                try:
+                    await self._send(writer, method, path, payload)
+                    status, headers = await asyncio.wait_for(self._read_head(reader), timeout)
+                    body = b"".join([piece async for piece in self._iter_body(reader, headers, timeout)])
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise ConnectionError(str(e)) from e
+                except BaseException:
+                    writer.close()
+                    raise
+                self._release(reader, writer, self._keep_alive(headers))
+                return status, body
+        finally:
+            self._gate.release()
+
+    async def _stream_lines(self, path, payload, timeout, priority=PRIORITY_ANSWER):
+        """Yield decoded NDJSON objects from a streaming response."""
+        await self._gate.acquire(priority)
+        try:
+            reader, writer, reused = await self._acquire()
+            reusable = False
+            try:
+                try:
+                    await self._send(writer, "POST", path, payload)
+                    status, headers = await asyncio.wait_for(self._read_head(reader), timeout)
+                except ConnectionError:
+                    if not reused:
+                        raise
+                    writer.close()
+                    reader, writer, _ = await self._acquire()
+                    await self._send(writer, "POST", path, payload)
+                    status, headers = await asyncio.wait_for(self._read_head(reader), timeout)
+                if status != 200:
+                    raise ConnectionError(f"HTTP {status}")
+                buf = b""
+                async for piece in self._iter_body(reader, headers, timeout):
+                    buf += piece
+                    *lines, buf = buf.split(b"\n")
+                    for line in lines:
+                        if line.strip():
+                            yield json.loads(line.decode("utf-8"))
+                if buf.strip():
+                    yield json.loads(buf.decode("utf-8"))
+                reusable = self._keep_alive(headers)
+            finally:
+                # A consumer that stops early leaves unread bytes on the socket — don't reuse it
+                self._release(reader, writer, reusable)
+        finally:
+            self._gate.release()
+
+    # ── Dispatch ──
+
+    def _join(self, key, start):
+        """The in-flight task for `key` (None: not shared), run as `start()` if there is none; counts the caller."""
+        task = self._inflight.get(key) if key is not None else None
+        if task is None:
+            task = asyncio.ensure_future(start())
+            if key is not None:
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key) if self._inflight.get(key) is task else None)
+        else:
+            self.coalesced += 1
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        return task
+
+    def _leave(self, task):
+        waiting = self._waiting.pop(task) - 1
+        if waiting:
+            self._waiting[task] = waiting
+        elif not task.done():
+            task.cancel()  # nobody wants the result any more: Ollama is told to stop (its connection is closed)
+
+    async def _single_flight(self, key, start):
+        """Await the in-flight request for `key`, or run `start()` as it if there is none."""
+        task = self._join(key, start)
+        try:
+            # Shielded: one caller going away mustn't cancel the request the others are waiting on
+            return await asyncio.shield(task)
+        finally:
+            self._leave(task)
+
+    async def _batched_intent(self, message):
+        if self.batch_window <= 0:
+            return await self.llm_classify_intent(message)
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((message, future))
+        if len(self._batch) >= self.max_batch:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush_batch)
+        return await future
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.ensure_future(self._classify_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _classify_batch(self, batch):
+        messages = [message for message, _ in batch]
+        try:
+            if len(messages) == 1:
+                intents = [await self.llm_classify_intent(messages[0])]
+            else:
+                intents = await self.llm_classify_batch(messages)
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        for (_, future), intent in zip(batch, intents):
+            if not future.done():
+                future.set_result(intent)
+
+    def _count_eval(self, result):
+        self.prompt_tokens += result.get("prompt_eval_count", 0)
+        self.prompt_seconds += result.get("prompt_eval_duration", 0) / 1e9
+
+    def dispatch_stats(self) -> dict:
+        return {"coalesced": self.coalesced, "batches": self.batches, "batched": self.batched,
+                "queued": self._gate.waiting(), "inflight": len(self._inflight)}
+
+    # ── Ollama API ──
+
+    async def is_running(self) -> bool:
+        try:
+            status, _ = await self._request("GET", self.tags_path, None, timeout=3)
+            return status == 200
+        except Exception:
+            return False
+
+    async def classify_intent(self, message: str) -> str:
+        """Classify user message into an intent code — locally if confident, else via the LLM."""
+        key = normalize(message)
+        intent = local_intent(message) or intent_cache.get(key)
+        if intent:
+            return intent
+        return await self._single_flight(("intent", key), lambda: self._classify_and_learn(message))
+
+    async def _classify_and_learn(self, message):
+        intent = await self._batched_intent(message)
+        learn_intent(message, intent)
+        return intent
+
+    async def llm_classify_intent(self, message: str) -> str:
+        """Classify user message into an intent code with the LLM."""
+        try:
+            status, body = await self._request("POST", self.generate_path, intent_payload(message), timeout=30)
+            result = json.loads(body.decode("utf-8"))
+        except Exception:
+            health.record_failure()
+            return "GENERAL"
+        health.record_success()
+        self._count_eval(result)
+        intent = reply_intent(result.get("response", ""))
+        if intent is None:
+            return "GENERAL"
+        intent_cache.put(normalize(message), intent)
+        return intent
+
+    async def llm_classify_batch(self, messages) -> list:
+        """Classify several messages with one request; any the reply skips are asked about singly."""
+        try:
+            status, body = await self._request("POST", self.generate_path, batch_intent_payload(messages), timeout=30)
+            result = json.loads(body.decode("utf-8"))
+            intents = parse_batch_intents(result.get("response", ""), len(messages))
+        except Exception:
+            health.record_failure()
+            return ["GENERAL"] * len(messages)
+        health.record_success()
+        self._count_eval(result)
+        self.batches += 1
+        self.batched += len(messages)
+        for message, intent in zip(messages, intents):
+            if intent is not None:
+                intent_cache.put(normalize(message), intent)
+        missing = [i for i, intent in enumerate(intents) if intent is None]
+        retried = await asyncio.gather(*(self.llm_classify_intent(messages[i]) for i in missing))
+        for i, intent in zip(missing, retried):
+            intents[i] = intent
+        return intents
+
+    async def generate_answer(self, message: str, data_snapshot: str, conversation=None) -> str:
+        """Generate a full answer for open-ended queries (continuing `conversation`, if given)."""
+        context = conversation.context_for(data_snapshot) if conversation else None
+        if context is not None:  # a follow-up: neither cached nor shared, it depends on the conversation
+            answer, tokens = await self._generate(None, message, data_snapshot, context)
+        else:
+            key = answer_key(message, data_snapshot)
+            cached = answer_cache.get(key)
+            if cached is not None:
+                answer, tokens = cached, None
+            else:
+                answer, tokens = await self._single_flight(
+                    ("answer", key), lambda: self._generate(key, message, data_snapshot))
+        if conversation:
+            conversation.update(tokens, data_snapshot)
+        return answer
+
+    async def _generate(self, key, message, data_snapshot, context=None):
+        """(answer, context tokens); the answer is cached under `key` unless that is None."""
+        try:
+            status, body = await self._request(
+                "POST", self.generate_path, answer_payload(message, data_snapshot, stream=False, context=context),
+                timeout=120, priority=PRIORITY_ANSWER)
+            result = json.loads(body.decode("utf-8"))
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            health.record_failure()
+            return f"⚠️ AI unavailable: {e}", None
+        except Exception as e:
+            health.record_failure()
+            return f"⚠️ Error: {str(e)}", None
+        health.record_success()
+        self._count_eval(result)
+        answer = result.get("response", "").strip()
+        if answer and key is not None:
+            answer_cache.put(key, answer)
+        return answer, result.get("context")
+
+    async def stream_answer(self, message: str, data_snapshot: str, conversation=None):
+        """Yield answer chunks as they stream. Errors end the stream quietly; a cached answer is one chunk.
+
+        While the same answer is already being generated, waits for it and yields it as one chunk.
+        The generation runs as a shared task: if this caller goes away, others waiting on it
+        still get the whole answer, and it is only abandoned once nobody is.
+        """
+        context = conversation.context_for(data_snapshot) if conversation else None
+        key = answer_key(message, data_snapshot) if context is None else None
+        cached = answer_cache.get(key) if key is not None else None
+        if cached is None and (key is None or ("answer", key) not in self._inflight):
+            # Lead: generate in a task (shared under the key), relaying its chunks as they arrive
+            chunks = asyncio.Queue()
+            task = self._join(None if key is None else ("answer", key),
+                              lambda: self._stream(key, message, data_snapshot, context, chunks))
+            try:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    yield chunk
+                answer, tokens = await asyncio.shield(task)
+            finally:
+                self._leave(task)
+            if conversation and answer:
+                conversation.update(tokens, data_snapshot)
+            return
+        if cached is None:  # follow: another caller is generating this answer
+            cached, tokens = await self._single_flight(("answer", key), None)
+        else:
+            tokens = None
+        if conversation:
+            conversation.update(tokens, data_snapshot)
+        if cached and not cached.startswith("⚠️"):
+            yield cached
+
+    async def _stream(self, key, message, data_snapshot, context, chunks):
+        """Stream an answer into the `chunks` queue (then None) → (answer, context tokens); cached under `key`."""
+        parts, tokens = [], None
+        try:
+            async for chunk in self._stream_lines(
+                    self.generate_path, answer_payload(message, data_snapshot, stream=True, context=context),
+                    timeout=120):
+                # No early break on "done": the body ends right after it, and running the
+                # inner generator to completion releases its connection and request slot
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    chunks.put_nowait(chunk["response"])
+                if chunk.get("done"):
+                    tokens = chunk.get("context")
+                    self._count_eval(chunk)
+        except (ConnectionError, OSError, asyncio.TimeoutError, ValueError):
+            health.record_failure()
+            return "", None  # followers get nothing, as for any failed answer
+        finally:
+            chunks.put_nowait(None)
+        health.record_success()
+        answer = "".join(parts).strip()
+        if answer and key is not None:
+            answer_cache.put(key, answer)
+        return answer, tokens if answer else None
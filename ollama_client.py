@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
 """Ollama integration — intent classification + answer generation."""
 
+import hashlib
 import json
+import os
+import re
+import threading
+import time
 import urllib.request
 import urllib.error
 
-OLLAMA_URL = "http://127.0.0.1:11434/api/generate"
+from array import array
+from collections import OrderedDict, deque
+
+from intent_classifier import classifier as local_classifier, normalize
+from snapshot import SnapshotManager
+
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "127.0.0.1:11434")  # same variable the Ollama CLI reads
+OLLAMA_URL = f"http://{OLLAMA_HOST}/api/generate"
+OLLAMA_TAGS_URL = f"http://{OLLAMA_HOST}/api/tags"
 MODEL = "qwen2.5:1.5b"
+# Keep the model loaded between requests (Ollama unloads an idle model after 5m by default)
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# One context size for every request: a different num_ctx makes Ollama reload the model
+NUM_CTX = 4096
+# Continue a chat's Ollama `context` on follow-ups. Off by default: the continued tokens are
+# evaluated again on every turn, ~10-15% more prompt tokens than a recap (bench.py prompt)
+CONTINUE_CONTEXT = os.environ.get("OLLAMA_CONTINUE_CONTEXT") == "1"
 
-# ── Intent Classifier ──
+# Local classifier confidence at or above which the LLM is skipped
+LOCAL_CONFIDENCE = 0.35
 
-INTENT_PROMPT = """You route user messages. Reply with ONLY one word from this list:
+# ── Intent Classifier ──
 
-DEVICE_LIST = view devices, check status, battery, terminals
+INTENT_GUIDE = """DEVICE_LIST = view devices, check status, battery, terminals
 DEVICE_ADD = add or register a new device
 MERCHANT_LIST = view merchants, stores, shops  
 MERCHANT_ADD = add or onboard a new merchant
@@ -40,14 +61,21 @@ Examples:
 "hello" → GENERAL
 "what is settlement process" → FAQ_SETTLEMENT
 
-"{message}" →"""
+"""
+INTENT_PROMPT = "You route user messages. Reply with ONLY one word from this list:\n\n" + INTENT_GUIDE + '"{message}" →'
+# Several messages in one request (ollama_async batches concurrent classifications)
+BATCH_INTENT_PROMPT = ("You route user messages. For EACH numbered message reply on its own line with the "
+                       "number and ONLY one word from this list:\n\n" + INTENT_GUIDE + "{messages}\n")
 
-ANSWER_PROMPT = """You are NexPOS AI — POS management assistant. Be concise (<100 words). Use markdown **bold** and bullet points.
+# Prompt layout is most- to least-stable so Ollama can reuse the evaluated prefix (KV cache):
+# fixed system text, then the data snapshot, then the question. Only the tail is new per call.
+ANSWER_SYSTEM = """You are NexPOS AI — POS management assistant. Be concise (<100 words). Use markdown **bold** and bullet points.
 
-DATA:
+Answer from the DATA in the message. Be helpful and brief."""
+ANSWER_PROMPT = """DATA:
 {data_snapshot}
 
-Answer from the data above. Be helpful and brief."""
+QUESTION: {message}"""
 
 VALID_INTENTS = [
     "DEVICE_LIST", "DEVICE_ADD", "MERCHANT_LIST", "MERCHANT_ADD",
@@ -57,14 +85,73 @@ VALID_INTENTS = [
 ]
 
 
-def classify_intent(message: str) -> str:
-    """Classify user message into an intent code."""
-    payload = {
+def intent_payload(message: str) -> dict:
+    return {
         "model": MODEL,
         "prompt": INTENT_PROMPT.format(message=message),
         "stream": False,
-        "options": {"temperature": 0.1, "num_predict": 5}
+        "keep_alive": KEEP_ALIVE,
+        "options": {"temperature": 0.1, "num_predict": 5, "num_ctx": NUM_CTX}
     }
+
+
+def batch_intent_payload(messages) -> dict:
+    numbered = "\n".join(f'{i}. "{m}"' for i, m in enumerate(messages, 1))
+    return {
+        "model": MODEL,
+        "prompt": BATCH_INTENT_PROMPT.format(messages=numbered),
+        "stream": False,
+        "keep_alive": KEEP_ALIVE,
+        "options": {"temperature": 0.1, "num_predict": 8 * len(messages), "num_ctx": NUM_CTX}
+    }
+
+
+def parse_batch_intents(raw: str, n: int):
+    """Intent per message from a numbered batch reply; None where the model skipped a number or didn't name one intent."""
+    intents = [None] * n
+    for line in raw.splitlines():
+        match = re.match(r"\s*(\d+)\s*[.):\-]?\s*(.+)", line)
+        if match and 1 <= int(match.group(1)) <= n:
+            intents[int(match.group(1)) - 1] = reply_intent(match.group(2))
+    return intents
+
+
+def reply_intent(raw: str):
+    """The one VALID_INTENTS code the model's reply names, or None if it names none or several."""
+    raw = raw.strip().upper().replace(" ", "_")
+    named = [intent for intent in VALID_INTENTS if intent in raw]
+    return named[0] if len(named) == 1 else None
+
+
+def learn_intent(message: str, intent: str):
+    """Teach the local classifier an LLM label, GENERAL included, if the model gave it cleanly.
+
+    A clean reply is cached by the llm_classify_* functions; a failed request or a reply naming
+    no single intent isn't, and teaching its GENERAL fallback would only reinforce the guess.
+    """
+    if intent_cache.peek(normalize(message)) == intent:
+        local_classifier.learn(message, intent)
+
+
+def local_intent(message: str):
+    """Fast path: intent from the in-process classifier, or None when it isn't confident."""
+    intent, confidence = local_classifier.classify(message)
+    return intent if confidence >= LOCAL_CONFIDENCE else None
+
+
+def classify_intent(message: str) -> str:
+    """Classify user message into an intent code — locally if confident, else via the LLM."""
+    intent = local_intent(message) or intent_cache.get(normalize(message))
+    if intent:
+        return intent
+    intent = llm_classify_intent(message)
+    learn_intent(message, intent)
+    return intent
+
+
+def llm_classify_intent(message: str) -> str:
+    """Classify user message into an intent code with the LLM."""
+    payload = intent_payload(message)
     try:
         req = urllib.request.Request(
             OLLAMA_URL,
@@ -74,24 +161,146 @@ def classify_intent(message: str) -> str:
         )
         with urllib.request.urlopen(req, timeout=30) as resp:
             result = json.loads(resp.read().decode("utf-8"))
-            raw = result.get("response", "").strip().upper().replace(" ", "_")
-            for intent in VALID_INTENTS:
-                if intent in raw:
-                    return intent
+        health.record_success()
+        intent = reply_intent(result.get("response", ""))
+        if intent is None:
             return "GENERAL"
+        intent_cache.put(normalize(message), intent)
+        return intent
     except Exception:
+        health.record_failure()
         return "GENERAL"
 
 
-def generate_answer(message: str, data_snapshot: str) -> str:
-    """Generate a full answer for open-ended queries."""
+def answer_payload(message: str, data_snapshot: str, stream: bool, context=None) -> dict:
+    """With `context` (a follow-up over the same data) the snapshot is already in it — send just the question."""
     payload = {
         "model": MODEL,
-        "prompt": message,
-        "system": ANSWER_PROMPT.format(data_snapshot=data_snapshot),
-        "stream": False,
-        "options": {"temperature": 0.7, "top_p": 0.9, "num_predict": 200}
+        "prompt": message if context else ANSWER_PROMPT.format(data_snapshot=data_snapshot, message=message),
+        "system": ANSWER_SYSTEM,
+        "stream": stream,
+        "keep_alive": KEEP_ALIVE,
+        "options": {"temperature": 0.7, "top_p": 0.9, "num_predict": 200, "num_ctx": NUM_CTX}
     }
+    if context:
+        payload["context"] = list(context)
+    return payload
+
+
+# "what about its battery?", "and in Delhi?" — a question that leans on the one before
+FOLLOW_UP_RE = re.compile(r"^\s*(and|also|what about|how about)\b|\b(it|its|it's|this|that|these|those|them|they|their|there|same)\b",
+                          re.I)
+
+
+class Conversation:
+    """A session's conversation state, so follow-up questions make sense without resending the chat.
+
+    - `tokens`: Ollama's `context` for the last exchange, continued by the next question while
+      the data snapshot is unchanged, the exchange is recent and the tokens leave room in NUM_CTX.
+      Only kept when `continue_context` is set (OLLAMA_CONTINUE_CONTEXT=1).
+    - `turns`: the last `max_turns` exchanges, each cut to `turn_chars` (a ring buffer). When
+      the context can't be continued they are recapped, newest first, within `recap_tokens`,
+      so the prompt stays the same size however long the chat runs.
+    - `subjects`: the device, merchant and region most recently mentioned or opened, which a
+      follow-up ("is it online?") is taken to be about.
+    """
+
+    __slots__ = ("tokens", "digest", "updated", "topic", "turns", "subjects")
+    continue_context = CONTINUE_CONTEXT
+    max_tokens = NUM_CTX // 2
+    ttl = 600.0
+    max_turns = 6
+    turn_chars = 160
+    recap_tokens = 150
+
+    def __init__(self):
+        self.tokens = None
+        self.digest = None
+        self.updated = 0.0
+        self.topic = ""
+        self.turns = deque(maxlen=self.max_turns)
+        self.subjects = {}  # "device"/"merchant"/"region" -> (key, label), least recent first
+
+    def note(self, kind, key, label=""):
+        """The chat is now about this device, merchant or region."""
+        self.subjects.pop(kind, None)
+        self.subjects[kind] = (key, label)
+
+    def refers_back(self, message):
+        """True for a follow-up: it leans on a subject and isn't a request the classifier recognises.
+
+        "are there any alerts" or "show me that merchant list" say "there"/"that" but ask for
+        a view of their own, so only messages with no confident intent (or GENERAL) count.
+        """
+        if not self.subjects or FOLLOW_UP_RE.search(message) is None:
+            return False
+        return local_intent(message) in (None, "GENERAL")
+
+    def subject(self):
+        """(kind, key) of the most recent subject, or None."""
+        for kind, (key, _) in reversed(self.subjects.items()):
+            return kind, key
+        return None
+
+    def focus(self, message):
+        """Text to pick snapshot rows by: the question plus the conversation it continues.
+
+        "which of those are offline?" then keeps the rows the last answer was about,
+        so the snapshot — and with it the prompt prefix Ollama has cached — stays the same.
+        """
+        recent = time.monotonic() - self.updated <= self.ttl
+        self.topic = (self.topic + " " + message)[-300:] if recent else message
+        if self.refers_back(message):
+            return self.topic + " " + " ".join(key for key, _ in self.subjects.values())
+        return self.topic
+
+    def ask(self, message, data_snapshot):
+        """The question to send: a follow-up names its subjects, and a fresh prompt recaps earlier turns."""
+        notes = []
+        if self.refers_back(message):
+            notes.append("About: " + "; ".join(f"{kind} {key}" + (f" ({label})" if label else "")
+                                               for kind, (key, label) in reversed(self.subjects.items())))
+        if self.turns and self.context_for(data_snapshot) is None:
+            recap, budget = [], self.recap_tokens
+            for question, answer in reversed(self.turns):
+                line = f"Q: {question} A: {answer}"
+                budget -= len(line) // 4 + 1   # ~4 characters per token
+                if budget < 0:
+                    break
+                recap.append(line)
+            if recap:
+                notes.append("Earlier: " + " | ".join(reversed(recap)))
+        return message + "".join(f"\n({note})" for note in notes)
+
+    def remember(self, message, answer):
+        cut = self.turn_chars
+        self.turns.append((" ".join(message.split())[:cut], " ".join(answer.split())[:cut]))
+
+    def context_for(self, data_snapshot):
+        if (self.tokens is not None and self.digest == snapshot_digest(data_snapshot)
+                and time.monotonic() - self.updated <= self.ttl):
+            return self.tokens
+        return None
+
+    def update(self, tokens, data_snapshot):
+        self.updated = time.monotonic()
+        if self.continue_context and tokens and len(tokens) <= self.max_tokens:
+            self.tokens = array("i", tokens)
+            self.digest = snapshot_digest(data_snapshot)
+        else:
+            self.tokens = None
+
+
+def generate_answer(message: str, data_snapshot: str, conversation=None) -> str:
+    """Generate a full answer for open-ended queries (continuing `conversation`, if given)."""
+    context = conversation.context_for(data_snapshot) if conversation else None
+    key = answer_key(message, data_snapshot)
+    cached = answer_cache.get(key) if context is None else None  # follow-ups depend on the conversation
+    if cached is not None:
+        if conversation:
+            conversation.update(None, data_snapshot)
+        return cached
+    payload = answer_payload(message, data_snapshot, stream=False, context=context)
     try:
         req = urllib.request.Request(
             OLLAMA_URL,
@@ -101,35 +310,260 @@ def generate_answer(message: str, data_snapshot: str) -> str:
         )
         with urllib.request.urlopen(req, timeout=120) as resp:
             result = json.loads(resp.read().decode("utf-8"))
-            return result.get("response", "").strip()
+        health.record_success()
+        answer = result.get("response", "").strip()
+        if answer and context is None:
+            answer_cache.put(key, answer)
+        if conversation:
+            conversation.update(result.get("context"), data_snapshot)
+        return answer
     except urllib.error.URLError as e:
+        health.record_failure()
         return f"⚠️ AI unavailable: {e.reason}"
     except Exception as e:
+        health.record_failure()
         return f"⚠️ Error: {str(e)}"
 
 
+def stream_answer(message: str, data_snapshot: str, conversation=None):
+    """Yield answer chunks as Ollama produces them (NDJSON, one object per line).
+
+    Errors end the stream quietly — callers treat an empty answer as "AI unavailable".
+    A cached answer is yielded as a single chunk.
+    """
+    context = conversation.context_for(data_snapshot) if conversation else None
+    key = answer_key(message, data_snapshot)
+    cached = answer_cache.get(key) if context is None else None
+    if cached is not None:
+        if conversation:
+            conversation.update(None, data_snapshot)
+        yield cached
+        return
+    payload = answer_payload(message, data_snapshot, stream=True, context=context)
+    parts, tokens = [], None
+    try:
+        req = urllib.request.Request(
+            OLLAMA_URL,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line.decode("utf-8"))
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    tokens = chunk.get("context")
+                    break
+        health.record_success()
+        answer = "".join(parts).strip()
+        if answer and context is None:
+            answer_cache.put(key, answer)
+        if conversation:
+            conversation.update(tokens, data_snapshot)
+    except Exception:
+        health.record_failure()
+        return
+
+
 def build_data_snapshot(devices, merchants, transactions, alerts):
-    """Compact data snapshot for LLM context."""
-    lines = []
-    lines.append("DEVICES:")
-    for did, d in devices.items():
-        lines.append(f"  {did}: {d['name']} @ {d['merchant']} ({d['region']}) — {d['status']}, Battery:{d['battery']}%")
-    lines.append("\nMERCHANTS:")
-    for mid, m in merchants.items():
-        lines.append(f"  {mid}: {m['name']} ({m['category']}, {m['region']}) — {m['devices']} devices")
-    lines.append("\nTODAY'S TRANSACTIONS:")
-    for region, data in transactions.items():
-        lines.append(f"  {region}: {data['count']} txns, ₹{data['volume']:,} volume")
-    lines.append(f"\nACTIVE ALERTS: {len(alerts)}")
-    for a in alerts:
-        lines.append(f"  {a['id']}: {a['type']} — {a['device']} ({a['severity']})")
-    return "\n".join(lines)
+    """Compact data snapshot for LLM context (one-off; the bot keeps a SnapshotManager)."""
+    return SnapshotManager(devices, merchants, transactions, alerts, max_rows=float("inf")).render()
 
 
 def is_ollama_running() -> bool:
     try:
-        req = urllib.request.Request("http://127.0.0.1:11434/api/tags")
+        req = urllib.request.Request(OLLAMA_TAGS_URL)
         with urllib.request.urlopen(req, timeout=3) as resp:
             return resp.status == 200
     except:
         return False
+
+
+# ── Health Monitor ──
+
+class HealthMonitor:
+    """Background Ollama health probe with a circuit breaker.
+
+    A daemon thread probes /api/tags every `interval` seconds while Ollama is up,
+    backing off exponentially (1s → `max_backoff`) while it is down. Separately,
+    `failure_threshold` consecutive classify/generate failures open the breaker for
+    `cooldown` seconds. After that it is half-open: `allow()` lets one caller try
+    Ollama (another after `trial_timeout` if that one never reports back); a success
+    closes the breaker, a failure opens it again, and a caller that ends up making
+    no request (a local intent, a cached reply, shed) hands the trial back with
+    `release()`. None of these methods does I/O.
+    """
+
+    def __init__(self, probe=is_ollama_running, interval=10.0, max_backoff=60.0,
+                 failure_threshold=3, cooldown=30.0, trial_timeout=30.0):
+        self.probe = probe
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.trial_timeout = trial_timeout
+        self.up = False
+        self.failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self._trial_until = 0.0       # while a half-open caller is trying, no one else may
+        self._lock = threading.Lock()  # outcomes are recorded from executor threads and the event loop
+        self._thread = None
+        self._stop = threading.Event()
+
+    def available(self) -> bool:
+        """Whether Ollama is up and the breaker isn't open (for display; callers use `allow`)."""
+        return self.up and time.monotonic() >= self.open_until
+
+    def allow(self):
+        """Whether this caller may use Ollama now; claims the single trial while half-open.
+
+        Truthy if so: True, or the claimed trial's deadline, to pass to `release()` afterwards.
+        """
+        if not self.up:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now < self.open_until:
+                return False
+            if self.half_open:
+                if now < self._trial_until:
+                    return False
+                self._trial_until = now + self.trial_timeout
+                return self._trial_until
+            return True
+
+    def release(self, claim):
+        """Give back a trial `allow()` returned if no outcome was recorded for it (a no-op otherwise)."""
+        if claim is True or not claim:
+            return
+        with self._lock:
+            if self.half_open and self._trial_until == claim:
+                self._trial_until = 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.half_open = False
+            self._trial_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.half_open or self.failures >= self.failure_threshold:
+                # Trip, or re-trip after a failed half-open attempt
+                self.open_until = time.monotonic() + self.cooldown
+                self.half_open = True
+                self._trial_until = 0.0
+                self.failures = 0
+
+    def start(self):
+        if self._thread is None:
+            self.up = self.probe()
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            delay = self.interval if self.up else backoff
+            if self._stop.wait(delay):
+                return
+            self.up = self.probe()
+            backoff = 1.0 if self.up else min(backoff * 2, self.max_backoff)
+
+
+health = HealthMonitor()
+
+
+# ── Response Cache ──
+
+class TTLCache:
+    """Thread-safe LRU cache with a TTL, an entry cap and an approximate byte cap."""
+
+    def __init__(self, max_entries=1024, max_bytes=1 << 20, ttl=300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key, value):
+        return len(repr(key)) + len(value.encode("utf-8"))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def peek(self, key):
+        """The live value for `key`, or None, without counting a hit or refreshing its LRU position."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[2] if entry is not None and entry[0] >= time.monotonic() else None
+
+    def put(self, key, value):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _pop(self, key):
+        self.bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+def snapshot_digest(data_snapshot: str) -> str:
+    return hashlib.sha1(data_snapshot.encode("utf-8")).hexdigest()
+
+
+def answer_key(message: str, data_snapshot: str):
+    """Answers depend on the data they were generated from — a snapshot change is a new key."""
+    return normalize(message), snapshot_digest(data_snapshot)
+
+
+intent_cache = TTLCache(max_entries=4096, max_bytes=1 << 20, ttl=3600.0)
+answer_cache = TTLCache(max_entries=512, max_bytes=4 << 20, ttl=300.0)
+
+
+def cache_stats() -> dict:
+    return {"intent": intent_cache.stats(), "answer": answer_cache.stats()}
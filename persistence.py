@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""Durable fleet state — SQLite (WAL mode) behind the in-memory FleetStore.
+
+Reads never touch the database: the whole fleet is loaded once at startup
+(plain columns, so rows turn into dicts without JSON parsing) and served from
+memory. Writes are journalled asynchronously: the store's change notifications
+are queued, and a writer thread commits them in batches (group commit), so a
+burst of onboarding costs one transaction instead of one fsync per row.
+
+Several worker processes can share one database (see Replicator): every
+public store mutation is also appended to an operation log, committed in the
+same transaction as its rows, and each worker replays the other workers'
+operations. Only the worker that made a change writes its rows. Each worker
+records how far it has replayed, and log entries every worker has applied
+are deleted, so the log stays as short as the slowest worker's backlog.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from store import FleetStore
+
+DEVICE_FIELDS = ("name", "merchant", "merchant_id", "region", "status", "battery", "last_txn", "model", "fw")
+MERCHANT_FIELDS = ("name", "category", "region", "contact", "phone", "devices", "status", "onboarded")
+ALERT_FIELDS = ("type", "device", "merchant", "time", "severity")
+TXN_FIELDS = ("count", "volume", "avg")
+
+# kind -> (table, key column, fields); rows keep their rowid on update, so load order = insert order
+TABLES = {
+    "device": ("devices", "id", DEVICE_FIELDS),
+    "merchant": ("merchants", "id", MERCHANT_FIELDS),
+    "alert": ("alerts", "id", ALERT_FIELDS),
+    "transactions": ("transactions", "region", TXN_FIELDS),
+}
+
+
+# Multi-worker mode: operation log, cross-worker id claims and id counters
+SHARED_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS oplog (seq INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, op TEXT, args TEXT)",
+    "CREATE TABLE IF NOT EXISTS claims (kind TEXT, key TEXT, PRIMARY KEY (kind, key))",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)",
+    "CREATE TABLE IF NOT EXISTS workers (origin TEXT PRIMARY KEY, seq INTEGER, seen REAL)",
+)
+OPLOG = "oplog"  # journal queue kind for operation-log entries
+LAST_TXN = "last_txn"  # store change kind: {did: timestamp} from ingested transactions
+
+
+def _connect(path, **kwargs):
+    conn = sqlite3.connect(path, timeout=30, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")   # WAL + NORMAL: durable across process crashes, fsync at checkpoint
+    conn.execute("PRAGMA mmap_size=268435456")  # read the file through mmap at startup
+    for table, key, fields in TABLES.values():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({key} TEXT PRIMARY KEY, {', '.join(fields)})")
+    for statement in SHARED_SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def _upsert_sql(kind):
+    table, key, fields = TABLES[kind]
+    cols = (key,) + fields
+    updates = ", ".join(f"{f}=excluded.{f}" for f in fields)
+    return (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {updates}")
+
+
+UPSERT_SQL = {kind: _upsert_sql(kind) for kind in TABLES}
+
+
+class FleetJournal:
+    """Write-behind journal for a FleetStore. Call `attach(store)` once loaded."""
+
+    def __init__(self, path, flush_interval=0.05, batch_size=2000, stamp_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # Device last_txn stamps change with every ingested transaction; they are merged and
+        # written at most this often (a crash loses at most that much of them, never totals)
+        self.stamp_interval = stamp_interval
+        self._stamps = {}
+        self._stamps_due = 0.0
+        self.commits = 0
+        self.rows_written = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._store = None
+        self._local = threading.local()   # a shared store's row changes, until their operation-log entry
+        self.seq = 0                      # operation-log position the loaded rows include
+
+    # ── Startup ──
+
+    def load(self):
+        """(devices, merchants, transactions, alerts) from disk, or None for an empty database.
+
+        Sets `seq` to the last operation-log entry, read in the same transaction as the rows:
+        they include exactly the operations up to it.
+        """
+        conn = _connect(self.path, isolation_level=None)
+        try:
+            data = {}
+            conn.execute("BEGIN")
+            self.seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM oplog").fetchone()[0]
+            for kind, (table, key, fields) in TABLES.items():
+                rows = conn.execute(f"SELECT {key}, {', '.join(fields)} FROM {table} ORDER BY rowid").fetchall()
+                data[kind] = {row[0]: dict(zip(fields, row[1:])) for row in rows}
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if not data["device"] and not data["merchant"]:
+            return None
+        alerts = [dict(record, id=aid) for aid, record in data["alert"].items()]
+        return data["device"], data["merchant"], data["transactions"], alerts
+
+    def is_empty(self):
+        conn = _connect(self.path)
+        try:
+            return not any(conn.execute(f"SELECT 1 FROM {TABLES[kind][0]} LIMIT 1").fetchone()
+                           for kind in ("device", "merchant"))
+        finally:
+            conn.close()
+
+    def seed(self, devices, merchants, transactions, alerts):
+        """Bulk-write initial data in one transaction (first run only)."""
+        conn = _connect(self.path)
+        try:
+            with conn:
+                for kind, items in (("device", devices.items()), ("merchant", merchants.items()),
+                                    ("transactions", transactions.items()),
+                                    ("alert", ((a["id"], a) for a in alerts))):
+                    fields = TABLES[kind][2]
+                    conn.executemany(UPSERT_SQL[kind], [(key, *(r.get(f) for f in fields)) for key, r in items])
+        finally:
+            conn.close()
+
+    # ── Write-behind ──
+
+    def attach(self, store):
+        self._store = store
+        store.subscribe(self.on_change)
+        self._thread = threading.Thread(target=self._run, name="fleet-journal", daemon=True)
+        self._thread.start()
+
+    def on_change(self, kind, key, record):
+        if kind == LAST_TXN:
+            item = (LAST_TXN, None, list(record.items()))
+        elif kind in TABLES:
+            # Copy now: the handler thread keeps mutating the live record
+            item = (kind, key, None if record is None else tuple(record.get(f) for f in TABLES[kind][2]))
+        else:
+            return
+        replica = self._store.replica
+        if replica is None:
+            self._queue.put(item)
+        elif not replica.replaying:  # replayed changes were written by the worker that made them
+            # Held back until the mutation's log entry (see log_op), in this thread under the store lock
+            pending = getattr(self._local, "pending", None)
+            if pending is None:
+                pending = self._local.pending = []
+            pending.append(item)
+
+    def log_op(self, origin, op, args):
+        """Queue an operation-log entry together with the rows it changed, so they commit as one."""
+        group = getattr(self._local, "pending", None) or []
+        self._local.pending = None
+        group.append((OPLOG, None, (origin, op, json.dumps(args))))
+        self._queue.put(group)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        conn = _connect(self.path)
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.stamp_interval if self._stamps else None)
+                except queue.Empty:
+                    self._commit(conn, [], force=True)
+                    continue
+                batch, markers, stop = [], [], False
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        markers.append(item)
+                    elif isinstance(item, list):
+                        batch.extend(item)
+                    else:
+                        batch.append(item)
+                    if stop or markers or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                if batch or (self._stamps and (markers or stop)):
+                    self._commit(conn, batch, force=bool(markers or stop))
+                for marker in markers:
+                    marker.set()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch, force=False):
+        # Last write per key wins within a batch; operation-log entries are kept in order
+        latest, ops = {}, []
+        for kind, key, values in batch:
+            if kind == OPLOG:
+                ops.append(values)
+            elif kind == LAST_TXN:
+                self._stamps.update(values)
+            else:
+                latest[(kind, key)] = values
+                if kind == "device":
+                    self._stamps.pop(key, None)     # the row copy already carries the newer stamp
+        stamps = {}
+        if self._stamps and (force or time.monotonic() >= self._stamps_due):
+            stamps, self._stamps = self._stamps, {}
+            self._stamps_due = time.monotonic() + self.stamp_interval
+        with conn:
+            conn.executemany("INSERT INTO oplog (origin, op, args) VALUES (?, ?, ?)", ops)
+            for (kind, key), values in latest.items():
+                if values is None:
+                    table, key_col, _ = TABLES[kind]
+                    conn.execute(f"DELETE FROM {table} WHERE {key_col} = ?", (key,))
+                else:
+                    conn.execute(UPSERT_SQL[kind], (key, *values))
+            conn.executemany("UPDATE devices SET last_txn = ? WHERE id = ?",
+                             [(ts, did) for did, ts in stamps.items()])
+        self.commits += 1
+        self.rows_written += len(latest) + len(stamps)
+
+
+class Replicator:
+    """Keeps one worker's FleetStore in step with the other workers sharing the database.
+
+    Local mutations are logged through the journal (`log`); a follower thread
+    polls the operation log and replays other workers' entries through the
+    store's own methods, so indexes, aggregates and listeners stay exact.
+    Replays are not idempotent (ingested transactions add up again), so each
+    entry must be applied once: replay starts after the journal's `seq`, read
+    in the same transaction as the rows it loaded, and an entry commits with
+    the rows it changed. Ids that must be unique across workers are reserved
+    in SQLite.
+
+    Every `report_interval` seconds a worker records its `last_seq` in the
+    workers table and deletes the log entries all workers are past. A worker
+    not heard from for `stale_after` seconds is taken to be gone and no longer
+    holds them back. It registers before the store is loaded, so the entries
+    after the loaded rows are kept until it has replayed them.
+    """
+
+    def __init__(self, path, poll_interval=0.05, report_interval=1.0, stale_after=600.0):
+        self.origin = os.urandom(8).hex()
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.stale_after = stale_after
+        self.replayed = 0
+        self.pruned = 0
+        self.store = None
+        self.journal = None
+        self._conn = _connect(path, check_same_thread=False)
+        self._conn.isolation_level = None       # explicit BEGIN IMMEDIATE below
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_seq = 0
+        self._reported = 0.0
+        self._conn.execute("INSERT OR REPLACE INTO workers (origin, seq, seen) "
+                           "VALUES (?, (SELECT COALESCE(MAX(seq), 0) FROM oplog), ?)", (self.origin, time.time()))
+
+    @property
+    def replaying(self):
+        return getattr(self._local, "active", False)
+
+    def attach(self, store, journal):
+        """Follow the log from where `journal` loaded `store`'s rows."""
+        self.store, self.journal = store, journal
+        self.last_seq = journal.seq
+        store.replica = self
+        self._thread = threading.Thread(target=self._run, name="fleet-replica", daemon=True)
+        self._thread.start()
+
+    # ── Called by FleetStore ──
+
+    def log(self, op, args):
+        if not self.replaying:
+            self.journal.log_op(self.origin, op, args)
+
+    def claim(self, kind, key) -> bool:
+        """Reserve an id for this worker; False if another worker got there first."""
+        if self.replaying:
+            return True
+        with self._lock:
+            cur = self._conn.execute("INSERT OR IGNORE INTO claims (kind, key) VALUES (?, ?)", (kind, key))
+            return cur.rowcount == 1
+
+    def next_id(self, kind, floor=0) -> int:
+        """Next sequence number for `kind`, unique across workers (never below the row count or `floor`)."""
+        table = TABLES[kind][0]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (kind,))
+                self._conn.execute(f"UPDATE counters SET value = MAX(value, (SELECT COUNT(*) FROM {table}), ?) + 1 "
+                                   "WHERE name = ?", (floor, kind))
+                value = self._conn.execute("SELECT value FROM counters WHERE name = ?", (kind,)).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return value
+
+    # ── Follower ──
+
+    def poll(self):
+        """Replay operations other workers have committed since the last poll."""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, origin, op, args FROM oplog WHERE seq > ? ORDER BY seq",
+                                      (self.last_seq,)).fetchall()
+        self._local.active = True
+        try:
+            for seq, origin, op, args in rows:
+                self.last_seq = seq
+                if origin != self.origin:
+                    getattr(self.store, op)(*json.loads(args))
+                    self.replayed += 1
+        finally:
+            self._local.active = False
+        if time.monotonic() - self._reported >= self.report_interval:
+            self.report()
+
+    def report(self):
+        """Record how far this worker has replayed; delete log entries every live worker is past."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO workers (origin, seq, seen) VALUES (?, ?, ?)",
+                                   (self.origin, self.last_seq, now))
+                self._conn.execute("DELETE FROM workers WHERE seen < ?", (now - self.stale_after,))
+                cur = self._conn.execute("DELETE FROM oplog WHERE seq <= (SELECT MIN(seq) FROM workers)")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.pruned += cur.rowcount
+        self._reported = time.monotonic()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE origin = ?", (self.origin,))  # stop holding entries back
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+
+
+def open_store(path, seed, shared=False):
+    """FleetStore backed by the SQLite file at `path`; an empty database is first filled from `seed`.
+
+    `shared=True` is for worker processes serving the same database (see Replicator).
+    """
+    journal = FleetJournal(path)
+    replica = Replicator(path) if shared else None
+    data = journal.load()
+    if data is None:
+        journal.seed(*seed)
+        data = seed
+    store = FleetStore(*data)
+    journal.attach(store)
+    store.journal = journal
+    if replica is not None:
+        replica.attach(store, journal)
+    return store
@@ -2,68 +2,336 @@
 """POS Bot Demo — single port, websockets lib handles both HTTP and WS."""
 
 import asyncio
+import contextlib
 import json
 import hashlib
+import itertools
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import socket
 import time
 from pathlib import Path
-from http import HTTPStatus
 
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 from websockets.http11 import Request, Response
 
+import metrics
+import server
+from admission import TokenBucket
+from alerts import AlertEngine
+from frames import encode, envelope, msgpack, patch
+from history import TxnHistory, backfill
+from ingest import TxnIngestor
+from metrics import ADMISSION, CONNECTIONS, CONNECTS, ERRORS, MESSAGES, MESSAGE_SECONDS, span
+from ollama_client import cache_stats, health
+from persistence import FleetJournal, open_store
 from server import BotEngine
+from static_files import StaticCache
 
 STATIC_DIR = Path(__file__).parent / "static"
-bot = BotEngine()
+# Assets are loaded into memory once; POS_STATIC_RELOAD=1 re-reads files whose mtime changed (development)
+STATIC = StaticCache(STATIC_DIR, reload=os.environ.get("POS_STATIC_RELOAD") == "1")
+# SQLite file for durable fleet state; POS_DB="" keeps everything in memory
+DB_PATH = os.environ.get("POS_DB", str(Path(__file__).parent / "fleet.db"))
+HOST, PORT = "0.0.0.0", int(os.environ.get("POS_PORT", "8888"))
+# Directory of per-day transaction history columns (memory-mapped with NumPy); "" keeps history in memory
+HISTORY_DIR = os.environ.get("POS_HISTORY", str(Path(DB_PATH).parent / "history") if DB_PATH else "")
+# Worker processes sharing PORT; more than one needs POS_DB (state is shared through it)
+WORKERS = int(os.environ.get("POS_WORKERS", "1"))
+# Transaction feed: NDJSON over TCP at POS_INGEST ("host:port", every worker listens) and/or
+# appended to POS_INGEST_FILE (tailed by the first worker only, so each line counts once)
+INGEST_ADDR = os.environ.get("POS_INGEST", "")
+INGEST_FILE = os.environ.get("POS_INGEST_FILE", "")
+# Compact protocol, offered as WebSocket subprotocols: dashboards are kept current with patches
+# (see LiveViews), and "pos.v2.msgpack" frames are MessagePack. Clients offering neither get JSON frames.
+PROTOCOLS = ("pos.v2.msgpack", "pos.v2") if msgpack is not None else ("pos.v2",)
+# permessage-deflate, compressing each connection's frames against the ones before (python3 bench.py wire)
+DEFLATE = ServerPerMessageDeflateFactory(server_max_window_bits=12, client_max_window_bits=12,
+                                         compress_settings={"memLevel": 5, "level": 6})
+# Admission control (see admission.py). Each connection may send POS_RATE messages a second, bursts of up to
+# POS_RATE_BURST; free text costs FREE_TEXT_COST of them. At most POS_LLM_QUEUE free-text messages hold LLM work
+# at once, the rest are shed.
+RATE, RATE_BURST = float(os.environ.get("POS_RATE", "2")), float(os.environ.get("POS_RATE_BURST", "20"))
+FREE_TEXT_COST = 4
+LLM_QUEUE = int(os.environ.get("POS_LLM_QUEUE", "16"))
+# Unsent bytes a connection may hold (its transport's high-water mark); a client that leaves it full for
+# SEND_TIMEOUT seconds is disconnected, and alert broadcasts skip it meanwhile
+WRITE_LIMIT = 32 * 1024
+SEND_TIMEOUT = float(os.environ.get("POS_SEND_TIMEOUT", "10"))
+bot = None             # the BotEngine, built in main()
+ingestor = None
+alert_engine = None
+TYPING = {codec: (encode({"type": "typing", "content": True}, codec), encode({"type": "typing", "content": False}, codec))
+          for codec in ("json", "msgpack") if codec == "json" or msgpack is not None}
+THROTTLED = {codec: encode({"type": "text", "content": "⏳ Too many messages. Give it a moment, then try again."}, codec)
+             for codec in TYPING}
+log = logging.getLogger("pos")
+
+
+def setup_logging():
+    """Log through a queue: the event loop only enqueues, a listener thread does the stdout writes."""
+    records = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    stdout = logging.StreamHandler()
+    stdout.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(records, stdout)
+    listener.start()
+    return listener
+
+
+# Read at scrape time from the caches and session store
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_cache_hits_total", "LLM cache hits", "counter",
+    lambda: {(name,): s["hits"] for name, s in cache_stats().items()}, ["cache"]))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_cache_misses_total", "LLM cache misses", "counter",
+    lambda: {(name,): s["misses"] for name, s in cache_stats().items()}, ["cache"]))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_sessions", "Live chat sessions", "gauge", lambda: {(): len(bot.sessions)}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_coalesced_total", "LLM calls answered by an identical in-flight request", "counter",
+    lambda: {(): bot.llm.coalesced}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_batched_total", "Classifications sent in multi-message requests", "counter",
+    lambda: {(): bot.llm.batched}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_queued", "LLM requests waiting for a connection slot", "gauge",
+    lambda: {(): bot.llm.dispatch_stats()["queued"]}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_prompt_tokens_total", "Prompt tokens Ollama evaluated (not reused from its cache)", "counter",
+    lambda: {(): bot.llm.prompt_tokens}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_prompt_eval_seconds_total", "Time Ollama spent evaluating prompts", "counter",
+    lambda: {(): bot.llm.prompt_seconds}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_ollama_up", "1 while the Ollama health check passes", "gauge", lambda: {(): int(health.available())}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_txn_ingested_total", "Transaction feed events by outcome", "counter",
+    lambda: {(result,): n for result, n in ingestor.stats().items()} if ingestor else {}, ["result"]))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_alerts_total", "Alerts raised by this worker's engine, and raises held back by suppression", "counter",
+    lambda: {(outcome,): alert_engine.stats()[outcome] for outcome in ("raised", "suppressed")} if alert_engine else {},
+    ["outcome"]))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_live_views", "Connections watching a live dashboard", "gauge", lambda: {(): len(live.watching)}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_live_patches_total", "Dashboard patches sent, and their bytes before compression", "counter",
+    lambda: {("patches",): live.patches, ("bytes",): live.patch_bytes}, ["unit"]))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_llm_work", "Free-text messages holding LLM work (at most POS_LLM_QUEUE)", "gauge",
+    lambda: {(): bot.llm_work.active}))
+metrics.REGISTRY.register(metrics.Callback(
+    "pos_alerts_open", "Unacknowledged alerts", "gauge", lambda: {(): len(bot.store.alerts)}))
 
-CONTENT_TYPES = {
-    ".html": "text/html; charset=utf-8", ".css": "text/css; charset=utf-8",
-    ".js": "application/javascript; charset=utf-8", ".png": "image/png",
-    ".svg": "image/svg+xml", ".ico": "image/x-icon", ".json": "application/json",
-}
 
 def serve_static(connection, request):
-    """Process handler: serve static files for non-WS requests."""
+    """Process handler: serve static files for non-WS requests (from memory, see static_files)."""
     # Only intercept non-upgrade requests
     if request.headers.get("Upgrade", "").lower() == "websocket":
         return None  # Let websockets handle it
 
-    path = request.path
-    if path == "/" or path == "":
-        path = "/index.html"
-    if "?" in path:
-        path = path.split("?")[0]
-
-    file_path = (STATIC_DIR / path.lstrip("/")).resolve()
-    if not str(file_path).startswith(str(STATIC_DIR.resolve())):
-        return connection.respond(HTTPStatus.FORBIDDEN, "Forbidden\n")
-
-    if file_path.exists() and file_path.is_file():
-        ct = CONTENT_TYPES.get(file_path.suffix, "application/octet-stream")
-        body = file_path.read_bytes()
-        response = connection.respond(HTTPStatus.OK, "")
-        # We need to return a Response manually
+    if request.path.split("?", 1)[0] == "/metrics":
+        body = metrics.render().encode("utf-8")
         return Response(200, "OK", websockets.datastructures.Headers({
-            "Content-Type": ct,
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
             "Content-Length": str(len(body)),
-            "Cache-Control": "no-cache",
+            "Cache-Control": "no-store",
         }), body)
-    else:
+
+    asset = STATIC.get(request.path)
+    if asset is None:
         return Response(404, "Not Found", websockets.datastructures.Headers({
             "Content-Type": "text/plain",
             "Content-Length": "9",
         }), b"Not Found")
 
+    encoding, body, etag = asset.select(request.headers.get("Accept-Encoding", ""))
+    headers = websockets.datastructures.Headers({
+        "ETag": etag,
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding",
+    })
+    if asset.matches(request.headers.get("If-None-Match", "")):
+        return Response(304, "Not Modified", headers, b"")
+    headers["Content-Type"] = asset.content_type
+    headers["Content-Length"] = str(len(body))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(200, "OK", headers, body)
+
+
+def select_protocol(connection, offered):
+    """The first of PROTOCOLS the client offers, or None for plain JSON frames (older clients)."""
+    for protocol in PROTOCOLS:
+        if protocol in offered:
+            return protocol
+    return None
+
+
+async def send_bounded(websocket, data, text):
+    """Send, disconnecting a client that leaves WRITE_LIMIT bytes unread for SEND_TIMEOUT seconds."""
+    try:
+        await asyncio.wait_for(websocket.send(data, text=text), SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        ADMISSION.inc(outcome="slow_client")
+        websocket.transport.abort()
+        raise websockets.exceptions.ConnectionClosedError(None, None) from None
+
+
+def broadcast_bounded(connections, message):
+    """websockets.broadcast, which doesn't wait for slow clients, minus those already holding WRITE_LIMIT unsent."""
+    websockets.broadcast([c for c in connections if c.transport.get_write_buffer_size() < WRITE_LIMIT], message)
+
+
+class LiveViews:
+    """Dashboards compact-protocol clients have open, kept current with patches as the store changes.
+
+    Each connection watches at most one LIVE_VIEWS dashboard: the last one it opened. Every
+    `interval` seconds, if the store has changed, each watched view is re-rendered once (the
+    cached versioned view) and every watcher gets the edits from the frames it has to the new
+    ones: a changed count costs a few dozen bytes instead of the whole dashboard.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.watching = {}      # websocket -> [action, codec, frames the client shows]
+        self.patches = 0
+        self.patch_bytes = 0
+
+    def watch(self, websocket, action, codec, frames):
+        self.watching[websocket] = [action, codec, frames]
+
+    def drop(self, websocket):
+        self.watching.pop(websocket, None)
+
+    def _updates(self, watching):
+        """[(message, codec, websockets)] taking watchers to the current frames (on an executor thread)."""
+        current, groups = {}, {}
+        for websocket, entry in watching:
+            action, codec, shown = entry
+            frames = current.get(action)
+            if frames is None:
+                frames = current[action] = bot.live_view(action)
+            if frames is not shown:
+                group = groups.setdefault((action, codec, id(shown)), (shown, frames, []))
+                group[2].append((websocket, entry))
+        updates = []
+        for (action, codec, _), (shown, frames, watchers) in groups.items():
+            for _, entry in watchers:
+                entry[2] = frames
+            ops = patch(shown, frames)
+            if ops:
+                updates.append((encode({"type": "patch", "view": action, "ops": ops}, codec), codec,
+                                [websocket for websocket, _ in watchers]))
+        return updates
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        version = None
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.watching or bot.store.version == version:
+                continue
+            version = bot.store.version
+            for message, codec, sockets in await loop.run_in_executor(None, self._updates, list(self.watching.items())):
+                # Awaited, never skipped like websockets.broadcast does when congested: patches build on each other
+                await asyncio.gather(*(self._send(websocket, message, codec == "json") for websocket in sockets))
+                self.patches += len(sockets)
+                self.patch_bytes += len(message) * len(sockets)
+
+    @staticmethod
+    async def _send(websocket, message, text):
+        try:
+            await send_bounded(websocket, message, text)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+live = LiveViews()
+
 
 async def chat_handler(websocket):
     sid = hashlib.md5(f"{time.time()}-{id(websocket)}".encode()).hexdigest()[:10]
-    print(f"[WS] Connected: {sid}", flush=True)
+    log.info("[WS] Connected: %s", sid)
+    CONNECTS.inc()
+    CONNECTIONS.inc()
+    compact = websocket.subprotocol is not None
+    codec = "msgpack" if websocket.subprotocol == "pos.v2.msgpack" else "json"
+    typing_on, typing_off = TYPING[codec]
+    bucket = TokenBucket(RATE, RATE_BURST)
+    throttled = False      # told so already; further refused messages are dropped silently
+    current = None         # free-text reply in progress; the client's next free text cancels it
+    replies = itertools.count(1)  # free-text reply ids, so compact clients keep each answer in its own bubble
+
+    async def send(data):
+        await send_bounded(websocket, data, codec == "json")
+
+    async def reply(text, btn, action, t0, rid=None):
+        with metrics.trace() as stages:
+            try:
+                # Send typing indicator for free-text queries (may hit LLM)
+                if not btn:
+                    await send(typing_on)
+
+                async def on_delta(chunk):
+                    delta = {"type": "delta", "content": chunk}
+                    if compact:
+                        delta["reply"] = rid
+                    await send(encode(delta, codec))
+
+                # Handlers run in the executor; LLM calls are awaited on the loop (ollama_async)
+                responses = await bot.aprocess(sid, text, btn, on_delta)
+
+                with span("send"):
+                    # Stop typing indicator
+                    if not btn:
+                        await send(typing_off)
+
+                    view = btn or text.strip().lower()
+                    if compact and view in server.LIVE_VIEWS:
+                        await send(envelope(view, responses, codec))
+                        live.watch(websocket, view, codec, responses)
+                    elif compact and rid is not None:
+                        await send(envelope(rid, responses, codec, kind="reply"))
+                    else:
+                        for msg in responses:
+                            # Cached views arrive pre-serialized (frames.Frame)
+                            await send(encode(msg, codec))
+            except asyncio.CancelledError:
+                ADMISSION.inc(outcome="cancelled")
+                log.info("[WS] %s: %s cancelled after %.1fms text=%.60s", sid, action,
+                         (time.perf_counter() - t0) * 1000, text)
+                raise
+            except websockets.exceptions.ConnectionClosed:
+                return  # client went away mid-reply
+            except Exception:
+                ERRORS.inc(where="handler")
+                log.exception("[WS] Error: %s: btn=%s text=%.60s", sid, btn, text)
+                with contextlib.suppress(websockets.exceptions.ConnectionClosed):  # may run in a task nobody awaits
+                    await send(encode({
+                        "type": "text", "content": "⚠️ Error. Try again.",
+                        "buttons": [{"text": "🏠 Menu", "data": "menu"}]
+                    }, codec))
+
+        elapsed = time.perf_counter() - t0
+        MESSAGES.inc(action=action)
+        MESSAGE_SECONDS.observe(elapsed, action=action)
+        log.info("[WS] %s: %s %.1fms %s btn=%s text=%.60s", sid, action, elapsed * 1000,
+                 " ".join(f"{stage}={t * 1000:.1f}" for stage, t in stages.items()), btn, text)
 
     try:
         for msg in bot.process(sid, "start"):
-            await websocket.send(json.dumps(msg))
+            await send(encode(msg, codec))
 
         async for raw in websocket:
+            t0 = time.perf_counter()
             try:
                 payload = json.loads(raw)
                 text = payload.get("text", "")
@@ -71,51 +339,187 @@ async def chat_handler(websocket):
             except (json.JSONDecodeError, AttributeError):
                 text = raw
                 btn = None
+            action = server.action_label(text, btn)
 
-            print(f"[WS] {sid}: btn={btn} text={text[:60]}", flush=True)
+            if not bucket.take(1 if btn else FREE_TEXT_COST):
+                ADMISSION.inc(outcome="throttled")
+                if not throttled:
+                    throttled = True
+                    await send(THROTTLED[codec])
+                continue
+            throttled = False
+            if btn:
+                # Clicks and pages don't replace a question: its answer keeps streaming alongside
+                await reply(text, btn, action, t0)
+                continue
+            if current is not None and not current.done():
+                # The client has asked something else: stop waiting for (and generating) the old answer
+                current.cancel()
+                await asyncio.wait([current])
+            # In a task, so newer free text (or the connection closing) can cut it short
+            current = asyncio.create_task(reply(text, btn, action, t0, next(replies)))
 
-            try:
-                # Send typing indicator for free-text queries (may hit LLM)
-                if not btn:
-                    await websocket.send(json.dumps({"type": "typing", "content": True}))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    except Exception:
+        ERRORS.inc(where="connection")
+        log.exception("[WS] Fatal: %s", sid)
+    finally:
+        if current is not None:
+            # Let the cancelled reply unwind (aprocess waits for its handler thread) before the session goes
+            current.cancel()
+            await asyncio.wait([current])
+        CONNECTIONS.dec()
+        live.drop(websocket)
+        bot.end_session(sid)
 
-                loop = asyncio.get_event_loop()
-                responses = await loop.run_in_executor(None, bot.process, sid, text, btn)
+    log.info("[WS] Disconnected: %s", sid)
 
-                # Stop typing indicator
-                if not btn:
-                    await websocket.send(json.dumps({"type": "typing", "content": False}))
-
-                for msg in responses:
-                    await websocket.send(json.dumps(msg))
-            except Exception as e:
-                print(f"[WS] Error: {e}", flush=True)
-                import traceback; traceback.print_exc()
-                await websocket.send(json.dumps({
-                    "type": "text", "content": "⚠️ Error. Try again.",
-                    "buttons": [{"text": "🏠 Menu", "data": "menu"}]
-                }))
 
-    except websockets.exceptions.ConnectionClosed:
-        pass
-    except Exception as e:
-        print(f"[WS] Fatal: {sid}: {e}", flush=True)
-        import traceback; traceback.print_exc()
+def open_history(path, save=True):
+    """Transaction history from `path`, started with the dummy weeks (like the database seed) when empty.
+
+    With several workers only the first saves days there (`save`); every worker replays every
+    transaction, so the others' histories are the same, just not written.
+    """
+    if path:
+        os.makedirs(path, exist_ok=True)
+    history = TxnHistory(path or None, save=save)
+    if not history.days():
+        backfill(history, server.DEVICES, server.HISTORY_END, server.HISTORY_DAYS, server.HISTORY_PER_DAY)
+    return history
+
+
+async def start_ingest(store, tail):
+    """Start the transaction feed sources that are configured; returns their asyncio handles."""
+    global ingestor
+    ingestor = TxnIngestor(store)
+    handles = []
+    if INGEST_ADDR:
+        host, _, port = INGEST_ADDR.rpartition(":")
+        handles.append(await ingestor.serve(host or "127.0.0.1", int(port), reuse_port=WORKERS > 1))
+        log.info("📥 Ingesting transactions on %s", INGEST_ADDR)
+    if INGEST_FILE and tail:
+        handles.append(asyncio.create_task(ingestor.tail(INGEST_FILE)))
+        log.info("📥 Tailing transactions from %s", INGEST_FILE)
+    return handles
+
 
-    print(f"[WS] Disconnected: {sid}", flush=True)
+def push_critical(loop, ws_server):
+    """Alert listener: send new critical alerts to every chat open on this worker (from any thread)."""
+    def push(alert):
+        if alert["severity"] == "critical":
+            message = encode(bot.alert_message(alert)).decode("utf-8")
+            loop.call_soon_threadsafe(broadcast_bounded, ws_server.connections, message)
+    return push
 
 
-async def main():
+async def main(sock=None, tail=True):
+    """Serve on HOST:PORT, or on an already-bound `sock` as one of several workers."""
+    global bot, alert_engine
+    listener = setup_logging()
+    t0 = time.perf_counter()
+    store = server.STORE
+    if DB_PATH:
+        store = open_store(DB_PATH, seed=(server.DEVICES, server.MERCHANTS, server.TRANSACTIONS_DAILY, server.ALERTS),
+                           shared=sock is not None)
+    open_history(HISTORY_DIR, save=tail).attach(store)
+    if DB_PATH:
+        log.info("💾 Loaded %d devices from %s in %.0fms", len(store.devices), DB_PATH, (time.perf_counter() - t0) * 1000)
+    bot = BotEngine(store=store, llm_queue=LLM_QUEUE)
+
+    alert_engine = AlertEngine(bot.store)
+    feeds = await start_ingest(bot.store, tail)
+    if feeds and tail:  # devices report through the feed; without one, silence means nothing
+        feeds.append(asyncio.create_task(alert_engine.run_sweeps()))
+
     # Use process_request to handle HTTP, let WS through
+    address = {"sock": sock} if sock is not None else {"host": HOST, "port": PORT}
+    feeds.append(asyncio.create_task(live.run()))
     async with websockets.serve(
         chat_handler,
-        "0.0.0.0",
-        8888,
         process_request=serve_static,
-    ) as server:
-        print(f"🤖 POS Bot running on http://0.0.0.0:8888 (HTTP + WS)", flush=True)
-        await asyncio.Future()  # run forever
+        select_subprotocol=select_protocol,
+        compression=None,
+        extensions=[DEFLATE],
+        write_limit=WRITE_LIMIT,
+        **address,
+    ) as ws_server:
+        alert_engine.listeners.append(push_critical(asyncio.get_running_loop(), ws_server))
+        log.info("🤖 POS Bot running on http://%s:%d (HTTP + WS, pid %d)", HOST, PORT, os.getpid())
+        try:
+            await asyncio.Future()  # run forever
+        finally:
+            for feed in feeds:
+                if isinstance(feed, asyncio.Server):
+                    feed.close()
+                else:
+                    feed.cancel()
+            await bot.llm.close()
+            if bot.store.replica:
+                bot.store.replica.close()
+            if bot.store.journal:
+                bot.store.journal.close()
+            if bot.store.history:
+                bot.store.history.close()
+            listener.stop()
+
+
+# ── Multi-worker mode ──
+# Each worker binds its own SO_REUSEPORT socket and the kernel spreads new connections
+# across them. A WebSocket stays on the worker that accepted it, so its session does too.
+
+def reuseport_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((HOST, PORT))
+    return sock
+
+
+def _interrupt_once(signum, frame):
+    """First SIGINT/SIGTERM stops the process like Ctrl-C (so the journal flushes); later ones are ignored."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def serve_worker(index):
+    signal.signal(signal.SIGINT, _interrupt_once)
+    signal.signal(signal.SIGTERM, _interrupt_once)
+    try:
+        asyncio.run(main(reuseport_socket(), tail=index == 0))
+    except KeyboardInterrupt:
+        pass
+
+
+def serve_workers(n):
+    """Seed the database once, then run `n` worker processes until interrupted."""
+    journal = FleetJournal(DB_PATH)
+    if journal.is_empty():
+        journal.seed(server.DEVICES, server.MERCHANTS, server.TRANSACTIONS_DAILY, server.ALERTS)
+    if HISTORY_DIR:
+        open_history(HISTORY_DIR)  # workers then load it rather than each writing the dummy weeks
+    signal.signal(signal.SIGINT, _interrupt_once)
+    signal.signal(signal.SIGTERM, _interrupt_once)
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=serve_worker, args=(i,), name=f"worker-{i}") for i in range(n)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1 and not (DB_PATH and hasattr(socket, "SO_REUSEPORT")):
+        print("⚠️ POS_WORKERS > 1 needs POS_DB and SO_REUSEPORT — running one worker", flush=True)
+        WORKERS = 1
+    if WORKERS > 1:
+        serve_workers(WORKERS)
+    else:
+        asyncio.run(main())
@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 """POS Management Chatbot Demo — IRCTC-style guided bot with dummy data."""
 
+import asyncio
+import base64
 import json
 import re
 import threading
-
-from ollama_client import classify_intent, generate_answer, build_data_snapshot, is_ollama_running
+from urllib.parse import parse_qsl, urlencode
+
+from frames import static_view, versioned_view
+from history import pct_change
+from intent_classifier import STOPWORDS, normalize
+from admission import WorkLimit
+from metrics import ADMISSION, INTENTS, span
+from ollama_async import AsyncOllama
+from ollama_client import Conversation, classify_intent, local_intent, generate_answer, stream_answer, health
+from sessions import SessionStore
+from snapshot import SnapshotManager
+from store import FleetStore
 
 # ─── Dummy Data ───────────────────────────────────────────────────────────────
 
@@ -41,6 +53,13 @@ ALERTS = [
     {"id": "ALT-004", "type": "High Txn Volume", "device": "POS-1001", "merchant": "Cafe Blue", "time": "13:00", "severity": "info"},
 ]
 
+# Live fleet state: indexes + aggregates over the dicts above (ALERTS is only the seed list)
+STORE = FleetStore(DEVICES, MERCHANTS, TRANSACTIONS_DAILY, ALERTS)
+
+# Eight weeks of dummy transaction history up to the day before TRANSACTIONS_DAILY's (run.py starts an
+# empty history with it)
+HISTORY_END, HISTORY_DAYS, HISTORY_PER_DAY = "2026-02-23", 56, 1000
+
 FAQ = {
     "reset device": "To reset a POS device:\n1. Hold Power + Volume Down for 10s\n2. Select 'Factory Reset' from recovery menu\n3. Device will reboot and re-register automatically\n\n⚠️ This erases all local data. Pending transactions are synced first.",
     "settlement": "Settlement runs automatically at 11:00 PM daily. Manual settlement: Device Menu → Settings → Force Settlement. Funds reflect in T+1 business days.",
@@ -48,18 +67,119 @@ FAQ = {
     "connectivity": "POS devices support WiFi, 4G SIM, and Bluetooth tethering. Priority: WiFi > 4G > BT. Check signal: Menu → Network → Diagnostics.",
 }
 
+# Listing pages: `<kind>s_page_<query>` button data, e.g. "devices_page_status=Offline&sort=battery&after=WzEyLCJQT1MtMjAwMSJd"
+PAGE_SIZE = 20
+LIST_TITLES = {"device": "📱 **All Devices**", "merchant": "🏪 **All Merchants**", "alert": "🔔 **Alerts**"}
+
+
+def cursor_str(key):
+    """Opaque cursor for a sort key: base64url JSON, so each part keeps its type whatever its text."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).rstrip(b"=").decode()
+
+
+def cursor_key(text):
+    """The sort key a cursor encodes; ValueError for anything cursor_str didn't produce."""
+    key = json.loads(base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)))
+    if not isinstance(key, list) or not all(type(part) in (str, int) for part in key):
+        raise ValueError(text)
+    return tuple(key)
+
+
+# Metric labels: parameterised actions collapse to their prefix so label values stay bounded
+ACTIONS = {"start", "menu", "device_status", "view_all_devices", "search_device", "merchants",
+           "view_all_merchants", "add_merchant", "add_device", "reports", "daily_summary", "history", "alerts", "help"}
+ACTION_PREFIXES = ("devices_page_", "merchants_page_", "alerts_page_", "device_detail_", "merchant_detail_",
+                   "confirm_deactivate_", "do_deactivate_", "region_report_", "history_region_", "history_by_",
+                   "alert_ack_", "faq_", "form_submit_")
+
+# Free-text questions that get exact figures from the transaction history
+HISTORY_QUESTION = re.compile(r"\b(compare|comparison|vs|versus|week|weekly|month|monthly|yesterday|trend|growth|"
+                              r"history|historical|previous|last \d+ days)\b", re.I)
+HISTORY_GROUPS = {"category": "🏷️ By Category", "model": "🖥️ By Model", "merchant": "🏪 Top Merchants"}
+# Dashboards a compact-protocol client is kept current on while it has one open: action -> view method
+LIVE_VIEWS = {"device_status": "_device_menu", "merchants": "_merchant_menu", "reports": "_reports_menu",
+              "daily_summary": "_daily_summary", "alerts": "_show_alerts"}
+# Classified free-text intents (ollama_client.VALID_INTENTS) answered by a view instead of the LLM
+INTENT_VIEWS = {"DEVICE_LIST": "_device_menu", "DEVICE_ADD": "_show_device_form", "MERCHANT_LIST": "_merchant_menu",
+                "MERCHANT_ADD": "_show_merchant_form", "REPORTS": "_reports_menu", "ALERTS": "_show_alerts",
+                "HELP": "_help_menu", "MENU": "_main_menu"}
+INTENT_FAQS = {"FAQ_RESET": "reset device", "FAQ_SETTLEMENT": "settlement", "FAQ_PAPER": "paper roll",
+               "FAQ_CONNECTIVITY": "connectivity"}
+INTENT_REGIONS = {"MUMBAI", "DELHI", "BANGALORE", "CHENNAI"}
+# Free text with this many words besides stopwords ("show me the ...") asks more than a view shows
+SPECIFIC_WORDS = 4
+# Views that make their device/merchant/region the conversation's subject, for follow-up questions
+SUBJECT_ACTIONS = {"device_detail_": "device", "confirm_deactivate_": "device", "merchant_detail_": "merchant",
+                   "region_report_": "region", "history_region_": "region"}
+
+
+def action_label(text, button_data=None):
+    action = button_data or text.strip().lower()
+    if action in ACTIONS:
+        return action
+    for prefix in ACTION_PREFIXES:
+        if action.startswith(prefix):
+            return prefix[:-1]
+    return "button" if button_data else "text"
+
+
 # ─── Bot Engine ───────────────────────────────────────────────────────────────
 
 class BotEngine:
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, llm=None, store=None, sessions=None, llm_queue=16):
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.llm = llm or AsyncOllama()
+        self.llm_work = WorkLimit(llm_queue)  # free-text messages classifying or answering with the LLM
+        self.store = store or STORE
+        # LLM context, kept in step with the store through its change notifications
+        self.snapshot = SnapshotManager.for_store(self.store)
+        self._views = {}  # handler name -> (store version, frames); see frames.versioned_view
+        health.start()
 
     def get_session(self, sid):
-        if sid not in self.sessions:
-            self.sessions[sid] = {"state": "main_menu"}
-        return self.sessions[sid]
+        return self.sessions.get(sid)
+
+    def end_session(self, sid):
+        self.sessions.end(sid)
+
+    def process(self, sid, text, button_data=None, on_delta=None):
+        """Route one message. `on_delta(chunk)` (optional) receives partial LLM answer text as it streams."""
+        responses = self._route(sid, text, button_data)
+        if responses is None:
+            return self._nl_fallback(text, on_delta, self.conversation(sid), sid)
+        return responses
+
+    async def aprocess(self, sid, text, button_data=None, on_delta=None):
+        """Async `process` for the server: handlers run in the executor, LLM calls are awaited.
+
+        `on_delta` here is a coroutine function.
+        """
+        loop = asyncio.get_running_loop()
+        with span("handler"):  # timed on the loop: executor threads don't see the message's trace
+            routed = loop.run_in_executor(None, self._route, sid, text, button_data)
+            try:
+                responses = await routed
+            except asyncio.CancelledError:
+                # The thread runs on regardless: don't let the caller end the session under it
+                await asyncio.wait([routed])
+                raise
+        if responses is None:
+            return await self._anl_fallback(text, on_delta, self.conversation(sid), sid)
+        return responses
+
+    def live_view(self, action):
+        """Current frames of a LIVE_VIEWS dashboard (cached per store version)."""
+        return getattr(self, LIVE_VIEWS[action])()
+
+    def conversation(self, sid):
+        """The session's LLM context, so follow-up questions continue the previous answer."""
+        session = self.get_session(sid)
+        if session.llm_context is None:
+            session.llm_context = Conversation()
+        return session.llm_context
 
-    def process(self, sid, text, button_data=None):
+    def _route(self, sid, text, button_data):
+        """Button/keyword routing. Returns None when the message needs the NL fallback."""
         session = self.get_session(sid)
         action = button_data or text.strip().lower()
 
@@ -73,20 +193,24 @@ class BotEngine:
             return self._handle_form_submit(form_type, form_data)
 
         # Search state
-        if session["state"] == "search_device":
-            session["state"] = "main_menu"
+        if session.state == "search_device":
+            session.state = "main_menu"
             did = text.strip().upper()
-            if did in DEVICES:
+            if did in self.store.devices:
                 return self._device_detail(did)
             return [{"type": "text", "content": f"❌ Device **{did}** not found.", "buttons": [{"text": "🔍 Try Again", "data": "search_device"}, {"text": "📋 All Devices", "data": "view_all_devices"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
         if action in ("start", "menu", "hi", "hello", "hey", "/start", "home"):
             return self._main_menu()
+        for prefix, kind in SUBJECT_ACTIONS.items():
+            if action.startswith(prefix):
+                self._note_subject(self.conversation(sid), kind, action[len(prefix):])
         if action == "device_status": return self._device_menu()
         if action == "view_all_devices": return self._all_devices()
+        if action.startswith(("devices_page_", "merchants_page_", "alerts_page_")): return self._list_page(action)
         if action.startswith("device_detail_"): return self._device_detail(action[14:])
         if action == "search_device":
-            session["state"] = "search_device"
+            session.state = "search_device"
             return [{"type": "text", "content": "🔍 Enter the Device ID (e.g. POS-1001):"}]
         if action == "merchants": return self._merchant_menu()
         if action == "view_all_merchants": return self._all_merchants()
@@ -98,15 +222,19 @@ class BotEngine:
         if action == "reports": return self._reports_menu()
         if action == "daily_summary": return self._daily_summary()
         if action.startswith("region_report_"): return self._region_report(action[14:])
+        if action == "history": return self._history_report()
+        if action.startswith("history_region_"): return self._history_region(action[15:])
+        if action.startswith("history_by_"): return self._history_by(action[11:])
         if action == "alerts": return self._show_alerts()
         if action.startswith("alert_ack_"): return self._ack_alert(action[10:])
         if action == "help": return self._help_menu()
         if action.startswith("faq_"): return self._show_faq(action[4:])
 
-        return self._nl_fallback(text)
+        return None
 
     # ── Menus ──
 
+    @static_view
     def _main_menu(self):
         return [{"type": "text", "content": "👋 **Welcome to POS Management Bot!**\n\nI can help you manage devices, merchants, view reports and more. What would you like to do?",
                  "buttons": [
@@ -119,11 +247,11 @@ class BotEngine:
 
     # ── Devices ──
 
+    @versioned_view
     def _device_menu(self):
-        online = sum(1 for d in DEVICES.values() if d["status"] == "Online")
-        offline = sum(1 for d in DEVICES.values() if d["status"] == "Offline")
-        maint = sum(1 for d in DEVICES.values() if d["status"] == "Maintenance")
-        return [{"type": "text", "content": f"📱 **Device Dashboard**\n\n🟢 Online: **{online}**  •  🔴 Offline: **{offline}**  •  🟡 Maintenance: **{maint}**\nTotal: **{len(DEVICES)}** devices",
+        counts = self.store.status_counts
+        online, offline, maint = counts["Online"], counts["Offline"], counts["Maintenance"]
+        return [{"type": "text", "content": f"📱 **Device Dashboard**\n\n🟢 Online: **{online}**  •  🔴 Offline: **{offline}**  •  🟡 Maintenance: **{maint}**\nTotal: **{len(self.store.devices)}** devices",
              "buttons": [
                  {"text": "📋 All Devices", "data": "view_all_devices"},
                  {"text": "🔍 Search by ID", "data": "search_device"},
@@ -131,47 +259,50 @@ class BotEngine:
                  {"text": "🏠 Menu", "data": "menu"},
              ]}]
 
+    @versioned_view
     def _all_devices(self):
-        cards = []
-        for did, d in DEVICES.items():
-            icon = {"Online": "🟢", "Offline": "🔴", "Maintenance": "🟡"}.get(d["status"], "⚪")
-            bat = "🪫" if d["battery"] < 20 else "🔋"
-            cards.append({
-                "title": f"{icon} {did} — {d['name']}",
-                "subtitle": f"{d['merchant']} • {d['region']}",
-                "fields": [f"Status: **{d['status']}**", f"{bat} Battery: **{d['battery']}%**", f"Last Txn: {d['last_txn']}"],
-                "buttons": [{"text": "View Details", "data": f"device_detail_{did}"}]
-            })
-        return [{"type": "cards", "content": "📱 **All Devices**", "cards": cards,
-                 "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
+        return self._listing("device")
+
+    def _device_card(self, did):
+        d = self.store.devices[did]
+        icon = {"Online": "🟢", "Offline": "🔴", "Maintenance": "🟡"}.get(d["status"], "⚪")
+        bat = "🪫" if d["battery"] < 20 else "🔋"
+        return {
+            "title": f"{icon} {did} — {d['name']}",
+            "subtitle": f"{d['merchant']} • {d['region']}",
+            "fields": [f"Status: **{d['status']}**", f"{bat} Battery: **{d['battery']}%**", f"Last Txn: {d['last_txn']}"],
+            "buttons": [{"text": "View Details", "data": f"device_detail_{did}"}]
+        }
 
     def _device_detail(self, did):
-        d = DEVICES.get(did)
+        d = self.store.devices.get(did)
         if not d: return [{"type": "text", "content": f"❌ Device {did} not found.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
         icon = {"Online": "🟢", "Offline": "🔴", "Maintenance": "🟡"}.get(d["status"], "⚪")
         content = f"📱 **{did} — {d['name']}** {icon}\n\n| | |\n|---|---|\n| Merchant | {d['merchant']} |\n| Region | {d['region']} |\n| Model | {d['model']} |\n| Firmware | {d['fw']} |\n| Battery | {d['battery']}% |\n| Last Txn | {d['last_txn']} |\n| Status | {d['status']} |"
+        count, paise = self.store.txn_stats.device(did)
+        if count:
+            content += f"\n| Today | {count:,} txns • ₹{paise // 100:,} |"
         btns = [{"text": "📋 All Devices", "data": "view_all_devices"}, {"text": "🏠 Menu", "data": "menu"}]
         if d["status"] == "Online":
             btns.insert(0, {"text": "🔴 Deactivate", "data": f"confirm_deactivate_{did}"})
         return [{"type": "text", "content": content, "buttons": btns}]
 
     def _deactivate_confirm(self, did):
-        d = DEVICES.get(did)
+        d = self.store.devices.get(did)
         if not d: return [{"type": "text", "content": "❌ Device not found.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
         return [{"type": "text", "content": f"⚠️ **Confirm Deactivation**\n\nDevice: **{did}** ({d['name']})\nMerchant: {d['merchant']}\n\nThis will take the device offline.",
                  "buttons": [{"text": "✅ Yes, Deactivate", "data": f"do_deactivate_{did}"}, {"text": "❌ Cancel", "data": f"device_detail_{did}"}]}]
 
     def _do_deactivate(self, did):
-        if did in DEVICES:
-            DEVICES[did]["status"] = "Offline"
-            DEVICES[did]["battery"] = 0
+        self.store.deactivate(did)
         return [{"type": "text", "content": f"✅ Device **{did}** deactivated.",
                  "buttons": [{"text": "📋 All Devices", "data": "view_all_devices"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
     # ── Forms (inline card forms) ──
 
+    @versioned_view
     def _show_device_form(self):
-        merchant_options = [{"value": mid, "label": m["name"]} for mid, m in MERCHANTS.items()]
+        merchant_options = [{"value": mid, "label": m["name"]} for mid, m in list(self.store.merchants.items())]
         return [{"type": "form", "title": "➕ Add New Device", "form_id": "device", "fields": [
             {"name": "device_id", "label": "Device ID", "type": "text", "placeholder": "POS-5001", "required": True},
             {"name": "name", "label": "Device Name", "type": "text", "placeholder": "Counter A", "required": True},
@@ -187,6 +318,7 @@ class BotEngine:
             ], "required": True},
         ]}]
 
+    @static_view
     def _show_merchant_form(self):
         return [{"type": "form", "title": "➕ Add New Merchant", "form_id": "merchant", "fields": [
             {"name": "name", "label": "Merchant Name", "type": "text", "placeholder": "Cafe Blue", "required": True},
@@ -209,28 +341,27 @@ class BotEngine:
             did = data.get("device_id", "").upper()
             if not did or not data.get("name") or not data.get("merchant"):
                 return [{"type": "text", "content": "❌ Please fill all required fields.", "buttons": [{"text": "➕ Try Again", "data": "add_device"}, {"text": "🏠 Menu", "data": "menu"}]}]
-            if did in DEVICES:
-                return [{"type": "text", "content": f"❌ Device **{did}** already exists.", "buttons": [{"text": "➕ Try Again", "data": "add_device"}, {"text": "🏠 Menu", "data": "menu"}]}]
-            mer_name = MERCHANTS.get(data["merchant"], {}).get("name", data["merchant"])
-            DEVICES[did] = {
+            exists = [{"type": "text", "content": f"❌ Device **{did}** already exists.", "buttons": [{"text": "➕ Try Again", "data": "add_device"}, {"text": "🏠 Menu", "data": "menu"}]}]
+            if did in self.store.devices:
+                return exists
+            mer_name = self.store.merchants.get(data["merchant"], {}).get("name", data["merchant"])
+            if not self.store.add_device(did, {
                 "name": data["name"], "merchant": mer_name, "merchant_id": data.get("merchant", ""),
                 "region": data.get("region", ""), "status": "Online", "battery": 100,
                 "last_txn": "—", "model": data.get("model", ""), "fw": "v1.0.0"
-            }
-            if data.get("merchant") in MERCHANTS:
-                MERCHANTS[data["merchant"]]["devices"] += 1
+            }):
+                return exists  # taken by another worker a moment ago
             return [{"type": "text", "content": f"✅ **Device Registered!**\n\n🆔 **{did}**\n📱 {data['name']}\n🏪 {mer_name} • 📍 {data.get('region','')}\n📟 {data.get('model','')}",
                      "buttons": [{"text": "📋 View Devices", "data": "view_all_devices"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
         elif form_type == "merchant":
             if not data.get("name") or not data.get("category"):
                 return [{"type": "text", "content": "❌ Please fill all required fields.", "buttons": [{"text": "➕ Try Again", "data": "add_merchant"}, {"text": "🏠 Menu", "data": "menu"}]}]
-            new_id = f"MER-{len(MERCHANTS)+1:03d}"
-            MERCHANTS[new_id] = {
+            new_id = self.store.add_merchant({
                 "name": data["name"], "category": data["category"], "region": data.get("region", ""),
                 "contact": data.get("contact", ""), "phone": data.get("phone", ""),
                 "devices": 0, "status": "Active", "onboarded": "2026-02-24"
-            }
+            })
             return [{"type": "text", "content": f"✅ **Merchant Created!**\n\n🆔 **{new_id}**\n🏪 {data['name']}\n📂 {data['category']} • 📍 {data.get('region','')}\n👤 {data.get('contact','')}",
                      "buttons": [{"text": "📋 View Merchants", "data": "view_all_merchants"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
@@ -238,83 +369,256 @@ class BotEngine:
 
     # ── Merchants ──
 
+    @versioned_view
     def _merchant_menu(self):
-        active = sum(1 for m in MERCHANTS.values() if m["status"] == "Active")
-        return [{"type": "text", "content": f"🏪 **Merchant Management**\n\n✅ Active: **{active}** merchants\n📱 Total devices: **{sum(m['devices'] for m in MERCHANTS.values())}**",
+        active = self.store.merchant_status_counts["Active"]
+        return [{"type": "text", "content": f"🏪 **Merchant Management**\n\n✅ Active: **{active}** merchants\n📱 Total devices: **{self.store.merchant_devices_total}**",
              "buttons": [
                  {"text": "📋 All Merchants", "data": "view_all_merchants"},
                  {"text": "➕ Add Merchant", "data": "add_merchant"},
                  {"text": "🏠 Menu", "data": "menu"},
              ]}]
 
+    @versioned_view
     def _all_merchants(self):
-        cards = []
-        for mid, m in MERCHANTS.items():
-            cards.append({
-                "title": f"🏪 {m['name']} ({mid})",
-                "subtitle": f"{m['category']} • {m['region']}",
-                "fields": [f"Contact: **{m['contact']}**", f"Devices: **{m['devices']}**", f"Since: {m['onboarded']}"],
-                "buttons": [{"text": "View Details", "data": f"merchant_detail_{mid}"}]
-            })
-        return [{"type": "cards", "content": "🏪 **All Merchants**", "cards": cards,
-                 "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
+        return self._listing("merchant")
+
+    def _merchant_card(self, mid):
+        m = self.store.merchants[mid]
+        return {
+            "title": f"🏪 {m['name']} ({mid})",
+            "subtitle": f"{m['category']} • {m['region']}",
+            "fields": [f"Contact: **{m['contact']}**", f"Devices: **{m['devices']}**", f"Since: {m['onboarded']}"],
+            "buttons": [{"text": "View Details", "data": f"merchant_detail_{mid}"}]
+        }
 
     def _merchant_detail(self, mid):
-        m = MERCHANTS.get(mid)
+        m = self.store.merchants.get(mid)
         if not m: return [{"type": "text", "content": f"❌ Merchant {mid} not found.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
         content = f"🏪 **{m['name']}** ({mid})\n\n| | |\n|---|---|\n| Category | {m['category']} |\n| Region | {m['region']} |\n| Contact | {m['contact']} |\n| Phone | {m['phone']} |\n| Devices | {m['devices']} |\n| Status | {m['status']} |\n| Onboarded | {m['onboarded']} |"
+        count, paise = self.store.txn_stats.merchant(mid)
+        if count:
+            content += f"\n| Today | {count:,} txns • ₹{paise // 100:,} |"
         return [{"type": "text", "content": content, "buttons": [{"text": "📋 All Merchants", "data": "view_all_merchants"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
     # ── Reports ──
 
+    @versioned_view
     def _reports_menu(self):
-        total_txn = sum(r["count"] for r in TRANSACTIONS_DAILY.values())
-        total_vol = sum(r["volume"] for r in TRANSACTIONS_DAILY.values())
-        return [{"type": "text", "content": f"📊 **Reports**\n\n📅 Today:\n💳 **{total_txn:,}** transactions\n💰 **₹{total_vol:,.0f}** volume\n📈 **₹{total_vol//total_txn:,}** avg ticket",
+        total_txn = self.store.txn_count
+        total_vol = self.store.txn_volume
+        return [{"type": "text", "content": f"📊 **Reports**\n\n📅 Today:\n💳 **{total_txn:,}** transactions\n💰 **₹{total_vol:,.0f}** volume\n📈 **₹{total_vol // total_txn if total_txn else 0:,}** avg ticket",
              "buttons": [
                  {"text": "📈 Full Summary", "data": "daily_summary"},
-                 *[{"text": f"📍 {r}", "data": f"region_report_{r}"} for r in TRANSACTIONS_DAILY],
+                 *([{"text": "🗓️ History", "data": "history"}] if self._history() else []),
+                 *[{"text": f"📍 {r}", "data": f"region_report_{r}"} for r in list(self.store.transactions)],
                  {"text": "🏠 Menu", "data": "menu"},
              ]}]
 
+    @versioned_view
     def _daily_summary(self):
         rows = ""
-        for region, data in TRANSACTIONS_DAILY.items():
+        for region, data in list(self.store.transactions.items()):
             rows += f"| {region} | {data['count']:,} | ₹{data['volume']:,.0f} | ₹{data['avg']:,} |\n"
         return [{"type": "text", "content": f"📈 **Daily Summary**\n\n| Region | Txns | Volume | Avg |\n|---|---|---|---|\n{rows}",
                  "buttons": [{"text": "📊 Reports", "data": "reports"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
     def _region_report(self, region):
-        data = TRANSACTIONS_DAILY.get(region)
+        data = self.store.transactions.get(region)
         if not data: return [{"type": "text", "content": f"❌ No data for {region}.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
-        devices = [f"• {did}: {d['name']} ({d['status']})" for did, d in DEVICES.items() if d["region"] == region]
-        return [{"type": "text", "content": f"📍 **{region}**\n\n💳 Txns: **{data['count']:,}**\n💰 Volume: **₹{data['volume']:,.0f}**\n📈 Avg: **₹{data['avg']:,}**\n\n📱 Devices:\n" + "\n".join(devices),
-                 "buttons": [{"text": "📊 Reports", "data": "reports"}, {"text": "🏠 Menu", "data": "menu"}]}]
+        dids, more, total = self.store.page("device", {"region": region}, limit=PAGE_SIZE)
+        devices = [f"• {did}: {d['name']} ({d['status']})" for did, d in ((did, self.store.devices[did]) for did in dids)]
+        buttons = [{"text": "📊 Reports", "data": "reports"}, {"text": "🏠 Menu", "data": "menu"}]
+        if more:
+            devices.append(f"…and {total - len(dids):,} more")
+            buttons.insert(0, {"text": f"📋 Devices in {region}", "data": "devices_page_" + urlencode({"region": region})})
+        hourly = self.store.txn_stats.hourly(region)
+        busiest = max(range(len(hourly)), key=lambda h: hourly[h][0])
+        peak = f"\n⏰ Busiest hour: **{busiest:02d}:00** ({hourly[busiest][0]:,} txns)" if hourly[busiest][0] else ""
+        return [{"type": "text", "content": f"📍 **{region}**\n\n💳 Txns: **{data['count']:,}**\n💰 Volume: **₹{data['volume']:,.0f}**\n📈 Avg: **₹{data['avg']:,}**{peak}\n\n📱 Devices:\n" + "\n".join(devices),
+                 "buttons": buttons}]
+
+    # ── History ──
+
+    def _history(self):
+        """The store's transaction history, or None when there is none to report on."""
+        history = self.store.history
+        return history if history is not None and history.days() else None
+
+    def _label(self, group, key):
+        if group == "merchant":
+            m = self.store.merchants.get(key)
+            return f"{m['name']} ({key})" if m else key
+        return key
+
+    @versioned_view
+    def _history_report(self):
+        history = self._history()
+        if not history: return [{"type": "text", "content": "❌ No transaction history yet.", "buttons": [{"text": "📊 Reports", "data": "reports"}]}]
+        week, before = history.last(7), history.last(14)[:7]
+        now = {r: (c, v) for r, c, v in history.totals("region", week)}
+        prev = {r: v for r, _, v in history.totals("region", before)}
+        count, volume = sum(c for c, _ in now.values()), sum(v for _, v in now.values())
+        rows = "".join(f"| {r} | {c:,} | ₹{v // 100:,} | {pct_change(v, prev.get(r, 0))} |\n" for r, (c, v) in now.items())
+        days = "".join(f"| {day[5:]} | {c:,} | ₹{v // 100:,} |\n" for day, c, v in history.series(week))
+        content = (f"🗓️ **Last 7 days** ({week[0]} – {week[-1]})\n\n💳 **{count:,}** txns • 💰 **₹{volume // 100:,}** "
+                   f"• {pct_change(volume, sum(prev.values()))} week over week\n\n"
+                   f"| Region | Txns | Volume | WoW |\n|---|---|---|---|\n{rows}\n| Day | Txns | Volume |\n|---|---|---|\n{days}")
+        return [{"type": "text", "content": content,
+                 "buttons": [*[{"text": f"📍 {r}", "data": f"history_region_{r}"} for r in now],
+                             *[{"text": text, "data": f"history_by_{group}"} for group, text in HISTORY_GROUPS.items()],
+                             {"text": "📊 Reports", "data": "reports"}, {"text": "🏠 Menu", "data": "menu"}]}]
+
+    def _history_region(self, region):
+        history = self._history()
+        if not history or region not in history.ids["region"]:
+            return [{"type": "text", "content": f"❌ No history for {region}.", "buttons": [{"text": "🗓️ History", "data": "history"}, {"text": "🏠 Menu", "data": "menu"}]}]
+        where = {"region": region}
+        series = history.series(history.last(14), where)
+        rows = "".join(f"| {day[5:]} | {c:,} | ₹{v // 100:,} |\n" for day, c, v in series[7:])
+        this_week, last_week = sum(v for _, _, v in series[7:]), sum(v for _, _, v in series[:7])
+        hours = history.hourly(history.last(28), where)
+        peaks = sorted(range(24), key=lambda h: -hours[h][0])[:3]
+        content = (f"📍 **{region}** — last 7 days\n\n💰 **₹{this_week // 100:,}** ({pct_change(this_week, last_week)} week over week)\n\n"
+                   f"| Day | Txns | Volume |\n|---|---|---|\n{rows}\n"
+                   f"⏰ Busiest hours (4 weeks): " + ", ".join(f"**{h:02d}:00**" for h in peaks if hours[h][0]))
+        return [{"type": "text", "content": content,
+                 "buttons": [{"text": f"📍 {region} today", "data": f"region_report_{region}"},
+                             {"text": "🗓️ History", "data": "history"}, {"text": "🏠 Menu", "data": "menu"}]}]
+
+    def _history_by(self, group):
+        history = self._history()
+        if not history or group not in HISTORY_GROUPS:
+            return [{"type": "text", "content": "❌ No such history report.", "buttons": [{"text": "🗓️ History", "data": "history"}, {"text": "🏠 Menu", "data": "menu"}]}]
+        days = history.last(30)
+        totals = history.totals(group, days)
+        volume = sum(v for _, _, v in totals) or 1
+        rows = "".join(f"| {self._label(group, key)} | {c:,} | ₹{v // 100:,} | {v * 100 / volume:.1f}% |\n" for key, c, v in totals[:10])
+        content = (f"{HISTORY_GROUPS[group]} — last 30 days ({days[0]} – {days[-1]})\n\n"
+                   f"| {group.title()} | Txns | Volume | Share |\n|---|---|---|---|\n{rows}")
+        return [{"type": "text", "content": content,
+                 "buttons": [{"text": "🗓️ History", "data": "history"}, {"text": "🏠 Menu", "data": "menu"}]}]
+
+    def _history_facts(self, text):
+        """Exact history figures a free-text question is about (compare cities, week over week…), or []."""
+        history = self._history()
+        if not history:
+            return []
+        lower = text.lower()
+        regions = [r for r in history.keys["region"] if r.lower() in lower]
+        if not (HISTORY_QUESTION.search(text) or len(regions) > 1):
+            return []
+        n = 30 if "month" in lower else 1 if "yesterday" in lower else 7
+        group = next((g for g, stem in (("category", "categor"), ("model", "model"), ("merchant", "merchant")) if stem in lower), "region")
+        current, previous = history.last(n), history.last(2 * n)[:n]
+        now = {key: (c, v) for key, c, v in history.totals(group, current)}
+        keys = regions if group == "region" and regions else list(now)[:8]
+        span_text = current[0] if n == 1 else f"{current[0]} to {current[-1]}"
+        covered = previous[0] >= history.days()[0]  # only compare with a window the history fully covers
+        before = {key: (c, v) for key, c, v in history.totals(group, previous)} if covered else {}
+        lines = [f"HISTORY by {group}, {span_text}{f' vs the {n} day(s) before' if covered else ''} "
+                 "(exact totals from the transaction log):"]
+        for key in keys:
+            c, v = now.get(key, (0, 0))
+            line = f"  {self._label(group, key)}: {c:,} txns, ₹{v // 100:,}"
+            if covered:
+                pc, pv = before.get(key, (0, 0))
+                line += f" ({pct_change(v, pv)}; before: {pc:,} txns, ₹{pv // 100:,})"
+            lines.append(line)
+        return lines
+
+    def _history_answer(self, facts):
+        """Offline answer to a history question: the figures themselves."""
+        return [{"type": "text", "content": "🗓️ " + facts[0].split(" (exact")[0] + "\n\n" + "\n".join(f"• {line.strip()}" for line in facts[1:]),
+                 "buttons": [{"text": "🗓️ History", "data": "history"}, {"text": "📊 Reports", "data": "reports"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
     # ── Alerts ──
 
+    @versioned_view
     def _show_alerts(self):
-        if not ALERTS:
+        if not self.store.alerts:
             return [{"type": "text", "content": "✅ No active alerts!", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
-        cards = []
-        for a in ALERTS:
-            icon = {"critical": "🔴", "warning": "🟡", "info": "🔵"}.get(a["severity"], "⚪")
-            cards.append({
-                "title": f"{icon} {a['type']}", "subtitle": f"{a['device']} • {a['merchant']}",
-                "fields": [f"Time: {a['time']}", f"Severity: **{a['severity'].upper()}**"],
-                "buttons": [{"text": "✅ Acknowledge", "data": f"alert_ack_{a['id']}"}]
-            })
-        return [{"type": "cards", "content": f"🔔 **Alerts** ({len(ALERTS)})", "cards": cards,
-                 "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
+        return self._listing("alert")
+
+    def _alert_card(self, aid):
+        a = self.store.alerts[aid]
+        icon = {"critical": "🔴", "warning": "🟡", "info": "🔵"}.get(a["severity"], "⚪")
+        return {
+            "title": f"{icon} {a['type']}", "subtitle": f"{a['device']} • {a['merchant']}",
+            "fields": [f"Time: {a['time']}", f"Severity: **{a['severity'].upper()}**"],
+            "buttons": [{"text": "✅ Acknowledge", "data": f"alert_ack_{aid}"}]
+        }
+
+    def alert_message(self, alert):
+        """Message pushed to every open chat when a critical alert is raised."""
+        return {"type": "text", "content": f"🚨 **{alert['type']}**\n\n📱 {alert['device']} • {alert['merchant']} • {alert['time']}",
+                "buttons": [{"text": "✅ Acknowledge", "data": f"alert_ack_{alert['id']}"}, {"text": "🔔 Alerts", "data": "alerts"}]}
 
     def _ack_alert(self, aid):
-        global ALERTS
-        ALERTS = [a for a in ALERTS if a["id"] != aid]
-        return [{"type": "text", "content": f"✅ Alert **{aid}** cleared.\n🔔 Remaining: **{len(ALERTS)}**",
+        self.store.ack_alert(aid)
+        return [{"type": "text", "content": f"✅ Alert **{aid}** cleared.\n🔔 Remaining: **{len(self.store.alerts)}**",
                  "buttons": [{"text": "🔔 Alerts", "data": "alerts"}, {"text": "🏠 Menu", "data": "menu"}]}]
 
+    # ── Listings (cursor-paginated) ──
+
+    def _list_page(self, action):
+        prefix, _, query = action.partition("_page_")
+        kind = prefix[:-1]
+        params = dict(parse_qsl(query))
+        try:
+            return self._listing(kind, params, action)
+        except ValueError:
+            return [{"type": "text", "content": "❌ Unknown listing.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
+
+    def _listing(self, kind, params=None, action=None):
+        """First page of a listing as a cards message; later pages as `cards_page` for the widget to append."""
+        params = params or {}
+        sort = params.get("sort", "id")
+        filters = {f: params[f] for f in ("status", "region", "severity") if f in params}
+        after = cursor_key(params["after"]) if params.get("after") else None
+        try:
+            ids, cursor, total = self.store.page(kind, filters, sort, after, PAGE_SIZE)
+        except TypeError:  # a cursor from another sort order
+            raise ValueError(params["after"]) from None
+        card = {"device": self._device_card, "merchant": self._merchant_card, "alert": self._alert_card}[kind]
+        msg = {"cards": [card(i) for i in ids]}
+        if cursor is not None:
+            more = dict(params, after=cursor_str(cursor))
+            msg["more"] = f"{kind}s_page_{urlencode(more)}"
+        if after is not None:
+            return [{"type": "cards_page", "page": action, **msg}]
+
+        title = LIST_TITLES[kind]
+        if filters or sort != "id" or cursor is not None:
+            detail = " · ".join([*filters.values(), *([f"by {sort}"] if sort != "id" else [])])
+            title += f" — {detail} ({total:,})" if detail else f" ({total:,})"
+        elif kind == "alert":
+            title += f" ({total})"
+        if not ids:
+            return [{"type": "text", "content": f"{title}\n\nNothing matches.", "buttons": [{"text": "🏠 Menu", "data": "menu"}]}]
+        buttons = [{"text": "🏠 Menu", "data": "menu"}]
+        if filters or sort != "id" or cursor is not None:
+            buttons[:0] = self._listing_buttons(kind, filters, sort)
+        return [{"type": "cards", "content": title, **msg, "buttons": buttons}]
+
+    def _listing_buttons(self, kind, filters, sort):
+        """Filter / sort shortcuts shown on large or filtered listings."""
+        options = {
+            "device": [("🔴 Offline", {"status": "Offline"}), ("🟡 Maintenance", {"status": "Maintenance"}),
+                       ("🪫 Low Battery First", {"sort": "battery"})],
+            "merchant": [("📱 Most Devices First", {"sort": "devices"})],
+            "alert": [("🔴 Critical", {"severity": "critical"}), ("⚠️ By Severity", {"sort": "severity"})],
+        }[kind]
+        current = dict(filters, **({"sort": sort} if sort != "id" else {}))
+        buttons = [{"text": text, "data": f"{kind}s_page_{urlencode(params)}"}
+                   for text, params in options if params != current]
+        if current:
+            buttons.append({"text": "📋 Show All", "data": {"device": "view_all_devices", "merchant": "view_all_merchants", "alert": "alerts"}[kind]})
+        return buttons
+
     # ── Help ──
 
+    @static_view
     def _help_menu(self):
         return [{"type": "text", "content": "❓ **Help & FAQ**\n\nSelect a topic or type your question:",
                  "buttons": [
@@ -331,49 +635,187 @@ class BotEngine:
 
     # ── NL Fallback (LLM Intent Classification → Route to Handler) ──
 
-    def _nl_fallback(self, text):
-        t = text.lower()
-
+    def _nl_flow(self, text, conversation, sid=None):
+        """The NL fallback, shared by `_nl_fallback` and `_anl_fallback` as a generator.
+
+        It yields ("classify", text) and ("answer", question, snapshot) for the caller
+        to run against its Ollama client and send() the result back; it returns the
+        responses. `sid` holds at most one place in `llm_work` at a time.
+        """
+        specific = self._subjects(text, conversation)
+        quick = self._nl_quick(text)
+        if quick: return quick
+
+        # Intent classification — local fast path first, LLM only when unsure
+        # (health is a cached probe + circuit breaker, so an outage costs nothing here)
+        with span("health"):
+            online = health.allow()
+        admitted = abandoned = False
+        try:
+            # Past the LLM work limit the message is shed: answered as if Ollama were down
+            admitted = bool(online) and self.llm_work.try_enter(sid)
+            if online and not admitted:
+                ADMISSION.inc(outcome="shed")
+            with span("classify"):
+                intent = (yield "classify", text) if admitted else local_intent(text)
+            INTENTS.inc(intent=intent or "unknown")
+            routed = self._nl_route(text, intent, specific)
+            if routed: return routed
+
+            with span("history"):
+                facts = self._history_facts(text)
+            if admitted:
+                # GENERAL intent — full LLM answer
+                with span("snapshot"):
+                    snapshot = self.snapshot.render(conversation.focus(text) if conversation else text)
+                    if facts:
+                        snapshot += "\n\n" + "\n".join(facts)
+                    question = conversation.ask(text, snapshot) if conversation else text
+                with span("answer"):
+                    ai_response = yield "answer", question, snapshot
+
+                answer = self._nl_answer(ai_response)
+                if answer:
+                    if conversation:
+                        conversation.remember(text, ai_response)
+                    return answer
+
+            if facts: return self._history_answer(facts)
+            if conversation and conversation.refers_back(text): return self._subject_view(conversation)
+            return self._nl_menu() if admitted or not online else self._nl_busy()
+        except GeneratorExit:
+            abandoned = True  # closed mid-request: superseded, or the chat went away
+            raise
+        finally:
+            if admitted:
+                self.llm_work.leave(sid, abandoned)
+            # A half-open trial that never reached Ollama (local intent, cached reply, a view
+            # route, shed or cancelled) must not block everyone else until trial_timeout
+            health.release(online)
+
+    def _nl_fallback(self, text, on_delta=None, conversation=None, sid=None):
+        """Run `_nl_flow` with the blocking Ollama client."""
+        flow = self._nl_flow(text, conversation, sid)
+        try:
+            request = next(flow)
+            while True:
+                if request[0] == "classify":
+                    result = classify_intent(text)
+                elif on_delta:
+                    parts = []
+                    for chunk in stream_answer(request[1], request[2], conversation):
+                        parts.append(chunk)
+                        on_delta(chunk)
+                    result = "".join(parts).strip()
+                else:
+                    result = generate_answer(request[1], request[2], conversation)
+                request = flow.send(result)
+        except StopIteration as done:
+            return done.value
+        finally:
+            flow.close()
+
+    async def _anl_fallback(self, text, on_delta=None, conversation=None, sid=None):
+        """Run `_nl_flow` awaiting the async Ollama client."""
+        flow = self._nl_flow(text, conversation, sid)
+        try:
+            request = next(flow)
+            while True:
+                if request[0] == "classify":
+                    result = await self.llm.classify_intent(text)
+                elif on_delta:
+                    parts = []
+                    async for chunk in self.llm.stream_answer(request[1], request[2], conversation):
+                        parts.append(chunk)
+                        await on_delta(chunk)
+                    result = "".join(parts).strip()
+                else:
+                    result = await self.llm.generate_answer(request[1], request[2], conversation)
+                request = flow.send(result)
+        except StopIteration as done:
+            return done.value
+        finally:
+            flow.close()  # cancelled mid-request: releases the LLM work slot
+
+    # ── Conversation subjects ──
+
+    def _note_subject(self, conversation, kind, key):
+        if kind == "device" and key in self.store.devices:
+            d = self.store.devices[key]
+            conversation.note(kind, key, f"{d['name']}, {d['merchant']}")
+        elif kind == "merchant" and key in self.store.merchants:
+            conversation.note(kind, key, self.store.merchants[key]["name"])
+        elif kind == "region" and key in self.store.by_region:
+            conversation.note(kind, key)
+
+    def _subjects(self, text, conversation):
+        """Note what `text` names; True if it names a device/merchant/region."""
+        dids, mids, regions = self.snapshot.mentions(text)
+        if conversation is None:
+            return bool(dids or mids or regions)
+        # Noted in reverse so the first one named ends up the most recent subject
+        for kind, keys in (("region", regions), ("merchant", mids), ("device", dids)):
+            if keys:
+                self._note_subject(conversation, kind, keys[0])
+        return bool(dids or mids or regions)
+
+    def _subject_view(self, conversation):
+        """The conversation's current subject, shown as its own view (the offline answer to a follow-up)."""
+        kind, key = conversation.subject()
+        if kind == "device": return self._device_detail(key)
+        if kind == "merchant": return self._merchant_detail(key)
+        return self._region_report(key)
+
+    def _nl_quick(self, text):
         # Quick regex — device ID mentioned directly
-        match = re.search(r'pos-\d{4}', t, re.I)
+        match = re.search(r'pos-\d{4}', text.lower(), re.I)
         if match: return self._device_detail(match.group().upper())
+        return None
+
+    def _nl_route(self, text, intent, specific=False):
+        """Route a classified intent to an existing handler, or None for a full LLM answer.
+
+        `specific`: the message names a device/merchant/region, so it needs an answer. A follow-up
+        never overrides a route: it only counts when the intent isn't one (`Conversation.refers_back`).
+        """
+        # Only generic queries like "show me the reports" get a view; "reports for delhi and
+        # mumbai this week" goes to the LLM. A region intent is its own subject.
+        words = [w for w in normalize(text).split() if w not in STOPWORDS]
+        if len(words) >= SPECIFIC_WORDS:
+            return None
+        if intent in INTENT_REGIONS:
+            dids, mids, regions = self.snapshot.mentions(text)
+            region = intent.title()
+            if dids or mids or set(regions) - {region}:
+                return None
+            return self._region_report(region)
+        if specific:
+            return None
+        if intent in INTENT_VIEWS:
+            return getattr(self, INTENT_VIEWS[intent])()
+        if intent in INTENT_FAQS:
+            return self._show_faq(INTENT_FAQS[intent])
+        return None
+
+    def _nl_answer(self, ai_response):
+        if ai_response and not ai_response.startswith("⚠️"):
+            return [{"type": "text", "content": f"🤖 **NexPOS AI**\n\n{ai_response}",
+                     "buttons": [
+                         {"text": "📱 Devices", "data": "device_status"},
+                         {"text": "🏪 Merchants", "data": "merchants"},
+                         {"text": "📊 Reports", "data": "reports"},
+                         {"text": "🏠 Menu", "data": "menu"},
+                     ]}]
+        return None
+
+    @static_view
+    def _nl_busy(self):
+        # Shed — too many questions already waiting for the LLM
+        return [{"type": "text", "content": "⏳ The AI assistant is busy right now. Ask again in a moment, or pick an option:",
+                 "buttons": [{"text": "📱 Devices", "data": "device_status"}, {"text": "🏪 Merchants", "data": "merchants"}, {"text": "📊 Reports", "data": "reports"}, {"text": "🔔 Alerts", "data": "alerts"}, {"text": "❓ Help", "data": "help"}]}]
 
-        # LLM Intent Classification — ALL free text goes through this
-        if is_ollama_running():
-            intent = classify_intent(text)
-
-            # Route to existing handlers based on classified intent
-            INTENT_ROUTES = {
-                "DEVICE":       self._device_menu,
-                "ADD_DEVICE":   self._show_device_form,
-                "MERCHANT":     self._merchant_menu,
-                "ADD_MERCHANT": self._show_merchant_form,
-                "REPORT":       self._reports_menu,
-                "ALERT":        self._show_alerts,
-                "HELP":         self._help_menu,
-            }
-
-            # If intent has a specific qualifier (city, ID, name, etc.), send to LLM for smart answer
-            # Only use handler for generic/short queries like "reports", "devices", "alerts"
-            words = text.strip().split()
-            is_specific = len(words) >= 3  # "reports for delhi", "show me mumbai devices", etc.
-
-            if intent in INTENT_ROUTES and not is_specific:
-                return INTENT_ROUTES[intent]()
-
-            # GENERAL intent — full LLM answer
-            snapshot = build_data_snapshot(DEVICES, MERCHANTS, TRANSACTIONS_DAILY, ALERTS)
-            ai_response = generate_answer(text, snapshot)
-
-            if ai_response and not ai_response.startswith("⚠️"):
-                return [{"type": "text", "content": f"🤖 **NexPOS AI**\n\n{ai_response}",
-                         "buttons": [
-                             {"text": "📱 Devices", "data": "device_status"},
-                             {"text": "🏪 Merchants", "data": "merchants"},
-                             {"text": "📊 Reports", "data": "reports"},
-                             {"text": "🏠 Menu", "data": "menu"},
-                         ]}]
-
+    @static_view
+    def _nl_menu(self):
         # Final fallback — Ollama not running
         return [{"type": "text", "content": "🤔 I'm not sure what you need. Pick an option:",
                  "buttons": [{"text": "📱 Devices", "data": "device_status"}, {"text": "🏪 Merchants", "data": "merchants"}, {"text": "📊 Reports", "data": "reports"}, {"text": "🔔 Alerts", "data": "alerts"}, {"text": "❓ Help", "data": "help"}]}]
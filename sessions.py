@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Bounded chat-session store — idle TTL, LRU cap and explicit end on disconnect.
+
+Sessions live in an OrderedDict kept in last-used order, so both expiry and
+eviction only ever look at the front: touching a session is O(1) and the
+store never scans. Each session is a small slotted object rather than a dict.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class Session:
+    __slots__ = ("sid", "state", "last_seen", "llm_context")
+
+    def __init__(self, sid, now):
+        self.sid = sid
+        self.state = "main_menu"
+        self.last_seen = now
+        self.llm_context = None  # ollama_client.Conversation, once the session asks the LLM something
+
+
+class SessionStore:
+    """sid -> Session. `get()` creates or touches; `end()` drops a session when its socket closes."""
+
+    def __init__(self, ttl=1800.0, max_sessions=10_000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.created = 0
+        self.ended = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()   # handlers run on executor threads
+
+    def get(self, sid) -> Session:
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None and now - session.last_seen <= self.ttl:
+                session.last_seen = now
+                self._sessions.move_to_end(sid)
+                return session
+            if session is not None:
+                del self._sessions[sid]
+                self.expired += 1
+            self._expire(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+            session = self._sessions[sid] = Session(sid, now)
+            self.created += 1
+            return session
+
+    def end(self, sid):
+        with self._lock:
+            if self._sessions.pop(sid, None) is not None:
+                self.ended += 1
+
+    def sweep(self):
+        """Drop idle sessions now (get() also does this lazily)."""
+        with self._lock:
+            self._expire(self.clock())
+
+    def _expire(self, now):
+        sessions = self._sessions
+        while sessions:
+            session = next(iter(sessions.values()))
+            if now - session.last_seen <= self.ttl:
+                break
+            sessions.popitem(last=False)
+            self.expired += 1
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, sid):
+        return sid in self._sessions
+
+    def stats(self):
+        with self._lock:
+            live = len(self._sessions)
+            # Table + per-entry cost (session object, its sid and the linked-list node)
+            per_session = sys.getsizeof(Session("", 0.0)) + sys.getsizeof("x" * 10) + 56
+            nbytes = sys.getsizeof(self._sessions) + live * per_session
+        return {"live": live, "bytes": nbytes, "created": self.created, "ended": self.ended,
+                "expired": self.expired, "evicted": self.evicted}
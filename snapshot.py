@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Incrementally maintained data snapshot for LLM context.
+
+Per-entity lines are formatted once and re-formatted only when that entity
+changes; the FleetStore reports changes through on_change (see for_store).
+Small fleets get the full snapshot (cached per version). Large fleets get a
+bounded summary: aggregates plus only the rows the question is about (IDs,
+merchant names or a region mentioned in it).
+
+Sections run from least to most volatile (merchants, devices, alerts, live
+transaction totals, then the question's own rows), so consecutive prompts share
+the longest possible prefix and Ollama re-evaluates only the tail.
+"""
+
+import heapq
+import re
+from collections import Counter, defaultdict
+
+DEVICE_ID_RE = re.compile(r"pos-\d+", re.I)
+MERCHANT_ID_RE = re.compile(r"mer-\d+", re.I)
+SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+
+
+def device_line(did, d):
+    return f"  {did}: {d['name']} @ {d['merchant']} ({d['region']}) — {d['status']}, Battery:{d['battery']}%"
+
+
+def merchant_line(mid, m):
+    return f"  {mid}: {m['name']} ({m['category']}, {m['region']}) — {m['devices']} devices"
+
+
+def txn_line(region, data):
+    return f"  {region}: {data['count']} txns, ₹{data['volume']:,} volume"
+
+
+def alert_line(a):
+    return f"  {a['id']}: {a['type']} — {a['device']} ({a['severity']})"
+
+
+class SnapshotManager:
+    """Keeps snapshot lines and aggregates in step with the live data dicts."""
+
+    def __init__(self, devices, merchants, transactions, alerts, max_rows=40, max_alerts=10):
+        self.devices = devices
+        self.merchants = merchants
+        self.transactions = transactions
+        self.max_rows = max_rows
+        self.max_alerts = max_alerts
+        self.version = 0
+        self._device_lines = {}
+        self._device_keys = {}                 # did -> (status, region) as last counted
+        self._by_region = defaultdict(set)     # region -> device ids
+        self._status_counts = Counter()
+        self._merchant_lines = {}
+        self._merchant_names = {}              # lowercase name -> merchant id
+        self._alerts = {}                      # id -> alert (insertion ordered)
+        self._alert_lines = {}
+        self._full = (None, "")                # (version, rendered)
+        for did in devices:
+            self.device_changed(did)
+        for mid in merchants:
+            self.merchant_changed(mid)
+        for a in alerts:
+            self.alert_added(a)
+        self.version = 0
+
+    @classmethod
+    def for_store(cls, store, **kwargs):
+        """Snapshot over a FleetStore, kept current through its change notifications."""
+        snapshot = cls(store.devices, store.merchants, store.transactions, store.alerts.values(), **kwargs)
+        store.subscribe(snapshot.on_change)
+        return snapshot
+
+    def on_change(self, kind, key, record):
+        if kind == "device":
+            self.device_changed(key)
+        elif kind == "merchant":
+            self.merchant_changed(key)
+        elif kind == "alert":
+            if record is None:
+                self.alert_removed(key)
+            else:
+                self.alert_added(record)
+        elif kind == "transactions":
+            self.transactions_changed()
+
+    # ── Change hooks (O(1) each) ──
+
+    def device_changed(self, did):
+        old = self._device_keys.pop(did, None)
+        if old:
+            self._status_counts[old[0]] -= 1
+            self._by_region[old[1]].discard(did)
+        d = self.devices.get(did)
+        if d is None:
+            self._device_lines.pop(did, None)
+        else:
+            self._device_lines[did] = device_line(did, d)
+            self._device_keys[did] = (d["status"], d["region"])
+            self._status_counts[d["status"]] += 1
+            self._by_region[d["region"]].add(did)
+        self.version += 1
+
+    def merchant_changed(self, mid):
+        m = self.merchants.get(mid)
+        if m is None:
+            self._merchant_lines.pop(mid, None)
+        else:
+            self._merchant_lines[mid] = merchant_line(mid, m)
+            self._merchant_names[m["name"].lower()] = mid
+        self.version += 1
+
+    def alert_added(self, alert):
+        self._alerts[alert["id"]] = alert
+        self._alert_lines[alert["id"]] = alert_line(alert)
+        self.version += 1
+
+    def alert_removed(self, aid):
+        if self._alerts.pop(aid, None) is not None:
+            del self._alert_lines[aid]
+            self.version += 1
+
+    def transactions_changed(self):
+        self.version += 1
+
+    # ── Rendering ──
+
+    def render(self, query=None) -> str:
+        if len(self._device_lines) + len(self._merchant_lines) <= self.max_rows:
+            return self._render_full()
+        return self._render_summary(query or "")
+
+    def _render_full(self):
+        version, text = self._full
+        if version != self.version:
+            lines = ["MERCHANTS:", *self._merchant_lines.values(), "\nDEVICES:", *self._device_lines.values()]
+            lines += self._alert_and_txn_lines(list(self._alert_lines.values()))
+            text = "\n".join(lines)
+            self._full = (self.version, text)
+        return text
+
+    def _alert_and_txn_lines(self, alert_lines):
+        lines = [f"\nACTIVE ALERTS: {len(self._alerts)}", *alert_lines, "\nTODAY'S TRANSACTIONS:"]
+        return lines + [txn_line(region, data) for region, data in list(self.transactions.items())]
+
+    def mentions(self, query):
+        """(device ids, merchant ids, regions) that `query` names — merchants by id or by name."""
+        q = query.lower()
+        dids = [m.upper() for m in DEVICE_ID_RE.findall(q) if m.upper() in self._device_lines]
+        mids = [m.upper() for m in MERCHANT_ID_RE.findall(q) if m.upper() in self._merchant_lines]
+        # Merchant names: look up the query's 1-4 word n-grams rather than scanning every merchant
+        words = re.findall(r"[\w'&-]+", q)
+        for n in range(1, 5):
+            for i in range(len(words) - n + 1):
+                mid = self._merchant_names.get(" ".join(words[i:i + n]))
+                if mid and mid not in mids:
+                    mids.append(mid)
+        regions = [region for region in list(self._by_region) if region and region.lower() in q]
+        return dids, mids, regions
+
+    def _relevant(self, query):
+        """Device and merchant ids the question refers to, capped at max_rows."""
+        dids, mids, regions = self.mentions(query)
+        for region in regions:
+            dids += list(self._by_region[region])[:self.max_rows]  # copied in one step: the set may change meanwhile
+        budget = self.max_rows
+        return dids[:budget], mids[:max(0, budget - len(dids))]
+
+    def _render_summary(self, query):
+        total = len(self._device_lines)
+        status = ", ".join(f"{s}: {n}" for s, n in self._status_counts.most_common() if n)
+        regions = ", ".join(f"{r}: {len(ids)}" for r, ids in sorted(self._by_region.items()) if ids)
+        lines = [f"FLEET SUMMARY: {total} devices ({status}); {len(self._merchant_lines)} merchants",
+                 f"DEVICES BY REGION: {regions}"]
+        worst = heapq.nsmallest(self.max_alerts, list(self._alerts.values()),
+                                key=lambda a: SEVERITY_ORDER.get(a["severity"], 3))
+        lines += self._alert_and_txn_lines([self._alert_lines[a["id"]] for a in worst])
+        dids, mids = self._relevant(query)
+        if mids:
+            lines += ["\nMERCHANTS (relevant):", *(self._merchant_lines[mid] for mid in mids)]
+        if dids:
+            lines += ["\nDEVICES (relevant):", *(self._device_lines[did] for did in dids)]
+        return "\n".join(lines)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""In-memory static asset cache — precompressed variants, strong ETags, 304s.
+
+Everything under the static directory is read once at startup. Each asset
+keeps its identity bytes plus gzip (and brotli, if the `brotli` package is
+installed) variants when they are meaningfully smaller, so serving a request
+is a dict lookup with no filesystem access. With `reload=True` (development)
+each request stats its file and re-reads it when the mtime changes.
+"""
+
+import gzip
+import hashlib
+import os
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional — gzip only
+    brotli = None
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8", ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8", ".png": "image/png",
+    ".svg": "image/svg+xml", ".ico": "image/x-icon", ".json": "application/json",
+}
+# Already-compressed formats aren't worth another pass
+INCOMPRESSIBLE = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff2", ".gz", ".br"}
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Asset:
+    __slots__ = ("path", "mtime", "content_type", "cache_control", "variants")
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = path.stat().st_mtime_ns
+        self.content_type = CONTENT_TYPES.get(path.suffix, "application/octet-stream")
+        # HTML revalidates every load (a 304 is ~free); other assets may sit in the browser cache
+        self.cache_control = "no-cache" if path.suffix == ".html" else "public, max-age=3600"
+        body = path.read_bytes()
+        tag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {"identity": (body, f'"{tag}"')}  # encoding -> (bytes, strong ETag)
+        if path.suffix not in INCOMPRESSIBLE:
+            self._add("gzip", gzip.compress(body, 9, mtime=0), tag, len(body))
+            if brotli is not None:
+                self._add("br", brotli.compress(body, quality=11), tag, len(body))
+
+    def _add(self, encoding, data, tag, size):
+        if len(data) < size * 0.9:
+            self.variants[encoding] = (data, f'"{tag}-{encoding}"')
+
+    def select(self, accept_encoding):
+        """(encoding, body, etag) of the best variant for this client."""
+        accepted = accepted_encodings(accept_encoding) if accept_encoding else ()
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return (encoding, *self.variants[encoding])
+        return ("identity", *self.variants["identity"])
+
+    def matches(self, if_none_match):
+        """True when an If-None-Match header names any variant of this asset (weak comparison)."""
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip()[2:] if t.strip().startswith("W/") else t.strip() for t in if_none_match.split(",")}
+        return any(etag in tags for _, etag in self.variants.values())
+
+
+class StaticCache:
+    """URL path -> Asset for every file under `root`."""
+
+    def __init__(self, root, reload=False):
+        self.root = Path(root)
+        self.reload = reload
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = Path(dirpath) / name
+                assets["/" + path.relative_to(self.root).as_posix()] = Asset(path)
+        self.assets = assets
+
+    def get(self, url_path):
+        path = url_path.split("?", 1)[0] or "/"
+        if path == "/":
+            path = "/index.html"
+        asset = self.assets.get(path)
+        if self.reload:
+            asset = self._refresh(path, asset)
+        return asset
+
+    def _refresh(self, path, asset):
+        file_path = self.root / path.lstrip("/")
+        try:
+            mtime = file_path.stat().st_mtime_ns if file_path.is_file() else None
+        except OSError:
+            mtime = None
+        if mtime is None:
+            self.assets.pop(path, None)
+            return None
+        # Only files under root: the lookup key may come straight from the request
+        if asset is None and self.root.resolve() not in file_path.resolve().parents:
+            return None
+        if asset is None or asset.mtime != mtime:
+            asset = self.assets[path] = Asset(file_path)
+        return asset
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""In-memory fleet store — devices, merchants, transactions and alerts with secondary indexes.
+
+Every mutation updates the record, its index entries and the running
+aggregates together, bumps `version`, then notifies subscribers with
+(kind, key, record) — record is None when the entity was removed.
+
+Listings (`page()`) are served from sorted indexes, one per (kind, sort,
+filters) combination, built on first use and then maintained per change, so
+a page costs O(log n + page size) however large the fleet.
+
+Handlers, the ingest feed, the alert sweep and the replicator all run on
+their own threads. Mutations hold one re-entrant write lock (listeners may
+write too: a telemetry report can raise an alert), so ids are allocated and
+check-then-insert decisions made atomically. Readers take no lock: records
+are never edited in place but replaced by an updated copy, so a record a
+reader holds is a consistent snapshot. Code that iterates a whole collection
+should iterate a copy (`list(store.merchants.items())`), since an insert
+may land mid-loop.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from collections import Counter, defaultdict
+
+from ingest import TxnAggregates
+
+SEVERITY_RANK = {"critical": 0, "warning": 1, "info": 2}
+
+# kind -> sort name -> key(id, record). Keys end with the id, so they are unique and
+# double as keyset-pagination cursors.
+SORT_KEYS = {
+    "device": {"id": lambda did, d: (did,), "battery": lambda did, d: (d["battery"], did)},
+    "merchant": {"id": lambda mid, m: (mid,), "devices": lambda mid, m: (-m["devices"], mid)},
+    "alert": {"id": lambda aid, a: (aid,), "severity": lambda aid, a: (SEVERITY_RANK.get(a["severity"], 3), aid)},
+}
+# kind -> fields a listing can be filtered on (exact match)
+FILTER_FIELDS = {"device": ("status", "region"), "merchant": ("region",), "alert": ("severity",)}
+# A report that changes nothing still tells the other workers the device is alive (the alert sweep
+# runs on one of them), but only once this often per device rather than on every heartbeat
+HEARTBEAT_LOG_INTERVAL = 60.0
+
+
+class SortedIndex:
+    """Sorted list of keys with keyset pagination."""
+
+    def __init__(self, keys=()):
+        self.keys = sorted(keys)
+
+    def add(self, key):
+        bisect.insort(self.keys, key)
+
+    def remove(self, key):
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def page(self, after, limit):
+        """Up to `limit` keys strictly after `after` (None = from the start)."""
+        i = 0 if after is None else bisect.bisect_right(self.keys, after)
+        return self.keys[i:i + limit]
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _writer(method):
+    """Run a mutation under the store's write lock."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def _seq(ids, prefix):
+    """Highest number among ids like "MER-012"; 0 if there are none."""
+    return max((int(i[len(prefix) + 1:]) for i in ids if i[len(prefix) + 1:].isdigit()), default=0)
+
+
+class FleetStore:
+    def __init__(self, devices, merchants, transactions, alerts):
+        self.devices = devices                          # did -> record
+        self.merchants = merchants                      # mid -> record
+        self.transactions = transactions                # region -> {"count", "volume", "avg"}
+        self.alerts = {a["id"]: a for a in alerts}      # aid -> record (insertion ordered)
+        self.version = 0
+        self.journal = None                             # persistence.FleetJournal, when durable
+        self.replica = None                             # persistence.Replicator, when workers share the database
+        self.history = None                             # history.TxnHistory, when transactions are kept
+        self._listeners = []
+        self._heartbeats = {}                           # did -> time.monotonic() its last unchanged report was logged
+        self.lock = threading.RLock()                   # held by every mutation; readers never take it
+
+        # Secondary indexes: key -> set of device ids
+        self.by_status = defaultdict(set)
+        self.by_region = defaultdict(set)
+        self.by_merchant = defaultdict(set)
+        # Running aggregates
+        self.status_counts = Counter()
+        self.merchant_status_counts = Counter()
+        self.merchant_devices_total = 0
+        # Last id number handed out per kind. Acknowledged alerts are deleted, so counting rows would reuse ids
+        self.seq = {"merchant": _seq(merchants, "MER"), "alert": _seq(self.alerts, "ALT")}
+        self.txn_count = 0
+        self.txn_volume = 0
+        self.txn_stats = TxnAggregates()                # today's totals per region/merchant/device/hour
+        # Listings: (kind, field) -> value counts, and materialized (kind, sort, filters) -> SortedIndex
+        self.field_counts = defaultdict(Counter)
+        self._listings = {}
+
+        for did, d in devices.items():
+            self._index_device(did, d)
+            self._track("device", did, None, d)
+        for mid, m in merchants.items():
+            self.merchant_status_counts[m["status"]] += 1
+            self.merchant_devices_total += m["devices"]
+            self._track("merchant", mid, None, m)
+        for aid, a in self.alerts.items():
+            self._track("alert", aid, None, a)
+        for region, data in transactions.items():
+            self.txn_count += data["count"]
+            self.txn_volume += data["volume"]
+            self.txn_stats.seed(region, data["count"], data["volume"] * 100)
+
+    # ── Subscriptions ──
+
+    def subscribe(self, listener):
+        """`listener(kind, key, record)` is called after every change; kind is device/merchant/alert/transactions/last_txn/telemetry.
+
+        last_txn batches device timestamps: key is None and record is {did: "YYYY-MM-DD HH:MM"}.
+        telemetry batches device reports (each one a heartbeat): key is None and record is {did: changes}.
+        """
+        self._listeners.append(listener)
+
+    def _changed(self, kind, key, record):
+        self.version += 1
+        for listener in self._listeners:
+            listener(kind, key, record)
+
+    def _log(self, op, *args):
+        """Hand a completed public mutation to the other workers (multi-worker mode only)."""
+        if self.replica is not None:
+            self.replica.log(op, args)
+
+    # ── Index maintenance ──
+
+    def _index_device(self, did, d):
+        self.by_status[d["status"]].add(did)
+        self.by_region[d["region"]].add(did)
+        self.by_merchant[d["merchant_id"]].add(did)
+        self.status_counts[d["status"]] += 1
+
+    def _unindex_device(self, did, d):
+        self.by_status[d["status"]].discard(did)
+        self.by_region[d["region"]].discard(did)
+        self.by_merchant[d["merchant_id"]].discard(did)
+        self.status_counts[d["status"]] -= 1
+
+    def _track(self, kind, key, old, new):
+        """Keep filter value counts and materialized listings in step with one entity change."""
+        for field in FILTER_FIELDS[kind]:
+            if old is not None:
+                self.field_counts[kind, field][old[field]] -= 1
+            if new is not None:
+                self.field_counts[kind, field][new[field]] += 1
+        for (k, sort, filters), index in list(self._listings.items()):
+            if k != kind:
+                continue
+            sort_key = SORT_KEYS[kind][sort]
+            if old is not None and _matches(old, filters):
+                index.remove(sort_key(key, old))
+            if new is not None and _matches(new, filters):
+                index.add(sort_key(key, new))
+
+    # ── Mutations ──
+
+    def _next_id(self, kind, prefix):
+        """Allocate the next id of `kind` (caller holds the lock; unique across workers with a replica)."""
+        floor = self.seq[kind]
+        self.seq[kind] = self.replica.next_id(kind, floor) if self.replica is not None else floor + 1
+        return f"{prefix}-{self.seq[kind]:03d}"
+
+    def _replayed_id(self, kind, key):
+        number = key[4:]
+        if number.isdigit():
+            self.seq[kind] = max(self.seq[kind], int(number))
+
+    def _replace_device(self, did, old, changes):
+        d = self.devices[did] = dict(old, **changes)
+        self._unindex_device(did, old)
+        self._index_device(did, d)
+        self._track("device", did, old, d)
+        self._changed("device", did, d)
+        return d
+
+    @_writer
+    def add_device(self, did, record) -> bool:
+        """Insert a new device; False if the id is taken. Bumps the owning merchant's device count."""
+        if did in self.devices:
+            return False
+        if self.replica is not None and not self.replica.claim("device", did):
+            return False                                # just taken by another worker
+        self.devices[did] = record
+        self._index_device(did, record)
+        self._track("device", did, None, record)
+        self._changed("device", did, record)
+        mid = record["merchant_id"]
+        old = self.merchants.get(mid)
+        if old is not None:
+            merchant = self.merchants[mid] = dict(old, devices=old["devices"] + 1)
+            self.merchant_devices_total += 1
+            self._track("merchant", mid, old, merchant)
+            self._changed("merchant", mid, merchant)
+        self._log("add_device", did, record)
+        return True
+
+    @_writer
+    def add_merchant(self, record, mid=None) -> str:
+        """Insert a new merchant and return its allocated id (`mid` is given when replaying)."""
+        if mid is None:
+            mid = self._next_id("merchant", "MER")
+        elif mid in self.merchants:
+            return mid
+        else:
+            self._replayed_id("merchant", mid)
+        self.merchants[mid] = record
+        self.merchant_status_counts[record["status"]] += 1
+        self.merchant_devices_total += record["devices"]
+        self._track("merchant", mid, None, record)
+        self._changed("merchant", mid, record)
+        self._log("add_merchant", record, mid)
+        return mid
+
+    @_writer
+    def deactivate(self, did) -> bool:
+        d = self.devices.get(did)
+        if d is None:
+            return False
+        self._replace_device(did, d, {"status": "Offline", "battery": 0})
+        self._log("deactivate", did)
+        return True
+
+    @_writer
+    def record_telemetry(self, updates):
+        """Apply device reports [(did, {"battery": int, "status": str})]; an empty report is just a heartbeat."""
+        seen, logged = {}, []
+        now = time.monotonic() if self.replica is not None else 0.0
+        for did, changes in updates:
+            d = self.devices.get(did)
+            if d is None:
+                continue
+            seen[did] = changes
+            if any(d[field] != value for field, value in changes.items()):
+                self._replace_device(did, d, changes)
+                logged.append((did, changes))
+            elif now and now - self._heartbeats.get(did, -HEARTBEAT_LOG_INTERVAL) >= HEARTBEAT_LOG_INTERVAL:
+                self._heartbeats[did] = now
+                logged.append((did, changes))
+        if seen:
+            self._changed("telemetry", None, seen)
+        if logged:
+            self._log("record_telemetry", logged)
+
+    @_writer
+    def add_alert(self, record, aid=None) -> str:
+        """Raise an alert and return its id (`aid` is given when replaying)."""
+        if aid is None:
+            aid = self._next_id("alert", "ALT")
+        elif aid in self.alerts:
+            return aid
+        else:
+            self._replayed_id("alert", aid)
+        record = dict(record, id=aid)
+        self.alerts[aid] = record
+        self._track("alert", aid, None, record)
+        self._changed("alert", aid, record)
+        self._log("add_alert", record, aid)
+        return aid
+
+    @_writer
+    def ack_alert(self, aid) -> bool:
+        alert = self.alerts.pop(aid, None)
+        if alert is None:
+            return False
+        self._track("alert", aid, alert, None)
+        self._changed("alert", aid, None)
+        self._log("ack_alert", aid)
+        return True
+
+    @_writer
+    def record_transactions(self, events):
+        """Fold ingested transactions [(did, mid, region, "YYYY-MM-DD HH:MM:SS", paise)] into today's totals."""
+        stats = self.txn_stats
+        touched, rolled = stats.add_many(events)
+        if rolled:                                      # a new day zeroed every region, not just these
+            touched.update(self.transactions)
+        for region in touched:
+            count, paise = stats.region(region)
+            data = self.transactions[region] = {"count": count, "volume": paise // 100,
+                                                "avg": paise // 100 // count if count else 0}
+            self._changed("transactions", region, data)
+        self.txn_count, self.txn_volume = stats.count, stats.volume // 100
+        stamps = {}
+        devices = self.devices
+        for did, _, _, ts, _ in events:
+            d = devices.get(did)
+            if d is not None:
+                last = stamps.get(did) or d["last_txn"]
+                if ts[:16] > last or last == "—":
+                    stamps[did] = ts[:16]
+        for did, stamp in stamps.items():
+            devices[did] = dict(devices[did], last_txn=stamp)  # not indexed or listed: no _track needed
+        if self.history is not None:
+            self.history.append(events)
+        if stamps:
+            self._changed("last_txn", None, stamps)
+        self._log("record_transactions", events)
+
+    # ── Queries ──
+
+    def page(self, kind, filters=None, sort="id", after=None, limit=20):
+        """One listing page → (ids, cursor of the last row or None at the end, total matching).
+
+        `filters` maps FILTER_FIELDS to exact values; `after` is a cursor from a previous page.
+        """
+        filters = tuple(sorted((filters or {}).items()))
+        if sort not in SORT_KEYS[kind] or any(f not in FILTER_FIELDS[kind] for f, _ in filters):
+            raise ValueError(f"bad {kind} listing: sort={sort} filters={filters}")
+        # Unknown filter values match nothing — don't build an index for them
+        if any(self.field_counts[kind, f][v] <= 0 for f, v in filters):
+            return [], None, 0
+        index = self._listings.get((kind, sort, filters))
+        if index is None:
+            with self.lock:                             # built and registered before any further change
+                index = self._listings.get((kind, sort, filters))
+                if index is None:
+                    records = {"device": self.devices, "merchant": self.merchants, "alert": self.alerts}[kind]
+                    sort_key = SORT_KEYS[kind][sort]
+                    index = SortedIndex(sort_key(key, r) for key, r in records.items() if _matches(r, filters))
+                    self._listings[kind, sort, filters] = index
+        keys = index.page(after, limit + 1)
+        cursor = keys[limit - 1] if len(keys) > limit else None
+        return [key[-1] for key in keys[:limit]], cursor, len(index)
+
+
+def _matches(record, filters):
+    return all(record[field] == value for field, value in filters)